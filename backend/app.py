@@ -1,12 +1,33 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Request, request, current_app, g, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime
-import os, json, logging, traceback
+import os, io, math, time, zipfile, logging, traceback, atexit
 # Local module imports
+import metrics
 from calculator import Calculator
+from eval_sandbox import SandboxedEvaluator
 from tts_engine import TTSEngine
+from tts_jobs import TTSJobQueue, DONE, FAILED
 from stt_engine import STTEngine
 from history_db import HistoryDB
+from history_export import EXPORT_FORMATS, stream_export
+from audio_store import AudioStore, build_audio_response
+from voice_stream import VoiceStreamManager
+
+# Request handling
+class InMemoryUploadRequest(Request):
+    """Keeps uploaded files in memory (bounded by MAX_CONTENT_LENGTH) instead of spooling to disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+    @property
+    def max_content_length(self):
+        # Batches are bigger than single uploads (the URL is matched before the body is parsed)
+        if self.endpoint == 'voice_to_text_batch':
+            return current_app.config['STT_BATCH_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
 
 app = Flask(
     __name__,
@@ -14,6 +35,7 @@ app = Flask(
     static_folder='../frontend',
     static_url_path=''
 )
+app.request_class = InMemoryUploadRequest
 CORS(app)
 
 # Configuration
@@ -21,14 +43,117 @@ app.config.update(
     SECRET_KEY=os.environ.get('SECRET_KEY', 'your-secret-key-here'),
     UPLOAD_FOLDER='static/voice',
     MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16MB
+    TTS_CACHE_MAX_BYTES=int(os.environ.get('TTS_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    TTS_WAIT_SECONDS=10.0,
+    TTS_MAX_WAIT_SECONDS=30.0,
+    MAX_BATCH_SIZE=10000,
+    MAX_TABLE_POINTS=1000000,
+    EVAL_WORKERS=int(os.environ.get('EVAL_WORKERS', 2)),
+    EVAL_TIMEOUT=float(os.environ.get('EVAL_TIMEOUT', 2.0)),
+    EVAL_MEMORY_LIMIT_MB=int(os.environ.get('EVAL_MEMORY_LIMIT_MB', 256)),
+    EVAL_MAX_TASKS_PER_WORKER=int(os.environ.get('EVAL_MAX_TASKS_PER_WORKER', 1000)),
+    EVAL_QUEUE_TIMEOUT=float(os.environ.get('EVAL_QUEUE_TIMEOUT', 10.0)),
+    EVAL_BATCH_TIMEOUT=float(os.environ.get('EVAL_BATCH_TIMEOUT', 10.0)),
+    HISTORY_WRITE_BEHIND=os.environ.get('HISTORY_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes'),
+    HISTORY_BATCH_SIZE=int(os.environ.get('HISTORY_BATCH_SIZE', 500)),
+    HISTORY_FLUSH_INTERVAL_MS=int(os.environ.get('HISTORY_FLUSH_INTERVAL_MS', 50)),
+    HISTORY_ARCHIVE_AFTER_DAYS=float(os.environ.get('HISTORY_ARCHIVE_AFTER_DAYS', 180)),  # 0 disables archival
+    HISTORY_ARCHIVE_INTERVAL_SECONDS=float(os.environ.get('HISTORY_ARCHIVE_INTERVAL_SECONDS', 3600)),
+    STT_BACKEND=os.environ.get('STT_BACKEND', 'auto'),
+    STT_FIXTURES=os.environ.get('STT_FIXTURES'),
+    STT_TIMEOUT=float(os.environ.get('STT_TIMEOUT', 10.0)),
+    STT_CONCURRENCY=int(os.environ.get('STT_CONCURRENCY', 4)),
+    STT_BATCH_MAX_CLIPS=int(os.environ.get('STT_BATCH_MAX_CLIPS', 500)),
+    STT_BATCH_WORKERS=int(os.environ.get('STT_BATCH_WORKERS', 4)),
+    STT_BATCH_MAX_CONTENT_LENGTH=int(os.environ.get('STT_BATCH_MAX_CONTENT_LENGTH', 128 * 1024 * 1024)),
+    VOICE_STREAM_MAX_SESSIONS=int(os.environ.get('VOICE_STREAM_MAX_SESSIONS', 100)),
+    VOICE_STREAM_IDLE_TIMEOUT=float(os.environ.get('VOICE_STREAM_IDLE_TIMEOUT', 60.0)),
+    VOICE_STREAM_FINISH_TIMEOUT=float(os.environ.get('VOICE_STREAM_FINISH_TIMEOUT', 30.0)),
+    # Set by gunicorn.conf.py; open streams live in one process, so the multi-request form needs 1
+    SERVER_WORKERS=int(os.environ.get('SERVER_WORKERS', 1)),
+    # Set by gunicorn.conf.py under several workers, so /metrics reports all of them
+    METRICS_DIR=os.environ.get('METRICS_DIR'),
+    AUDIO_MEMORY_CACHE_BYTES=int(os.environ.get('AUDIO_MEMORY_CACHE_BYTES', 64 * 1024 * 1024)),
+    AUDIO_MAX_CLIP_BYTES=int(os.environ.get('AUDIO_MAX_CLIP_BYTES', 4 * 1024 * 1024)),
     ALLOWED_AUDIO_EXTENSIONS={'wav', 'mp3', 'm4a', 'flac'}
 )
 
 # Component Initialization
 calculator = Calculator()
-tts_engine = TTSEngine()
-stt_engine = STTEngine()
-history_db = HistoryDB()
+evaluator = SandboxedEvaluator(
+    calculator,
+    workers=app.config['EVAL_WORKERS'],
+    timeout=app.config['EVAL_TIMEOUT'],
+    memory_limit_mb=app.config['EVAL_MEMORY_LIMIT_MB'],
+    max_tasks_per_worker=app.config['EVAL_MAX_TASKS_PER_WORKER'],
+    queue_timeout=app.config['EVAL_QUEUE_TIMEOUT'],
+    batch_timeout=app.config['EVAL_BATCH_TIMEOUT']
+)
+# Fork the sandbox now, before the components below start their threads
+evaluator.start()
+atexit.register(evaluator.shutdown)
+tts_engine = TTSEngine(app.config['UPLOAD_FOLDER'], cache_max_bytes=app.config['TTS_CACHE_MAX_BYTES'])
+tts_jobs = TTSJobQueue(tts_engine)
+if tts_engine.is_available():
+    # Renders the number segments in the background before the first request
+    tts_jobs.start()
+stt_engine = STTEngine(
+    backends=app.config['STT_BACKEND'],
+    fixtures_path=app.config['STT_FIXTURES'],
+    timeout=app.config['STT_TIMEOUT'],
+    # Batch workers beyond the per-backend pool size would only queue
+    concurrency=max(app.config['STT_CONCURRENCY'], app.config['STT_BATCH_WORKERS'])
+)
+
+def recognize_phrase(pcm, language):
+    text = stt_engine.transcribe_pcm(pcm, language=language)
+    return {'transcribed_text': text, 'expression': calculator.parse_voice_input(text)}
+
+voice_streams = VoiceStreamManager(
+    recognize_phrase,
+    max_sessions=app.config['VOICE_STREAM_MAX_SESSIONS'],
+    idle_timeout=app.config['VOICE_STREAM_IDLE_TIMEOUT']
+)
+audio_store = AudioStore(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=app.config['AUDIO_MEMORY_CACHE_BYTES'],
+    max_clip_bytes=app.config['AUDIO_MAX_CLIP_BYTES']
+)
+history_db = HistoryDB(
+    write_behind=app.config['HISTORY_WRITE_BEHIND'],
+    batch_size=app.config['HISTORY_BATCH_SIZE'],
+    flush_interval_ms=app.config['HISTORY_FLUSH_INTERVAL_MS'],
+    archive_after_days=app.config['HISTORY_ARCHIVE_AFTER_DAYS'] or None,
+    archive_interval=app.config['HISTORY_ARCHIVE_INTERVAL_SECONDS']
+)
+atexit.register(history_db.close)
+
+# Metrics read from the components at scrape time
+def cache_events():
+    samples = {}
+    for cache, stats in (('expression', evaluator.get_cache_stats()),
+                         ('tts', tts_engine.get_cache_stats()),
+                         ('audio', audio_store.stats()),
+                         ('history_clients', history_db.get_cache_stats())):
+        for event in ('hits', 'misses', 'evictions'):
+            samples[(cache, event)] = stats[event]
+    return samples
+
+def queue_depths():
+    return {
+        ('tts_jobs',): tts_jobs.depth,
+        ('history_writes',): history_db.pending_writes,
+        ('voice_streams',): voice_streams.active
+    }
+
+metrics.registry.register(metrics.CallbackMetric(
+    'cache_events_total', 'Cache hits, misses and evictions', 'counter', cache_events, ('cache', 'event')
+))
+metrics.registry.register(metrics.CallbackMetric(
+    'queue_depth', 'Items waiting in each background queue', 'gauge', queue_depths, ('queue',)
+))
+if app.config['METRICS_DIR']:
+    metrics.registry.share(app.config['METRICS_DIR'])
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -36,12 +161,52 @@ logger = logging.getLogger(__name__)
 
 # Directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs('history', exist_ok=True)
 
 # Helpers
+def read_audio_archive(archive, max_clips, max_bytes):
+    """Return (name, data) for each audio member of a zip archive, in archive order"""
+    clips, total = [], 0
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not allowed_audio_file(info.filename):
+                continue
+            total += info.file_size
+            if len(clips) >= max_clips or total > max_bytes:
+                raise ValueError(f"Archive exceeds {max_clips} clips or {max_bytes} bytes of audio")
+            clips.append((info.filename, zf.read(info)))
+    return clips
+
+def voice_stream_result(session):
+    """Wait for a closed stream's phrases and join them into one transcript"""
+    results = session.finish(timeout=app.config['VOICE_STREAM_FINISH_TIMEOUT'])
+    text = ' '.join(r['transcribed_text'] for r in results if r.get('transcribed_text'))
+    return {
+        'results': results,
+        'transcribed_text': text or None,
+        'expression': calculator.parse_voice_input(text),
+        'timestamp': datetime.now().isoformat()
+    }
+
 def allowed_audio_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_AUDIO_EXTENSIONS']
 
+# Request timing
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by route pattern, not path, to keep the label set bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=route, method=request.method, status=response.status_code
+        )
+    return response
+
 # Routes
 @app.route('/')
 def index():
@@ -55,30 +220,108 @@ def calculate():
         if not expression:
             return jsonify({'error': 'Expression is required'}), 400
 
-        result = calculator.evaluate(expression)
+        result, eval_seconds = evaluator.evaluate_timed(expression)
         history_id = history_db.add_calculation(
             expression, result,
             session_id=request.headers.get('X-Session-ID'),
             user_agent=request.headers.get('User-Agent'),
-            ip_address=request.remote_addr
+            ip_address=request.remote_addr,
+            execution_time=eval_seconds
         )
 
-        audio_filename = None
-        if data.get('generate_audio'):
-            audio_text = f"The result is {result}"
-            audio_filename = tts_engine.generate_speech(audio_text, f"result_{history_id}")
+        # Audio is rendered off-request; clients poll the job until it is done
+        audio_job = None
+        if data.get('generate_audio') and tts_engine.is_available():
+            audio_job = tts_jobs.submit(f"The result is {result}").to_dict()
 
         return jsonify({
             'result': result,
             'expression': expression,
-            'audio_url': f'/api/audio/{audio_filename}' if audio_filename else None,
+            'audio_url': audio_job['audio_url'] if audio_job else None,
+            'audio_job': audio_job,
             'history_id': history_id,
             'timestamp': datetime.now().isoformat()
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in calculate: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/calculate/batch', methods=['POST'])
+def calculate_batch():
+    try:
+        data = request.get_json() or {}
+        expressions = data.get('expressions')
+        if not isinstance(expressions, list) or not expressions:
+            return jsonify({'error': 'A non-empty list of expressions is required'}), 400
+        if len(expressions) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({'error': f"At most {app.config['MAX_BATCH_SIZE']} expressions per batch"}), 400
+
+        expressions = [str(expression).strip() for expression in expressions]
+        evaluated = evaluator.evaluate_batch(expressions)
+
+        session_id = request.headers.get('X-Session-ID')
+        user_agent = request.headers.get('User-Agent')
+        records, items = [], []
+        for expression, (result, error) in zip(expressions, evaluated):
+            if not expression:
+                error = 'Expression is required'
+            if error:
+                items.append({'expression': expression, 'error': error})
+                continue
+            records.append({
+                'expression': expression,
+                'result': result,
+                'session_id': session_id,
+                'user_agent': user_agent,
+                'ip_address': request.remote_addr
+            })
+            items.append({'expression': expression, 'result': result})
+
+        history_ids = iter(history_db.add_calculations(records))
+        for item in items:
+            if 'result' in item:
+                item['history_id'] = next(history_ids)
+
+        return jsonify({
+            'results': items,
+            'succeeded': len(records),
+            'failed': len(items) - len(records),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error in calculate batch: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/calculate/table', methods=['POST'])
+def calculate_table():
+    try:
+        data = request.get_json() or {}
+        expression = str(data.get('expression', '')).strip()
+        variables = data.get('variables') or {}
+        if not expression:
+            return jsonify({'error': 'Expression is required'}), 400
+        if not isinstance(variables, dict):
+            return jsonify({'error': 'Variables must be an object of name to values'}), 400
+
+        points = max([len(v) for v in variables.values() if isinstance(v, list)], default=1)
+        if points > app.config['MAX_TABLE_POINTS']:
+            return jsonify({'error': f"At most {app.config['MAX_TABLE_POINTS']} points per table"}), 400
+
+        values, errors = evaluator.evaluate_vectorized(expression, variables)
+        return jsonify({
+            'expression': expression,
+            'values': values,
+            'errors': errors,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in calculate table: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/voice-to-text', methods=['POST'])
 def voice_to_text():
     try:
@@ -86,50 +329,211 @@ def voice_to_text():
         if not audio or not allowed_audio_file(audio.filename):
             return jsonify({'error': 'Invalid or missing audio file'}), 400
 
-        filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        audio.save(path)
+        text = stt_engine.transcribe_audio_data(audio.read(), file_extension=os.path.splitext(audio.filename)[1])
+        expression = calculator.parse_voice_input(text)
+        return jsonify({
+            'transcribed_text': text,
+            'expression': expression,
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Voice to text error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to process audio'}), 500
 
-        try:
-            text = stt_engine.transcribe_audio(path)
-            expression = calculator.parse_voice_input(text)
-            return jsonify({
+@app.route('/api/voice-to-text/batch', methods=['POST'])
+def voice_to_text_batch():
+    try:
+        max_clips = app.config['STT_BATCH_MAX_CLIPS']
+
+        if 'archive' in request.files:
+            clips = read_audio_archive(
+                request.files['archive'].stream, max_clips, app.config['STT_BATCH_MAX_CONTENT_LENGTH']
+            )
+        else:
+            uploads = request.files.getlist('audio')
+            if any(not allowed_audio_file(audio.filename) for audio in uploads):
+                return jsonify({'error': 'Invalid audio file format'}), 400
+            if len(uploads) > max_clips:
+                return jsonify({'error': f"At most {max_clips} clips per batch"}), 400
+            clips = [(audio.filename, audio.read()) for audio in uploads]
+
+        if not clips:
+            return jsonify({'error': 'No audio files provided'}), 400
+
+        language = request.form.get('language', 'en-US')
+        texts = stt_engine.transcribe_many(
+            [(data, os.path.splitext(name)[1]) for name, data in clips],
+            language=language,
+            workers=app.config['STT_BATCH_WORKERS']
+        )
+        return jsonify({
+            'results': [{
+                'filename': name,
                 'transcribed_text': text,
-                'expression': expression,
-                'timestamp': datetime.now().isoformat()
-            })
+                'expression': calculator.parse_voice_input(text),
+                'error': None if text else 'Could not transcribe audio'
+            } for (name, _), text in zip(clips, texts)],
+            'count': len(clips),
+            'timestamp': datetime.now().isoformat()
+        })
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Request body too large'}), 413
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch voice to text error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to process audio batch'}), 500
+
+@app.route('/api/voice-to-text/stream/upload', methods=['POST'])
+def upload_voice_stream():
+    # One-request stream: the raw PCM body (chunked is fine) is fed in as it arrives,
+    # so the stream stays on one worker. The format goes in the query string.
+    try:
+        if not stt_engine.is_available():
+            return jsonify({'error': 'Speech recognition not available'}), 503
+
+        session = voice_streams.open(
+            sample_rate=int(request.args.get('sample_rate', 16000)),
+            channels=int(request.args.get('channels', 1)),
+            sample_width=int(request.args.get('sample_width', 2)),
+            language=request.args.get('language', 'en-US')
+        )
+        try:
+            while True:
+                chunk = request.stream.read(64 * 1024)
+                if not chunk:
+                    break
+                session.feed(chunk)
         finally:
-            os.remove(path)
+            voice_streams.close(session.id)
+        return jsonify(voice_stream_result(session))
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Request body too large'}), 413
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        logger.error(f"Voice to text error: {str(e)}\n{traceback.format_exc()}")
-        return jsonify({'error': 'Failed to process audio'}), 500
+        logger.error(f"Voice stream upload error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to process voice stream'}), 500
+
+@app.route('/api/voice-to-text/stream', methods=['POST'])
+def open_voice_stream():
+    try:
+        if not stt_engine.is_available():
+            return jsonify({'error': 'Speech recognition not available'}), 503
+        if app.config['SERVER_WORKERS'] > 1:
+            # The chunks of a multi-request stream could reach any worker
+            return jsonify({
+                'error': 'Multi-request voice streams need a single server worker; '
+                         'POST the audio to /api/voice-to-text/stream/upload instead'
+            }), 409
+
+        data = request.get_json(silent=True) or {}
+        session = voice_streams.open(
+            sample_rate=int(data.get('sample_rate', 16000)),
+            channels=int(data.get('channels', 1)),
+            sample_width=int(data.get('sample_width', 2)),
+            language=data.get('language', 'en-US')
+        )
+        return jsonify({'stream_id': session.id}), 201
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Open voice stream error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to open voice stream'}), 500
+
+@app.route('/api/voice-to-text/stream/<stream_id>', methods=['POST'])
+def feed_voice_stream(stream_id):
+    try:
+        session = voice_streams.get(stream_id)
+        if session is None:
+            return jsonify({'error': 'Unknown or expired stream'}), 404
+
+        # Raw PCM in the format given when the stream was opened
+        session.feed(request.get_data(cache=False))
+        return jsonify({'results': session.new_results(), 'pending': session.pending})
+    except Exception as e:
+        logger.error(f"Voice stream chunk error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to process audio chunk'}), 500
+
+@app.route('/api/voice-to-text/stream/<stream_id>/end', methods=['POST'])
+def close_voice_stream(stream_id):
+    try:
+        session = voice_streams.close(stream_id)
+        if session is None:
+            return jsonify({'error': 'Unknown or expired stream'}), 404
+
+        return jsonify(voice_stream_result(session))
+    except Exception as e:
+        logger.error(f"Close voice stream error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to finish voice stream'}), 500
 
 @app.route('/api/text-to-speech', methods=['POST'])
 def text_to_speech():
     try:
-        text = request.get_json().get('text', '').strip()
+        data = request.get_json() or {}
+        text = data.get('text', '').strip()
         if not text:
             return jsonify({'error': 'Text is required'}), 400
+        try:
+            wait = float(data.get('wait', app.config['TTS_WAIT_SECONDS']))
+        except (TypeError, ValueError):
+            wait = math.nan
+        if not math.isfinite(wait):
+            return jsonify({'error': 'wait must be a number of seconds'}), 400
+        if not tts_engine.is_available():
+            return jsonify({'error': 'TTS failed'}), 500
 
-        filename = f"tts_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        audio_filename = tts_engine.generate_speech(text, filename)
+        # Wait briefly so short phrases still answer in one round trip
+        job = tts_jobs.submit(text)
+        job.wait(min(wait, app.config['TTS_MAX_WAIT_SECONDS']))
+
+        if job.status == FAILED:
+            return jsonify({'error': 'TTS failed'}), 500
+        if job.status != DONE:
+            return jsonify(job.to_dict()), 202
 
         return jsonify({
-            'audio_url': f'/api/audio/{audio_filename}',
-            'filename': audio_filename
-        }) if audio_filename else jsonify({'error': 'TTS failed'}), 500
+            **job.to_dict(),
+            'filename': job.filename
+        })
     except Exception as e:
         logger.error(f"Text to speech error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Failed to generate speech'}), 500
 
+@app.route('/api/tts/jobs/<job_id>')
+def tts_job_status(job_id):
+    try:
+        job = tts_jobs.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        # Long-poll: ?wait=N blocks up to N seconds for the job to finish
+        wait = min(request.args.get('wait', 0, type=float), app.config['TTS_MAX_WAIT_SECONDS'])
+        if wait > 0:
+            job.wait(wait)
+
+        return jsonify(job.to_dict())
+    except Exception as e:
+        logger.error(f"TTS job status error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to get job status'}), 500
+
 @app.route('/api/audio/<filename>')
 def serve_audio(filename):
     try:
         if not allowed_audio_file(filename):
             return jsonify({'error': 'Invalid file format'}), 400
 
-        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        return send_file(path, mimetype='audio/mpeg') if os.path.exists(path) else jsonify({'error': 'File not found'}), 404
+        clip = audio_store.get(filename)
+        if clip is None:
+            return jsonify({'error': 'File not found'}), 404
+
+        status, headers, body = build_audio_response(clip, request.headers)
+        mimetype = headers.pop('Content-Type')
+        return Response(body, status=status, mimetype=mimetype, headers=headers)
     except Exception as e:
         logger.error(f"Serve audio error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Failed to serve audio'}), 500
@@ -137,28 +541,51 @@ def serve_audio(filename):
 @app.route('/api/history', methods=['GET'])
 def get_history():
     try:
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 50, type=int)
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
         session_id = request.headers.get('X-Session-ID')
 
-        history = history_db.get_history(page=page, limit=limit, session_id=session_id)
-        total = history_db.get_history_count(session_id=session_id)
-
-        return jsonify({
-            'history': history,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'has_more': (page * limit) < total
-        })
+        page = history_db.get_history_page(
+            limit=limit, cursor=cursor, session_id=session_id, include_total=include_total
+        )
+        page['limit'] = limit
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Get history error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Failed to retrieve history'}), 500
 
+@app.route('/api/history/search', methods=['GET'])
+def search_history():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query (q) is required'}), 400
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+
+        page = history_db.search_history(
+            query,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            session_id=request.headers.get('X-Session-ID')
+        )
+        page['query'] = query
+        page['limit'] = limit
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Search history error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to search history'}), 500
+
 @app.route('/api/history/<int:history_id>', methods=['DELETE'])
 def delete_history_item(history_id):
     try:
-        return jsonify({'message': 'Deleted'}) if history_db.delete_calculation(history_id) else jsonify({'error': 'Not found'}), 404
+        if history_db.delete_calculation(history_id):
+            return jsonify({'message': 'Deleted'})
+        return jsonify({'error': 'Not found'}), 404
     except Exception as e:
         logger.error(f"Delete history error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Failed to delete item'}), 500
@@ -177,18 +604,43 @@ def clear_history():
 def export_history():
     try:
         session_id = request.headers.get('X-Session-ID')
-        data = history_db.get_all_history(session_id=session_id)
-        filename = f"calculator_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        path = os.path.join('history', filename)
+        export_format = request.args.get('format', 'json').lower()
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"Format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
 
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        filename = f"calculator_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        if compress:
+            mimetype, filename = 'application/gzip', f"{filename}.gz"
+        headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
 
-        return send_file(path, as_attachment=True, download_name=filename)
+        def generate():
+            try:
+                rows = history_db.iter_history(session_id=session_id)
+                yield from stream_export(rows, export_format, gzip=compress)
+            except Exception as e:
+                # Headers are already sent; all we can do is log and cut the stream
+                logger.error(f"Export history stream error: {str(e)}\n{traceback.format_exc()}")
+                raise
+
+        return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
     except Exception as e:
         logger.error(f"Export history error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Failed to export history'}), 500
 
+@app.route('/api/stats')
+def get_stats():
+    try:
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+
+        stats = history_db.get_statistics()
+        stats['daily'] = history_db.get_daily_statistics(days)
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Get stats error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Failed to retrieve statistics'}), 500
+
 @app.route('/api/health')
 def health_check():
     return jsonify({
@@ -199,9 +651,14 @@ def health_check():
             'tts': tts_engine.is_available(),
             'stt': stt_engine.is_available(),
             'database': history_db.is_connected()
-        }
+        },
+        'stt_backends': stt_engine.get_backend_status()
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({'error': 'Endpoint not found'}), 404
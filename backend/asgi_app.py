@@ -0,0 +1,733 @@
+# Async (ASGI) serving mode: the routes of app.py as Starlette coroutines sharing
+# its components. Blocking work runs on a bounded thread pool; waits on TTS jobs
+# do not hold a thread.
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#   GUNICORN_ASGI=1 gunicorn -c gunicorn.conf.py asgi_app:app
+import os
+import json
+import asyncio
+import logging
+import math
+import queue
+import threading
+import time
+import traceback
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import metrics
+
+# Shared components (and their configuration) come from the WSGI app
+from app import (
+    app as flask_app, calculator, evaluator, tts_engine, tts_jobs, stt_engine, history_db,
+    audio_store, voice_streams, allowed_audio_file, read_audio_archive, voice_stream_result
+)
+from tts_jobs import DONE, FAILED
+from history_export import EXPORT_FORMATS, stream_export
+from audio_store import build_audio_response
+
+logger = logging.getLogger(__name__)
+
+config = flask_app.config
+config.setdefault('ASGI_BLOCKING_WORKERS', int(os.environ.get('ASGI_BLOCKING_WORKERS', 64)))
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
+
+# Threads that blocking calls (SQLite, sandbox IPC, recognition) run on
+blocking_executor = ThreadPoolExecutor(
+    max_workers=config['ASGI_BLOCKING_WORKERS'], thread_name_prefix='asgi-blocking'
+)
+
+
+class RequestRejected(Exception):
+    """The request body cannot be accepted (too large, or of unknown length)"""
+    
+    def __init__(self, message: str = 'Request body too large', status: int = 413):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the shared executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+
+async def wait_for_job(job, timeout: float):
+    """Wait up to timeout seconds for a TTS job without tying up a thread"""
+    if timeout <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+    
+    def on_done(_job):
+        loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+    
+    job.add_done_callback(on_done)
+    try:
+        await asyncio.wait_for(finished, timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def iterate_in_thread(make_iterator, buffer_size: int = 8):
+    """
+    Drive a blocking iterator on one dedicated thread and yield its items
+    
+    Export streams hold a SQLite cursor, which must stay on the thread that
+    opened it, so the whole iteration happens on a single thread.
+    """
+    loop = asyncio.get_running_loop()
+    items = queue.Queue(maxsize=buffer_size)
+    finished = object()
+    cancelled = threading.Event()
+    
+    def deliver(item) -> bool:
+        """Queue item unless the consumer goes away first"""
+        while not cancelled.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        outcome = finished
+        try:
+            for item in make_iterator():
+                if not deliver(item):
+                    break
+        except BaseException as e:
+            outcome = e
+        finally:
+            if not deliver(outcome):
+                # An executor thread may still be waiting in items.get; a
+                # full queue means none is
+                try:
+                    items.put_nowait(finished)
+                except queue.Full:
+                    pass
+    
+    threading.Thread(target=produce, name='asgi-stream', daemon=True).start()
+    try:
+        while True:
+            item = await loop.run_in_executor(blocking_executor, items.get)
+            if item is finished:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """Read the request body, refusing anything over limit bytes"""
+    declared = request.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise RequestRejected()
+    
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise RequestRejected()
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def read_json(request: Request, limit: int = None) -> dict:
+    """Parse a JSON object body; anything else reads as {}"""
+    body = await read_body(request, limit or config['MAX_CONTENT_LENGTH'])
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def read_form(request: Request, limit: int = None):
+    """Parse a multipart form, refusing bodies over limit bytes"""
+    limit = limit or config['MAX_CONTENT_LENGTH']
+    declared = request.headers.get('content-length')
+    if not declared or not declared.isdigit():
+        # Multipart needs a known size so the limit can be enforced up front
+        raise RequestRejected('Content-Length required', 411)
+    if int(declared) > limit:
+        raise RequestRejected()
+    return await request.form(max_files=config['STT_BATCH_MAX_CLIPS'] + 1, max_part_size=limit)
+
+
+def query_number(request: Request, name: str, default, cast=int):
+    try:
+        return cast(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_true(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def client_ip(request: Request):
+    return request.client.host if request.client else None
+
+
+# Routes
+async def calculate(request: Request):
+    data = await read_json(request)
+    try:
+        expression = str(data.get('expression', '')).strip()
+        if not expression:
+            return error('Expression is required', 400)
+        
+        result, eval_seconds = await run_blocking(evaluator.evaluate_timed, expression)
+        history_id = await run_blocking(
+            history_db.add_calculation, expression, result,
+            session_id=request.headers.get('X-Session-ID'),
+            user_agent=request.headers.get('User-Agent'),
+            ip_address=client_ip(request),
+            execution_time=eval_seconds
+        )
+        
+        audio_job = None
+        if data.get('generate_audio') and tts_engine.is_available():
+            audio_job = (await run_blocking(tts_jobs.submit, f"The result is {result}")).to_dict()
+        
+        return JSONResponse({
+            'result': result,
+            'expression': expression,
+            'audio_url': audio_job['audio_url'] if audio_job else None,
+            'audio_job': audio_job,
+            'history_id': history_id,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logger.error(f"Error in calculate: {str(e)}\n{traceback.format_exc()}")
+        return error('Internal server error', 500)
+
+
+async def calculate_batch(request: Request):
+    data = await read_json(request)
+    try:
+        expressions = data.get('expressions')
+        if not isinstance(expressions, list) or not expressions:
+            return error('A non-empty list of expressions is required', 400)
+        if len(expressions) > config['MAX_BATCH_SIZE']:
+            return error(f"At most {config['MAX_BATCH_SIZE']} expressions per batch", 400)
+        
+        expressions = [str(expression).strip() for expression in expressions]
+        evaluated = await run_blocking(evaluator.evaluate_batch, expressions)
+        
+        session_id = request.headers.get('X-Session-ID')
+        user_agent = request.headers.get('User-Agent')
+        records, items = [], []
+        for expression, (result, message) in zip(expressions, evaluated):
+            if not expression:
+                message = 'Expression is required'
+            if message:
+                items.append({'expression': expression, 'error': message})
+                continue
+            records.append({
+                'expression': expression,
+                'result': result,
+                'session_id': session_id,
+                'user_agent': user_agent,
+                'ip_address': client_ip(request)
+            })
+            items.append({'expression': expression, 'result': result})
+        
+        history_ids = iter(await run_blocking(history_db.add_calculations, records))
+        for item in items:
+            if 'result' in item:
+                item['history_id'] = next(history_ids)
+        
+        return JSONResponse({
+            'results': items,
+            'succeeded': len(records),
+            'failed': len(items) - len(records),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error in calculate batch: {str(e)}\n{traceback.format_exc()}")
+        return error('Internal server error', 500)
+
+
+async def calculate_table(request: Request):
+    data = await read_json(request)
+    try:
+        expression = str(data.get('expression', '')).strip()
+        variables = data.get('variables') or {}
+        if not expression:
+            return error('Expression is required', 400)
+        if not isinstance(variables, dict):
+            return error('Variables must be an object of name to values', 400)
+        
+        points = max([len(v) for v in variables.values() if isinstance(v, list)], default=1)
+        if points > config['MAX_TABLE_POINTS']:
+            return error(f"At most {config['MAX_TABLE_POINTS']} points per table", 400)
+        
+        values, errors = await run_blocking(evaluator.evaluate_vectorized, expression, variables)
+        return JSONResponse({
+            'expression': expression,
+            'values': values,
+            'errors': errors,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logger.error(f"Error in calculate table: {str(e)}\n{traceback.format_exc()}")
+        return error('Internal server error', 500)
+
+
+async def voice_to_text(request: Request):
+    form = await read_form(request)
+    try:
+        audio = form.get('audio')
+        if audio is None or isinstance(audio, str) or not allowed_audio_file(audio.filename or ''):
+            return error('Invalid or missing audio file', 400)
+        
+        data = await audio.read()
+        text = await run_blocking(
+            stt_engine.transcribe_audio_data, data, file_extension=os.path.splitext(audio.filename)[1]
+        )
+        return JSONResponse({
+            'transcribed_text': text,
+            'expression': calculator.parse_voice_input(text),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Voice to text error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to process audio', 500)
+
+
+async def voice_to_text_batch(request: Request):
+    max_bytes = config['STT_BATCH_MAX_CONTENT_LENGTH']
+    form = await read_form(request, max_bytes)
+    try:
+        max_clips = config['STT_BATCH_MAX_CLIPS']
+        archive = form.get('archive')
+        if archive is not None and not isinstance(archive, str):
+            clips = await run_blocking(read_audio_archive, archive.file, max_clips, max_bytes)
+        else:
+            uploads = [upload for upload in form.getlist('audio') if not isinstance(upload, str)]
+            if any(not allowed_audio_file(upload.filename or '') for upload in uploads):
+                return error('Invalid audio file format', 400)
+            if len(uploads) > max_clips:
+                return error(f"At most {max_clips} clips per batch", 400)
+            clips = [(upload.filename, await upload.read()) for upload in uploads]
+        
+        if not clips:
+            return error('No audio files provided', 400)
+        
+        texts = await run_blocking(
+            stt_engine.transcribe_many,
+            [(data, os.path.splitext(name)[1]) for name, data in clips],
+            language=form.get('language') or 'en-US',
+            workers=config['STT_BATCH_WORKERS']
+        )
+        return JSONResponse({
+            'results': [{
+                'filename': name,
+                'transcribed_text': text,
+                'expression': calculator.parse_voice_input(text),
+                'error': None if text else 'Could not transcribe audio'
+            } for (name, _), text in zip(clips, texts)],
+            'count': len(clips),
+            'timestamp': datetime.now().isoformat()
+        })
+    except (ValueError, zipfile.BadZipFile) as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logger.error(f"Batch voice to text error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to process audio batch', 500)
+
+
+async def upload_voice_stream(request: Request):
+    # One-request stream: the raw PCM body is fed in as it arrives, so the stream stays on one worker
+    params = request.query_params
+    try:
+        if not stt_engine.is_available():
+            return error('Speech recognition not available', 503)
+        
+        session = voice_streams.open(
+            sample_rate=int(params.get('sample_rate', 16000)),
+            channels=int(params.get('channels', 1)),
+            sample_width=int(params.get('sample_width', 2)),
+            language=params.get('language', 'en-US')
+        )
+        try:
+            size = 0
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > config['MAX_CONTENT_LENGTH']:
+                    raise RequestRejected()
+                if chunk:
+                    await run_blocking(session.feed, chunk)
+        finally:
+            voice_streams.close(session.id)
+        return JSONResponse(await run_blocking(voice_stream_result, session))
+    except RequestRejected:
+        raise
+    except (TypeError, ValueError) as e:
+        return error(str(e), 400)
+    except RuntimeError as e:
+        return error(str(e), 503)
+    except Exception as e:
+        logger.error(f"Voice stream upload error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to process voice stream', 500)
+
+
+async def open_voice_stream(request: Request):
+    data = await read_json(request)
+    try:
+        if not stt_engine.is_available():
+            return error('Speech recognition not available', 503)
+        if config['SERVER_WORKERS'] > 1:
+            # The chunks of a multi-request stream could reach any worker
+            return error('Multi-request voice streams need a single server worker; '
+                         'POST the audio to /api/voice-to-text/stream/upload instead', 409)
+        
+        session = voice_streams.open(
+            sample_rate=int(data.get('sample_rate', 16000)),
+            channels=int(data.get('channels', 1)),
+            sample_width=int(data.get('sample_width', 2)),
+            language=data.get('language', 'en-US')
+        )
+        return JSONResponse({'stream_id': session.id}, status_code=201)
+    except (TypeError, ValueError) as e:
+        return error(str(e), 400)
+    except RuntimeError as e:
+        return error(str(e), 503)
+    except Exception as e:
+        logger.error(f"Open voice stream error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to open voice stream', 500)
+
+
+async def feed_voice_stream(request: Request):
+    session = voice_streams.get(request.path_params['stream_id'])
+    if session is None:
+        return error('Unknown or expired stream', 404)
+    
+    chunk = await read_body(request, config['MAX_CONTENT_LENGTH'])
+    try:
+        await run_blocking(session.feed, chunk)
+        return JSONResponse({'results': session.new_results(), 'pending': session.pending})
+    except Exception as e:
+        logger.error(f"Voice stream chunk error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to process audio chunk', 500)
+
+
+async def close_voice_stream(request: Request):
+    try:
+        session = voice_streams.close(request.path_params['stream_id'])
+        if session is None:
+            return error('Unknown or expired stream', 404)
+        
+        return JSONResponse(await run_blocking(voice_stream_result, session))
+    except Exception as e:
+        logger.error(f"Close voice stream error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to finish voice stream', 500)
+
+
+async def text_to_speech(request: Request):
+    data = await read_json(request)
+    try:
+        text = str(data.get('text', '')).strip()
+        if not text:
+            return error('Text is required', 400)
+        try:
+            wait = float(data.get('wait', config['TTS_WAIT_SECONDS']))
+        except (TypeError, ValueError):
+            wait = math.nan
+        if not math.isfinite(wait):
+            return error('wait must be a number of seconds', 400)
+        if not tts_engine.is_available():
+            return error('TTS failed', 500)
+        
+        job = await run_blocking(tts_jobs.submit, text)
+        await wait_for_job(job, min(wait, config['TTS_MAX_WAIT_SECONDS']))
+        
+        if job.status == FAILED:
+            return error('TTS failed', 500)
+        if job.status != DONE:
+            return JSONResponse(job.to_dict(), status_code=202)
+        
+        return JSONResponse({
+            **job.to_dict(),
+            'filename': job.filename
+        })
+    except Exception as e:
+        logger.error(f"Text to speech error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to generate speech', 500)
+
+
+async def tts_job_status(request: Request):
+    try:
+        job = tts_jobs.get(request.path_params['job_id'])
+        if not job:
+            return error('Job not found', 404)
+        
+        wait = min(query_number(request, 'wait', 0, float), config['TTS_MAX_WAIT_SECONDS'])
+        await wait_for_job(job, wait)
+        
+        return JSONResponse(job.to_dict())
+    except Exception as e:
+        logger.error(f"TTS job status error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to get job status', 500)
+
+
+async def serve_audio(request: Request):
+    try:
+        filename = request.path_params['filename']
+        if not allowed_audio_file(filename):
+            return error('Invalid file format', 400)
+        
+        # Hot content-addressed clips are answered without leaving the event loop
+        clip = audio_store.get_cached(filename) or await run_blocking(audio_store.get, filename)
+        if clip is None:
+            return error('File not found', 404)
+        
+        status, headers, body = build_audio_response(clip, request.headers)
+        media_type = headers.pop('Content-Type')
+        return Response(body, status_code=status, headers=headers, media_type=media_type)
+    except Exception as e:
+        logger.error(f"Serve audio error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to serve audio', 500)
+
+
+async def get_history(request: Request):
+    try:
+        limit = max(1, min(query_number(request, 'limit', 50), 500))
+        page = await run_blocking(
+            history_db.get_history_page,
+            limit=limit,
+            cursor=request.query_params.get('cursor'),
+            session_id=request.headers.get('X-Session-ID'),
+            include_total=is_true(request.query_params.get('include_total', 'false'))
+        )
+        page['limit'] = limit
+        return JSONResponse(page)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logger.error(f"Get history error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to retrieve history', 500)
+
+
+async def search_history(request: Request):
+    try:
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return error('Search query (q) is required', 400)
+        limit = max(1, min(query_number(request, 'limit', 50), 500))
+        
+        page = await run_blocking(
+            history_db.search_history,
+            query,
+            limit=limit,
+            cursor=request.query_params.get('cursor'),
+            session_id=request.headers.get('X-Session-ID')
+        )
+        page['query'] = query
+        page['limit'] = limit
+        return JSONResponse(page)
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logger.error(f"Search history error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to search history', 500)
+
+
+async def delete_history_item(request: Request):
+    try:
+        if await run_blocking(history_db.delete_calculation, request.path_params['history_id']):
+            return JSONResponse({'message': 'Deleted'})
+        return error('Not found', 404)
+    except Exception as e:
+        logger.error(f"Delete history error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to delete item', 500)
+
+
+async def clear_history(request: Request):
+    try:
+        await run_blocking(history_db.clear_history, session_id=request.headers.get('X-Session-ID'))
+        return JSONResponse({'message': 'History cleared'})
+    except Exception as e:
+        logger.error(f"Clear history error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to clear history', 500)
+
+
+async def export_history(request: Request):
+    try:
+        session_id = request.headers.get('X-Session-ID')
+        export_format = request.query_params.get('format', 'json').lower()
+        compress = is_true(request.query_params.get('gzip', 'false'))
+        if export_format not in EXPORT_FORMATS:
+            return error(f"Format must be one of: {', '.join(EXPORT_FORMATS)}", 400)
+        
+        media_type, extension = EXPORT_FORMATS[export_format]
+        filename = f"calculator_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        if compress:
+            media_type, filename = 'application/gzip', f"{filename}.gz"
+        
+        def generate():
+            rows = history_db.iter_history(session_id=session_id)
+            return stream_export(rows, export_format, gzip=compress)
+        
+        return StreamingResponse(
+            iterate_in_thread(generate),
+            media_type=media_type,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+    except Exception as e:
+        logger.error(f"Export history error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to export history', 500)
+
+
+async def get_stats(request: Request):
+    try:
+        days = max(1, min(query_number(request, 'days', 30), 366))
+        
+        stats = await run_blocking(history_db.get_statistics)
+        stats['daily'] = await run_blocking(history_db.get_daily_statistics, days)
+        return JSONResponse(stats)
+    except Exception as e:
+        logger.error(f"Get stats error: {str(e)}\n{traceback.format_exc()}")
+        return error('Failed to retrieve statistics', 500)
+
+
+async def health_check(request: Request):
+    return JSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'services': {
+            'calculator': True,
+            'tts': tts_engine.is_available(),
+            'stt': stt_engine.is_available(),
+            'database': await run_blocking(history_db.is_connected)
+        },
+        'stt_backends': stt_engine.get_backend_status()
+    })
+
+
+async def metrics_endpoint(request: Request):
+    return Response(metrics.registry.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def request_rejected(request: Request, exc: RequestRejected):
+    return error(exc.message, exc.status)
+
+
+async def not_found(request: Request, exc):
+    return error('Endpoint not found', 404)
+
+
+async def server_error(request: Request, exc):
+    return error('Internal server error', 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    blocking_executor.shutdown(wait=False)
+
+
+routes = [
+    Route('/api/calculate', calculate, methods=['POST']),
+    Route('/api/calculate/batch', calculate_batch, methods=['POST']),
+    Route('/api/calculate/table', calculate_table, methods=['POST']),
+    Route('/api/voice-to-text', voice_to_text, methods=['POST']),
+    Route('/api/voice-to-text/batch', voice_to_text_batch, methods=['POST']),
+    Route('/api/voice-to-text/stream', open_voice_stream, methods=['POST']),
+    Route('/api/voice-to-text/stream/upload', upload_voice_stream, methods=['POST']),
+    Route('/api/voice-to-text/stream/{stream_id}', feed_voice_stream, methods=['POST']),
+    Route('/api/voice-to-text/stream/{stream_id}/end', close_voice_stream, methods=['POST']),
+    Route('/api/text-to-speech', text_to_speech, methods=['POST']),
+    Route('/api/tts/jobs/{job_id}', tts_job_status, methods=['GET']),
+    Route('/api/audio/{filename}', serve_audio, methods=['GET']),
+    Route('/api/history', get_history, methods=['GET']),
+    Route('/api/history', clear_history, methods=['DELETE']),
+    Route('/api/history/search', search_history, methods=['GET']),
+    Route('/api/history/{history_id:int}', delete_history_item, methods=['DELETE']),
+    Route('/api/export-history', export_history, methods=['GET']),
+    Route('/api/stats', get_stats, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Mount('/', StaticFiles(directory=FRONTEND_DIR, html=True, check_dir=False))
+]
+
+def route_template(scope) -> str:
+    """Path template of the route serving scope, so metric labels stay bounded"""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            partial = route
+            break
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    if partial is None:
+        return 'unmatched'
+    return partial.path if isinstance(partial, Route) else partial.path + '/{path}'
+
+
+class RequestTimingMiddleware:
+    """Records http_request_duration_seconds for every HTTP request (body streaming included)"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                route=route_template(scope), method=scope['method'], status=status
+            )
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestTimingMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={RequestRejected: request_rejected, 404: not_found, 500: server_error},
+    lifespan=lifespan
+)
@@ -0,0 +1,255 @@
+import io
+import wave
+import logging
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import audioop
+    AUDIOOP_AVAILABLE = True
+except ImportError:
+    AUDIOOP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Recognizers are fed 16-bit mono PCM at this rate
+TARGET_RATE = 16000
+TARGET_WIDTH = 2
+
+# Voice activity detection
+FRAME_SECONDS = 0.02
+SPEECH_PADDING_SECONDS = 0.15
+NOISE_PERCENTILE = 20
+SPEECH_TO_NOISE_RATIO = 3.0
+MIN_SPEECH_RMS = 100.0
+
+
+def is_available() -> bool:
+    """Check if preprocessing can run (NumPy, or audioop as a fallback)"""
+    return NUMPY_AVAILABLE or AUDIOOP_AVAILABLE
+
+
+class ProcessedAudio:
+    """Speech-only 16 kHz mono PCM ready for a recognizer"""
+    
+    def __init__(self, pcm: bytes, noise_floor: float, original_seconds: float):
+        self.pcm = pcm
+        self.sample_rate = TARGET_RATE
+        self.sample_width = TARGET_WIDTH
+        self.noise_floor = noise_floor
+        self.original_seconds = original_seconds
+    
+    @property
+    def seconds(self) -> float:
+        return len(self.pcm) / (TARGET_RATE * TARGET_WIDTH)
+    
+    @property
+    def is_silent(self) -> bool:
+        return not self.pcm
+
+
+def decode_wav(data) -> Tuple[bytes, int, int, int]:
+    """
+    Read PCM frames out of an in-memory WAV file
+    
+    Returns:
+        Tuple of (frames, channels, sample width, sample rate)
+    
+    Raises:
+        wave.Error: If the data is not a PCM WAV file
+    """
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        return (wav.readframes(wav.getnframes()), wav.getnchannels(),
+                wav.getsampwidth(), wav.getframerate())
+
+
+def to_mono_16k(pcm: bytes, channels: int, width: int, rate: int) -> bytes:
+    """Convert PCM of any width, channel count and rate to 16-bit mono at TARGET_RATE"""
+    return StreamConverter(channels, width, rate).convert(pcm)
+    
+
+class StreamConverter:
+    """
+    to_mono_16k for audio that arrives in pieces
+    
+    Resampling carries its position and leftover samples from one chunk to
+    the next, so converting a stream chunk by chunk gives the same samples
+    as converting it in one go, with no seam at chunk boundaries.
+    """
+    
+    def __init__(self, channels: int, width: int, rate: int):
+        """
+        Args:
+            channels: Channels of the incoming PCM (interleaved)
+            width: Bytes per sample of the incoming PCM
+            rate: Sample rate of the incoming PCM
+        """
+        self.channels = channels
+        self.width = width
+        self.rate = rate
+        # audioop.ratecv state
+        self._ratecv_state = None
+        # NumPy resampling: samples awaiting a full decimation group, the
+        # last sample of the previous chunk, and the next output position
+        # relative to that sample
+        self._undecimated = None
+        self._previous = None
+        self._position = 0.0
+    
+    def convert(self, pcm: bytes) -> bytes:
+        """Convert the next chunk of whole sample frames"""
+        if NUMPY_AVAILABLE:
+            samples = _samples_to_int16(pcm, self.width)
+            if self.channels > 1:
+                samples = samples[:len(samples) // self.channels * self.channels]
+                samples = samples.reshape(-1, self.channels).mean(axis=1)
+            if self.rate != TARGET_RATE:
+                samples = self._resample(samples)
+            return np.asarray(np.round(samples), dtype='<i2').tobytes()
+        
+        if self.width == 1:
+            # 8-bit WAV is unsigned
+            pcm = audioop.bias(pcm, 1, -128)
+        if self.width != TARGET_WIDTH:
+            pcm = audioop.lin2lin(pcm, self.width, TARGET_WIDTH)
+        if self.channels == 2:
+            pcm = audioop.tomono(pcm, TARGET_WIDTH, 0.5, 0.5)
+        elif self.channels > 2:
+            raise ValueError(f"Cannot downmix {self.channels} channels without NumPy")
+        if self.rate != TARGET_RATE:
+            pcm, self._ratecv_state = audioop.ratecv(pcm, TARGET_WIDTH, 1, self.rate, TARGET_RATE,
+                                                     self._ratecv_state)
+        return pcm
+    
+    def _resample(self, samples):
+        """Linear-interpolation resampling (averaging first when decimating)"""
+        samples = samples.astype(np.float64)
+        source_rate = self.rate
+        factor = source_rate // TARGET_RATE
+        if factor > 1:
+            # Box filter against aliasing on integer downsampling (e.g. 48k -> 16k)
+            if self._undecimated is not None:
+                samples = np.concatenate((self._undecimated, samples))
+            usable = len(samples) // factor * factor
+            self._undecimated = samples[usable:]
+            samples = samples[:usable].reshape(-1, factor).mean(axis=1)
+            source_rate //= factor
+        if source_rate == TARGET_RATE:
+            return samples
+        
+        if self._previous is not None:
+            samples = np.concatenate((self._previous, samples))
+        if not len(samples):
+            return samples
+        
+        step = source_rate / TARGET_RATE
+        last = len(samples) - 1
+        count = int((last - self._position) // step) + 1 if last >= self._position else 0
+        positions = self._position + np.arange(count) * step
+        # The next chunk starts from this chunk's last sample
+        self._position += count * step - last
+        self._previous = samples[-1:]
+        return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def _samples_to_int16(pcm: bytes, width: int):
+    """Decode little-endian PCM samples to an int16-scaled array"""
+    if width == 1:
+        return (np.frombuffer(pcm, dtype=np.uint8).astype(np.int16) - 128) << 8
+    if width == 2:
+        return np.frombuffer(pcm, dtype='<i2')
+    if width == 3:
+        raw = np.frombuffer(pcm[:len(pcm) // 3 * 3], dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        return (padded.view('<i4').ravel() >> 16).astype(np.int16)
+    if width == 4:
+        return (np.frombuffer(pcm, dtype='<i4') >> 16).astype(np.int16)
+    raise ValueError(f"Unsupported sample width: {width}")
+
+
+def frame_energies(pcm: bytes, rate: int = TARGET_RATE) -> List[float]:
+    """RMS energy of each FRAME_SECONDS frame of 16-bit mono PCM"""
+    frame_length = int(rate * FRAME_SECONDS)
+    if NUMPY_AVAILABLE:
+        samples = np.frombuffer(pcm, dtype='<i2')
+        frames = len(samples) // frame_length
+        if frames == 0:
+            return []
+        blocks = samples[:frames * frame_length].reshape(frames, frame_length).astype(np.float64)
+        return np.sqrt(np.mean(blocks * blocks, axis=1)).tolist()
+    
+    frame_bytes = frame_length * TARGET_WIDTH
+    return [float(audioop.rms(pcm[start:start + frame_bytes], TARGET_WIDTH))
+            for start in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if NUMPY_AVAILABLE:
+        return float(np.percentile(values, percentile))
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def find_speech(energies: List[float]) -> Tuple[Optional[Tuple[int, int]], float]:
+    """
+    Locate speech in a list of frame energies
+    
+    Frames louder than SPEECH_TO_NOISE_RATIO times a low percentile of all
+    frames (and at least MIN_SPEECH_RMS) count as speech.
+    
+    Returns:
+        Tuple of ((first frame, end frame) or None if all silence, noise floor),
+        where the noise floor is the mean energy of the frames outside the speech
+    """
+    if not energies:
+        return None, 0.0
+    
+    estimate = _percentile(energies, NOISE_PERCENTILE)
+    threshold = max(MIN_SPEECH_RMS, estimate * SPEECH_TO_NOISE_RATIO)
+    speech = [index for index, energy in enumerate(energies) if energy > threshold]
+    if not speech:
+        return None, sum(energies) / len(energies)
+    
+    padding = int(SPEECH_PADDING_SECONDS / FRAME_SECONDS)
+    start = max(0, speech[0] - padding)
+    end = min(len(energies), speech[-1] + 1 + padding)
+    
+    trimmed = energies[:start] + energies[end:]
+    noise_floor = sum(trimmed) / len(trimmed) if trimmed else estimate
+    return (start, end), noise_floor
+
+
+def preprocess_wav(data) -> ProcessedAudio:
+    """
+    Prepare an in-memory WAV file for speech recognition
+    
+    Downmixes and resamples to 16 kHz mono, then trims leading and trailing
+    silence using frame energies.
+    
+    Args:
+        data: WAV file contents
+    
+    Returns:
+        ProcessedAudio (empty PCM if the clip holds no speech)
+    
+    Raises:
+        wave.Error: If the data is not a PCM WAV file
+        ValueError: If the audio format cannot be converted
+    """
+    frames, channels, width, rate = decode_wav(data)
+    original_seconds = len(frames) / (channels * width * rate) if rate else 0.0
+    
+    pcm = to_mono_16k(frames, channels, width, rate)
+    speech, noise_floor = find_speech(frame_energies(pcm))
+    if speech is None:
+        return ProcessedAudio(b'', noise_floor, original_seconds)
+    
+    frame_bytes = int(TARGET_RATE * FRAME_SECONDS) * TARGET_WIDTH
+    start, end = speech
+    return ProcessedAudio(pcm[start * frame_bytes:end * frame_bytes], noise_floor, original_seconds)
@@ -0,0 +1,246 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIO_MIMETYPES = {
+    'wav': 'audio/wav',
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'flac': 'audio/flac'
+}
+
+# Names produced by TTSEngine.cache_filename: the content never changes
+CONTENT_ADDRESSED_PATTERN = re.compile(r'^tts_([0-9a-f]{32})\.[a-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class AudioClip:
+    """An audio file held in memory"""
+    
+    def __init__(self, filename: str, data: bytes, etag: str, mtime_ns: int):
+        self.filename = filename
+        self.data = data
+        self.etag = etag
+        self.mtime_ns = mtime_ns
+        self.immutable = CONTENT_ADDRESSED_PATTERN.match(filename) is not None
+        extension = filename.rsplit('.', 1)[-1].lower()
+        self.mimetype = AUDIO_MIMETYPES.get(extension, 'application/octet-stream')
+
+
+class AudioStore:
+    """Serves audio files from a bounded in-memory LRU of their bytes"""
+    
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 max_clip_bytes: int = 4 * 1024 * 1024):
+        """
+        Args:
+            directory: Directory the audio files live in
+            max_bytes: Total size of clips kept in memory
+            max_clip_bytes: Clips larger than this are read from disk on every request
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_clip_bytes = max_clip_bytes
+        self._clips = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, filename: str) -> Optional[AudioClip]:
+        """
+        Return the clip for filename, loading it from disk on a miss
+        
+        Content-addressed clips are served from memory without touching the
+        disk; other files are re-checked so an overwritten file is reloaded.
+        
+        Returns:
+            AudioClip or None if the file does not exist
+        """
+        if os.path.basename(filename) != filename or filename.startswith('.'):
+            return None
+        
+        with self._lock:
+            clip = self._clips.get(filename)
+            if clip is not None and clip.immutable:
+                self._clips.move_to_end(filename)
+                self.hits += 1
+                return clip
+        
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.discard(filename)
+            return None
+        
+        if clip is not None and clip.mtime_ns == stat.st_mtime_ns and len(clip.data) == stat.st_size:
+            with self._lock:
+                if filename in self._clips:
+                    self._clips.move_to_end(filename)
+                self.hits += 1
+            return clip
+        
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading audio file {filename}: {e}")
+            return None
+        
+        match = CONTENT_ADDRESSED_PATTERN.match(filename)
+        etag = match.group(1) if match else hashlib.sha256(data).hexdigest()[:32]
+        clip = AudioClip(filename, data, etag, stat.st_mtime_ns)
+        
+        with self._lock:
+            self.misses += 1
+            if len(data) <= self.max_clip_bytes:
+                self._bytes += len(data)
+                old = self._clips.pop(filename, None)
+                if old is not None:
+                    self._bytes -= len(old.data)
+                self._clips[filename] = clip
+                while self._bytes > self.max_bytes and self._clips:
+                    _, evicted = self._clips.popitem(last=False)
+                    self._bytes -= len(evicted.data)
+                    self.evictions += 1
+        return clip
+    
+    def get_cached(self, filename: str) -> Optional[AudioClip]:
+        """Return a content-addressed clip only if it is already in memory (never touches disk)"""
+        with self._lock:
+            clip = self._clips.get(filename)
+            if clip is None or not clip.immutable:
+                return None
+            self._clips.move_to_end(filename)
+            self.hits += 1
+            return clip
+    
+    def discard(self, filename: str):
+        """Drop a clip from memory"""
+        with self._lock:
+            clip = self._clips.pop(filename, None)
+            if clip is not None:
+                self._bytes -= len(clip.data)
+    
+    def clear(self):
+        """Drop all clips and reset the counters"""
+        with self._lock:
+            self._clips.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and memory use"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'clips': len(self._clips),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header
+    
+    Args:
+        header: Range header value (e.g. "bytes=0-1023", "bytes=-500")
+        length: Size of the resource in bytes
+    
+    Returns:
+        Inclusive (start, end) byte positions, or None to serve the whole
+        resource (no header, or a form we do not handle such as multiple ranges)
+    
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0 or length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, length - suffix), length - 1
+    
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match / If-Range header against a strong ETag"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+def build_audio_response(clip: AudioClip, headers) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Work out the status, headers and body for serving a clip
+    
+    Handles If-None-Match (304), Range (206/416) and If-Range.
+    
+    Args:
+        clip: Clip being served
+        headers: Request headers (any mapping with .get)
+    
+    Returns:
+        Tuple of (status, response headers, body)
+    """
+    length = len(clip.data)
+    response_headers = {
+        'ETag': f'"{clip.etag}"',
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if clip.immutable else REVALIDATE_CACHE_CONTROL,
+        'Content-Type': clip.mimetype
+    }
+    
+    if _etag_matches(headers.get('If-None-Match'), clip.etag):
+        return 304, response_headers, b''
+    
+    range_header = headers.get('Range')
+    if_range = headers.get('If-Range')
+    if if_range and not (if_range.startswith('"') and _etag_matches(if_range, clip.etag)):
+        # The client's partial copy is stale (or dated): send everything
+        range_header = None
+    
+    try:
+        byte_range = parse_range(range_header, length)
+    except ValueError:
+        response_headers['Content-Range'] = f'bytes */{length}'
+        return 416, response_headers, b''
+    
+    if byte_range is None:
+        return 200, response_headers, clip.data
+    
+    start, end = byte_range
+    response_headers['Content-Range'] = f'bytes {start}-{end}/{length}'
+    return 206, response_headers, clip.data[start:end + 1]
@@ -1,15 +1,89 @@
 import re
+import ast
 import math
 import operator
-from typing import Union, Dict, Any
+import threading
+from collections import OrderedDict
+from functools import reduce
+from typing import Union, Dict, Any, Optional, Hashable, List, Tuple, Sequence
+import time
 import logging
 
+import metrics
+from voice_parser import VoiceTranslator
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+
+class ExpressionCache:
+    """Thread-safe LRU cache of compiled expressions"""
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all cached entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+
 class Calculator:
     """Mathematical expression evaluator with voice input support"""
     
-    def __init__(self):
+    # AST nodes a compiled expression may contain
+    _ALLOWED_NODES = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+        ast.UAdd, ast.USub
+    )
+    
+    def __init__(self, cache_size: int = 1024):
         # Supported operators
         self.operators = {
             '+': operator.add,
@@ -48,50 +122,44 @@ class Calculator:
             'e': math.e
         }
         
-        # Voice input patterns
-        self.voice_patterns = {
-            r'\bplus\b|\band\b': '+',
-            r'\bminus\b|\bsubtract\b': '-',
-            r'\btimes\b|\bmultiplied by\b|\binto\b': '*',
-            r'\bdivided by\b|\bover\b': '/',
-            r'\bpower of\b|\bto the power of\b|\braised to\b': '**',
-            r'\bsquare root of\b|\broot\b': 'sqrt(',
-            r'\bsquare\b': '**2',
-            r'\bcube\b': '**3',
-            r'\bpercent\b|\b%\b': '/100',
-            r'\bequals\b|\bis\b|\bcalculate\b': '=',
-            r'\bdecimal\b|\bpoint\b': '.',
-            r'\bzero\b': '0',
-            r'\bone\b': '1',
-            r'\btwo\b': '2',
-            r'\bthree\b': '3',
-            r'\bfour\b': '4',
-            r'\bfive\b': '5',
-            r'\bsix\b': '6',
-            r'\bseven\b': '7',
-            r'\beight\b': '8',
-            r'\bnine\b': '9',
-            r'\bten\b': '10',
-            r'\beleven\b': '11',
-            r'\btwelve\b': '12',
-            r'\bthirteen\b': '13',
-            r'\bfourteen\b': '14',
-            r'\bfifteen\b': '15',
-            r'\bsixteen\b': '16',
-            r'\bseventeen\b': '17',
-            r'\beighteen\b': '18',
-            r'\bnineteen\b': '19',
-            r'\btwenty\b': '20',
-            r'\bthirty\b': '30',
-            r'\bforty\b': '40',
-            r'\bfifty\b': '50',
-            r'\bsixty\b': '60',
-            r'\bseventy\b': '70',
-            r'\beighty\b': '80',
-            r'\bninety\b': '90',
-            r'\bhundred\b': '100',
-            r'\bthousand\b': '1000'
+        # Names visible to compiled expressions
+        self.functions = {
+            name: func for name, func in self.safe_dict.items()
+            if name != '__builtins__' and callable(func)
         }
+        self.namespace = {**self.safe_dict, **self.constants}
+        
+        # Element-wise counterparts used by evaluate_vectorized
+        if NUMPY_AVAILABLE:
+            self.vector_namespace = {
+                '__builtins__': {},
+                'sin': np.sin,
+                'cos': np.cos,
+                'tan': np.tan,
+                'sqrt': np.sqrt,
+                'log': np.log10,
+                'ln': np.log,
+                'abs': np.abs,
+                'round': np.round,
+                'floor': np.floor,
+                'ceil': np.ceil,
+                'pow': np.power,
+                'min': lambda *args: reduce(np.minimum, args),
+                'max': lambda *args: reduce(np.maximum, args),
+                **self.constants
+            }
+        else:
+            self.vector_namespace = None
+        
+        # Implicit-multiplication patterns keyed by the extra variable names;
+        # bounded, since the names come from requests
+        self._implicit_mul_patterns = ExpressionCache(64)
+        
+        # Compiled code objects keyed by the raw expression
+        self.cache = ExpressionCache(cache_size)
+        
+        # Precompiled spoken-arithmetic translator
+        self.voice_translator = VoiceTranslator()
         
     def evaluate(self, expression: str) -> Union[float, int]:
         """
@@ -107,62 +175,45 @@ class Calculator:
             ValueError: If expression is invalid
         """
         try:
-            # Clean and validate expression
-            expression = self._clean_expression(expression)
-            
-            if not expression:
-                raise ValueError("Empty expression")
-            
-            # Replace constants first
-            for constant, value in self.constants.items():
-                expression = expression.replace(constant, str(value))
-            
-            # Handle functions
-            expression = self._handle_functions(expression)
-            
-            # Fix parentheses matching
-            expression = self._fix_parentheses(expression)
-            
-            # Validate expression safety
-            if not self._is_safe_expression(expression):
-                raise ValueError("Invalid or unsafe expression")
-            
-            # Evaluate the expression using safe namespace
-            result = eval(expression, self.safe_dict)
-            
-            # Handle special cases
-            if isinstance(result, complex):
-                if result.imag == 0:
-                    result = result.real
-                else:
-                    raise ValueError("Complex numbers not supported")
-            
-            # Check for infinity or NaN
-            if math.isinf(result):
-                raise ValueError("Result is infinity")
-            if math.isnan(result):
-                raise ValueError("Result is not a number")
-            
-            # Round very small numbers to zero
-            if abs(result) < 1e-10:
-                result = 0
+            start = time.perf_counter()
+            code = self._compile(expression)
+            parsed = time.perf_counter()
+            metrics.observe_stage('calc_parse', parsed - start)
             
-            # Return integer if possible
-            if isinstance(result, float) and result.is_integer():
-                return int(result)
-            
-            return result
+            result = eval(code, self.namespace)
+            metrics.observe_stage('calc_eval', time.perf_counter() - parsed)
+            return self._finalize_result(result)
             
         except ZeroDivisionError:
             raise ValueError("Division by zero")
         except OverflowError:
             raise ValueError("Number too large")
+        except MemoryError:
+            raise ValueError("Calculation exceeded memory limit")
         except SyntaxError as e:
             raise ValueError(f"Invalid expression syntax: {str(e)}")
         except Exception as e:
             logger.error(f"Calculation error: {str(e)}")
             raise ValueError(f"Calculation error: {str(e)}")
     
+    def evaluate_batch(self, expressions: List[str]) -> List[Tuple[Optional[Union[float, int]], Optional[str]]]:
+        """
+        Evaluate many expressions in one pass
+        
+        Args:
+            expressions: Mathematical expressions as strings
+            
+        Returns:
+            (result, error) pairs in input order; exactly one of the two is None
+        """
+        results = []
+        for expression in expressions:
+            try:
+                results.append((self.evaluate(expression), None))
+            except ValueError as e:
+                results.append((None, str(e)))
+        return results
+    
     def _clean_expression(self, expression: str) -> str:
         """Clean and normalize the expression"""
         if not expression:
@@ -198,16 +249,25 @@ class Calculator:
         
         return expression
     
-    def _handle_functions(self, expression: str) -> str:
+    def _handle_functions(self, expression: str, variables: Tuple[str, ...] = ()) -> str:
         """Process mathematical functions in the expression"""
-        # Add missing multiplication signs before functions
-        for func in self.safe_dict.keys():
-            if func != '__builtins__' and callable(self.safe_dict[func]):
-                # Add * before function if preceded by number or )
-                pattern = f"([0-9)])({func})"
-                expression = re.sub(pattern, r'\1*\2', expression)
-        
-        return expression
+        # Add * before a function, constant or variable preceded by a number or )
+        return self._implicit_mul_pattern(variables).sub(r'\1*\2', expression)
+    
+    def _implicit_mul_pattern(self, variables: Tuple[str, ...]) -> re.Pattern:
+        """Build (once per variable set) the pattern used by _handle_functions"""
+        pattern = self._implicit_mul_patterns.get(variables)
+        if pattern is None:
+            names = sorted(list(self.functions) + list(self.constants) + list(variables),
+                           key=len, reverse=True)
+            # Matches "2pi", "3sqrt(4)" or ")sin(x)". The number alternative
+            # swallows exponents so "2e5" stays a float literal.
+            pattern = re.compile(
+                r'(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\))(?![eE][+-]?\d)'
+                r'((?:' + '|'.join(re.escape(name) for name in names) + r')\b)'
+            )
+            self._implicit_mul_patterns.put(variables, pattern)
+        return pattern
     
     def _fix_parentheses(self, expression: str) -> str:
         """Ensure parentheses are properly matched"""
@@ -220,110 +280,221 @@ class Calculator:
         
         return expression
     
-    def _is_safe_expression(self, expression: str) -> bool:
-        """Check if expression contains only safe characters and functions"""
-        # Allowed characters: numbers, operators, parentheses, functions, constants, decimal points
-        allowed_pattern = r'^[0-9+\-*/().a-zA-Z_\s]*$'
-        
-        if not re.match(allowed_pattern, expression):
-            return False
-        
-        # Check for dangerous patterns
-        dangerous_patterns = [
-            r'__',  # Double underscore (Python internals)
-            r'import',
-            r'exec',
-            r'eval',
-            r'open',
-            r'file',
-            r'input',
-            r'raw_input',
-            r'globals',
-            r'locals',
-            r'vars',
-            r'dir',
-            r'help'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, expression, re.IGNORECASE):
-                return False
-        
-        return True
+    def _validate_tree(self, tree: ast.AST, variables: Tuple[str, ...] = ()):
+        """Reject any node, name or call outside the whitelist"""
+        for node in ast.walk(tree):
+            if not isinstance(node, self._ALLOWED_NODES):
+                raise ValueError("Invalid or unsafe expression")
+            
+            if isinstance(node, ast.Constant):
+                if type(node.value) not in (int, float):
+                    raise ValueError("Invalid or unsafe expression")
+            elif isinstance(node, ast.Name):
+                # Never resolve dunders such as __builtins__, whatever the namespace holds
+                if node.id.startswith('__'):
+                    raise ValueError("Invalid or unsafe expression")
+                if node.id not in self.namespace and node.id not in variables:
+                    raise ValueError(f"Unknown name: {node.id}")
+            elif isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in self.functions:
+                    raise ValueError("Invalid or unsafe expression")
+                if node.keywords:
+                    raise ValueError("Keyword arguments not supported")
     
-    def parse_voice_input(self, voice_text: str) -> str:
+    def _compile(self, expression: str, variables: Tuple[str, ...] = ()):
         """
-        Convert voice input to mathematical expression
+        Normalize, parse, validate and compile an expression
+        
+        Compiled code objects are cached by the raw expression, so repeated
+        expressions skip the whole pipeline.
         
         Args:
-            voice_text: Transcribed voice input
+            expression: Mathematical expression as string
+            variables: Free variable names the expression may reference
             
         Returns:
-            Mathematical expression string
+            Code object ready for eval() against self.namespace
+            
+        Raises:
+            ValueError: If expression is empty or not allowed
+            SyntaxError: If expression cannot be parsed
         """
-        if not voice_text:
-            return ""
+        key = (str(expression), variables) if variables else str(expression)
+        code = self.cache.get(key)
+        if code is not None:
+            return code
         
-        # Convert to lowercase for processing
-        text = voice_text.lower().strip()
+        normalized = self._clean_expression(expression)
+        if not normalized:
+            raise ValueError("Empty expression")
         
-        # Remove common filler words
-        filler_words = ['um', 'uh', 'please', 'can you', 'what is', 'calculate']
-        for word in filler_words:
-            text = re.sub(rf'\b{word}\b', '', text)
+        normalized = self._handle_functions(normalized, variables)
+        normalized = self._fix_parentheses(normalized)
         
-        # Apply voice patterns
-        for pattern, replacement in self.voice_patterns.items():
-            text = re.sub(pattern, replacement, text)
+        tree = ast.parse(normalized, mode='eval')
+        self._validate_tree(tree, variables)
+        code = compile(tree, '<expression>', 'eval')
         
+        self.cache.put(key, code)
+        return code
+    
+    def _finalize_result(self, result: Any) -> Union[float, int]:
+        """Apply range checks and normalize the type of a raw result"""
         # Handle special cases
-        text = self._handle_voice_special_cases(text)
+        if isinstance(result, complex):
+            if result.imag == 0:
+                result = result.real
+            else:
+                raise ValueError("Complex numbers not supported")
+        
+        # Check for infinity or NaN
+        if math.isinf(result):
+            raise ValueError("Result is infinity")
+        if math.isnan(result):
+            raise ValueError("Result is not a number")
         
-        # Clean up the result
-        text = re.sub(r'\s+', '', text)  # Remove extra spaces
-        text = re.sub(r'=+', '', text)   # Remove equals signs
+        # Round very small numbers to zero
+        if abs(result) < 1e-10:
+            result = 0
         
-        return text
+        # Return integer if possible
+        if isinstance(result, float) and result.is_integer():
+            return int(result)
+        
+        return result
     
-    def _handle_voice_special_cases(self, text: str) -> str:
-        """Handle special voice input cases"""
-        # Handle compound numbers (twenty-one, thirty-five, etc.)
-        compound_patterns = {
-            r'twenty[- ]one': '21',
-            r'twenty[- ]two': '22',
-            r'twenty[- ]three': '23',
-            r'twenty[- ]four': '24',
-            r'twenty[- ]five': '25',
-            r'twenty[- ]six': '26',
-            r'twenty[- ]seven': '27',
-            r'twenty[- ]eight': '28',
-            r'twenty[- ]nine': '29',
-            r'thirty[- ]one': '31',
-            r'thirty[- ]two': '32',
-            r'thirty[- ]three': '33',
-            r'thirty[- ]four': '34',
-            r'thirty[- ]five': '35',
-            r'thirty[- ]six': '36',
-            r'thirty[- ]seven': '37',
-            r'thirty[- ]eight': '38',
-            r'thirty[- ]nine': '39',
-        }
+    def evaluate_vectorized(self, expression: str,
+                            variables: Dict[str, Union[float, Sequence[float]]]
+                            ) -> Tuple[List[Optional[Union[float, int]]], List[Optional[str]]]:
+        """
+        Evaluate an expression over arrays of variable bindings
+        
+        The expression is compiled once against the variable names and, when
+        NumPy is installed, evaluated with ufuncs over whole arrays. The
+        checks done by evaluate() are applied element-wise.
+        
+        Args:
+            expression: Mathematical expression as string (e.g. "sin(x)*2+1")
+            variables: Variable name to a scalar or a 1-D sequence of values;
+                sequences must all have the same length
+            
+        Returns:
+            (values, errors) lists aligned with the inputs; for each element
+            exactly one of the two is None
+            
+        Raises:
+            ValueError: If the expression or the variable bindings are invalid
+        """
+        names = tuple(sorted(variables))
+        for name in names:
+            if not name.isidentifier() or name in self.namespace:
+                raise ValueError(f"Invalid variable name: {name}")
         
-        for pattern, replacement in compound_patterns.items():
-            text = re.sub(pattern, replacement, text)
+        lengths = {len(values) for values in variables.values() if not isinstance(values, (int, float))}
+        if len(lengths) > 1:
+            raise ValueError("Variable arrays must have the same length")
+        size = lengths.pop() if lengths else 1
         
-        # Handle fractions
-        fraction_patterns = {
-            r'one half': '0.5',
-            r'half': '0.5',
-            r'quarter': '0.25',
-            r'three quarters': '0.75'
+        try:
+            code = self._compile(expression, names)
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression syntax: {str(e)}")
+        
+        if NUMPY_AVAILABLE:
+            return self._evaluate_arrays(code, variables, size)
+        
+        # Plain-Python fallback: one eval per element on the scalar namespace
+        bindings = {
+            name: [float(bound)] * size if isinstance(bound, (int, float)) else [float(v) for v in bound]
+            for name, bound in variables.items()
         }
+        values, errors = [], []
+        for index in range(size):
+            namespace = dict(self.namespace)
+            for name, bound in bindings.items():
+                namespace[name] = bound[index]
+            value, error = self._evaluate_scalar(code, namespace)
+            values.append(value)
+            errors.append(error)
+        return values, errors
+    
+    def _evaluate_arrays(self, code, variables: Dict[str, Any], size: int
+                         ) -> Tuple[List[Optional[Union[float, int]]], List[Optional[str]]]:
+        """Evaluate compiled code over NumPy arrays with element-wise checks"""
+        namespace = dict(self.vector_namespace)
+        for name, bound in variables.items():
+            namespace[name] = np.asarray(bound, dtype=float)
+        
+        try:
+            with np.errstate(all='ignore'):
+                raw = np.broadcast_to(np.asarray(eval(code, namespace)), (size,))
+        except Exception as e:
+            raise ValueError(f"Calculation error: {str(e)}")
+        
+        error_messages = np.full(size, None, dtype=object)
+        valid = np.ones(size, dtype=bool)
+        
+        def reject(mask, message):
+            mask = valid & mask
+            error_messages[mask] = message
+            valid[mask] = False
         
-        for pattern, replacement in fraction_patterns.items():
-            text = re.sub(pattern, replacement, text)
+        # Complex results are only accepted when the imaginary part is zero
+        if np.iscomplexobj(raw):
+            reject(raw.imag != 0, "Complex numbers not supported")
+            raw = raw.real
         
-        return text
+        result = raw.astype(float)
+        reject(np.isinf(result), "Result is infinity")
+        reject(np.isnan(result), "Result is not a number")
+        
+        # Round very small numbers to zero
+        result[valid & (np.abs(result) < 1e-10)] = 0.0
+        
+        # Return integers where possible
+        is_integer = valid & (result == np.floor(result))
+        
+        values = [
+            (int(value) if integral else value) if ok else None
+            for value, integral, ok in zip(result.tolist(), is_integer.tolist(), valid.tolist())
+        ]
+        return values, error_messages.tolist()
+    
+    def _evaluate_scalar(self, code, namespace: Dict[str, Any]
+                         ) -> Tuple[Optional[Union[float, int]], Optional[str]]:
+        """Evaluate compiled code once, returning (value, error) instead of raising"""
+        try:
+            raw = eval(code, namespace)
+        except ZeroDivisionError:
+            return None, "Division by zero"
+        except OverflowError:
+            return None, "Number too large"
+        except Exception as e:
+            return None, f"Calculation error: {str(e)}"
+        
+        try:
+            return self._finalize_result(raw), None
+        except OverflowError:
+            return None, "Number too large"
+        except ValueError as e:
+            return None, str(e)
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Return compiled-expression cache statistics"""
+        return self.cache.stats()
+    
+    def parse_voice_input(self, voice_text: str) -> str:
+        """
+        Convert voice input to mathematical expression
+        
+        Args:
+            voice_text: Transcribed voice input
+            
+        Returns:
+            Mathematical expression string
+        """
+        with metrics.stage_timer('voice_parse'):
+            return self.voice_translator.translate(voice_text)
     
     def get_functions_list(self) -> Dict[str, Any]:
         """Return available functions and their descriptions"""
@@ -0,0 +1,370 @@
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Workers inherit the parent's Calculator instead of re-importing the app
+FORK_AVAILABLE = 'fork' in multiprocessing.get_all_start_methods()
+
+# Seconds to wait for the spawner to hand over a new worker
+SPAWN_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+def _address_space_in_use() -> int:
+    """Return the current virtual memory size of this process in bytes (Linux only)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker_main(conn, calculator, memory_limit: Optional[int]):
+    """Evaluation loop run inside each sandbox process"""
+    if RESOURCE_AVAILABLE and memory_limit:
+        try:
+            # The limit is on top of what the forked process already maps
+            limit = _address_space_in_use() + memory_limit
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not set sandbox memory limit: {e}")
+    
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        
+        method, args = message
+        # Stage timings are sent back with the reply; this process's registry is never scraped
+        with metrics.capture_stages() as stages:
+            start = time.perf_counter()
+            try:
+                status, payload = 'ok', getattr(calculator, method)(*args)
+            except MemoryError:
+                status, payload = 'error', "Calculation exceeded memory limit"
+            except ValueError as e:
+                status, payload = 'error', str(e)
+            except Exception as e:
+                status, payload = 'error', f"Calculation error: {str(e)}"
+            elapsed = time.perf_counter() - start
+        # So is the expression cache, which only this process uses
+        conn.send((status, payload, elapsed, stages, calculator.get_cache_stats()))
+
+
+def _spawner_main(conn, calculator, memory_limit: Optional[int]):
+    """
+    Fork evaluation workers on request, from a process that never starts threads
+    
+    Forking the threaded app process could leave a worker holding a lock
+    (logging, the expression cache) that some other thread had taken. The
+    spawner is forked once at startup instead and forks every worker; each
+    worker's end of its pipe is passed back over conn.
+    """
+    # Exited workers are reaped without waiting on them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    parent_pid = os.getppid()
+    
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        
+        parent_conn, child_conn = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                conn.close()
+                parent_conn.close()
+                _worker_main(child_conn, calculator, memory_limit)
+            finally:
+                os._exit(0)
+        
+        child_conn.close()
+        conn.send(pid)
+        reduction.send_handle(conn, parent_conn.fileno(), parent_pid)
+        parent_conn.close()
+
+
+class _SandboxWorker:
+    """Handle on one pre-forked evaluation process"""
+    
+    def __init__(self, conn, pid: int):
+        self.conn = conn
+        self.pid = pid
+        self.tasks = 0
+        # Expression cache counters as of the worker's last reply
+        self.cache_stats = {}
+    
+    def stop(self, kill: bool = False):
+        """Stop the process, politely unless kill is set"""
+        try:
+            if kill:
+                os.kill(self.pid, signal.SIGKILL)
+            else:
+                # The worker exits on None (or on EOF once the pipe is closed)
+                self.conn.send(None)
+        except (ProcessLookupError, BrokenPipeError):
+            pass
+        except Exception as e:
+            logger.warning(f"Error stopping sandbox worker: {e}")
+        finally:
+            self.conn.close()
+
+
+class SandboxedEvaluator:
+    """Runs Calculator methods in a pool of resource-limited worker processes"""
+    
+    def __init__(self, calculator, workers: int = 2, timeout: float = 2.0,
+                 memory_limit_mb: Optional[int] = 256, max_tasks_per_worker: int = 1000,
+                 queue_timeout: float = 10.0, batch_timeout: float = 10.0):
+        """
+        Args:
+            calculator: Calculator instance the workers evaluate with
+            workers: Number of worker processes
+            timeout: Wall-clock seconds allowed per call before the worker is killed
+            memory_limit_mb: Extra address space a worker may map (None for no limit)
+            max_tasks_per_worker: Calls after which a worker is replaced
+            queue_timeout: Seconds a call waits for a free worker
+            batch_timeout: Wall-clock seconds allowed for a whole evaluate_batch call
+        """
+        self.calculator = calculator
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.queue_timeout = queue_timeout
+        self.batch_timeout = batch_timeout
+        
+        self._context = multiprocessing.get_context('fork') if FORK_AVAILABLE else None
+        self._idle = queue.Queue()
+        # Reentrant: start() and _replace_lost() spawn workers while holding it
+        self._lock = threading.RLock()
+        self._started = False
+        self._spawner = None
+        self._spawner_conn = None
+        self._spawn_lock = threading.Lock()
+        # Workers that died and could not be replaced yet
+        self._lost = 0
+        # Every live worker, idle or busy, and the final cache counters of retired ones
+        self._workers = set()
+        self._retired_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def is_available(self) -> bool:
+        """Check if evaluation runs in sandbox processes (rather than inline)"""
+        return self._context is not None
+    
+    def start(self):
+        """
+        Fork the spawner and the worker processes
+        
+        Call this before the application starts any threads; later
+        replacement workers are forked by the spawner, not by this process.
+        """
+        if not self.is_available():
+            logger.warning("fork not available - evaluating expressions inline")
+            return
+        
+        with self._lock:
+            if self._started:
+                return
+            if threading.active_count() > 1:
+                logger.warning("Starting the evaluation sandbox after other threads; "
+                               "call SandboxedEvaluator.start() earlier")
+            
+            self._spawner_conn, child_conn = self._context.Pipe()
+            self._spawner = self._context.Process(
+                target=_spawner_main,
+                args=(child_conn, self.calculator, self.memory_limit),
+                name='sandbox-spawner',
+                daemon=True
+            )
+            self._spawner.start()
+            child_conn.close()
+            
+            for _ in range(self.workers):
+                self._idle.put(self._spawn())
+            self._started = True
+            logger.info(f"Started {self.workers} sandboxed evaluation workers")
+    
+    def shutdown(self):
+        """Stop all idle workers and the spawner"""
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+            self._workers.clear()
+            
+            if self._spawner is not None:
+                try:
+                    self._spawner_conn.send(None)
+                except OSError:
+                    pass
+                self._spawner.join(timeout=1)
+                if self._spawner.is_alive():
+                    self._spawner.kill()
+                self._spawner_conn.close()
+                self._spawner = None
+            self._started = False
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Expression cache counters summed over the workers, including replaced ones"""
+        if not self.is_available():
+            return self.calculator.get_cache_stats()
+        
+        with self._lock:
+            stats = dict(self._retired_cache_stats, size=0, maxsize=0)
+            for worker in self._workers:
+                for key, value in worker.cache_stats.items():
+                    stats[key] += value
+        return stats
+    
+    def evaluate(self, expression: str):
+        """Sandboxed Calculator.evaluate"""
+        return self._call('evaluate', expression)
+    
+    def evaluate_timed(self, expression: str) -> Tuple[Any, float]:
+        """Sandboxed Calculator.evaluate, also returning the evaluation time in seconds (excluding IPC)"""
+        return self._call_timed('evaluate', expression)
+    
+    def evaluate_batch(self, expressions: List[str]) -> List[Tuple[Any, Optional[str]]]:
+        """
+        Sandboxed Calculator.evaluate_batch
+        
+        Each expression gets its own time limit, capped by what is left of
+        batch_timeout; expressions reached after the deadline are not run.
+        """
+        deadline = time.monotonic() + self.batch_timeout
+        results = []
+        for expression in expressions:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                results.append((None, "Batch time limit exceeded"))
+                continue
+            try:
+                results.append((self._call('evaluate', expression, timeout=min(self.timeout, remaining)), None))
+            except ValueError as e:
+                results.append((None, str(e)))
+        return results
+    
+    def evaluate_vectorized(self, expression: str, variables):
+        """Sandboxed Calculator.evaluate_vectorized"""
+        return self._call('evaluate_vectorized', expression, variables)
+    
+    def _spawn(self) -> _SandboxWorker:
+        """Have the spawner fork a new worker"""
+        with self._spawn_lock:
+            if self._spawner is None:
+                raise RuntimeError("Sandbox spawner is not running")
+            self._spawner_conn.send('spawn')
+            if not self._spawner_conn.poll(SPAWN_TIMEOUT):
+                raise RuntimeError("Sandbox spawner did not respond")
+            pid = self._spawner_conn.recv()
+            fd = reduction.recv_handle(self._spawner_conn)
+        worker = _SandboxWorker(Connection(fd), pid)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+    
+    def _replace_lost(self):
+        """Retry replacing workers whose replacement failed earlier"""
+        with self._lock:
+            while self._lost:
+                try:
+                    self._idle.put(self._spawn())
+                except Exception as e:
+                    logger.error(f"Failed to replace sandbox worker: {e}")
+                    return
+                self._lost -= 1
+    
+    def _call(self, method: str, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run a Calculator method in a worker
+        
+        Raises:
+            ValueError: If the calculation fails, times out or exceeds its limits
+        """
+        return self._call_timed(method, *args, timeout=timeout)[0]
+    
+    def _call_timed(self, method: str, *args, timeout: Optional[float] = None) -> Tuple[Any, float]:
+        """
+        Run a Calculator method in a worker; returns (result, seconds spent in the method)
+        
+        timeout overrides the per-call time limit.
+        """
+        if not self.is_available():
+            start = time.perf_counter()
+            result = getattr(self.calculator, method)(*args)
+            return result, time.perf_counter() - start
+        
+        if not self._started:
+            self.start()
+        if self._lost:
+            self._replace_lost()
+        
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise ValueError("Calculation service is busy, please try again")
+        healthy = False
+        try:
+            worker.conn.send((method, args))
+            limit = self.timeout if timeout is None else timeout
+            if not worker.conn.poll(limit):
+                logger.warning(f"Killing sandbox worker after {limit:.3g}s on {args[0]!r}")
+                raise ValueError("Calculation timed out")
+            
+            status, payload, elapsed, stages, worker.cache_stats = worker.conn.recv()
+            healthy = True
+            metrics.record_stages(stages)
+        except (EOFError, OSError):
+            # The worker died, most likely by hitting its memory limit
+            raise ValueError("Calculation exceeded resource limits")
+        finally:
+            worker.tasks += 1
+            self._release(worker, healthy)
+        
+        if status == 'error':
+            raise ValueError(payload)
+        return payload, elapsed
+    
+    def _release(self, worker: _SandboxWorker, healthy: bool):
+        """Return a worker to the pool, replacing it if dead or worn out"""
+        if healthy and worker.tasks < self.max_tasks_per_worker:
+            self._idle.put(worker)
+            return
+        
+        worker.stop(kill=not healthy)
+        with self._lock:
+            self._workers.discard(worker)
+            for key in self._retired_cache_stats:
+                self._retired_cache_stats[key] += worker.cache_stats.get(key, 0)
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            logger.error(f"Failed to replace sandbox worker: {e}")
+            with self._lock:
+                self._lost += 1
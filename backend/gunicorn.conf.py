@@ -0,0 +1,48 @@
+# Gunicorn settings, overridable through the environment
+#
+#   gunicorn -c gunicorn.conf.py app:app                      threaded WSGI workers
+#   GUNICORN_ASGI=1 gunicorn -c gunicorn.conf.py asgi_app:app   async (uvicorn) workers
+import os
+import glob
+import tempfile
+import multiprocessing
+
+import metrics
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ.get('GUNICORN_ASGI', '').lower() in ('1', 'true', 'yes'):
+    # Each worker runs an event loop; blocking calls go to ASGI_BLOCKING_WORKERS threads
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    # Threads let a sync worker overlap requests that wait on TTS, STT or SQLite
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+
+def on_starting(server):
+    # Open voice streams live in the worker that opened them. The app reads this to
+    # refuse multi-request streams (whose chunks could reach any worker) when
+    # there is more than one; /api/voice-to-text/stream/upload works either way.
+    os.environ['SERVER_WORKERS'] = str(server.cfg.workers)
+
+    # Metrics are recorded per worker; they share a directory so any worker can report the total
+    if server.cfg.workers > 1:
+        if not os.environ.get('METRICS_DIR'):
+            os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='calculator-metrics-')
+        directory = os.environ['METRICS_DIR']
+        os.makedirs(directory, exist_ok=True)
+        # Totals start from zero with each server start
+        for path in glob.glob(os.path.join(glob.escape(directory), '*.json')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        metrics.mark_process_dead(directory, worker.pid)
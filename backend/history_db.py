@@ -1,44 +1,336 @@
 import sqlite3
 import logging
-from typing import List, Dict, Optional, Any
-from datetime import datetime
+import base64
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Any, Iterator
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+import glob
 import json
 import os
+import queue
+import re
 import threading
+import time
+import weakref
+
+import metrics
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # No cross-process spill lock (e.g. Windows, where the app runs as one process)
+    FCNTL_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection that can be tracked with a weak reference"""
+
+
+class _InternCache:
+    """Thread-safe LRU map between lookup table strings and their IDs"""
+    
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+        self._values = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get_id(self, value: str) -> Optional[int]:
+        """Return the ID of value, or None on a miss"""
+        with self._lock:
+            try:
+                value_id = self._ids[value]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(value)
+            self.hits += 1
+            return value_id
+    
+    def get_value(self, value_id: int) -> Optional[str]:
+        """Return the string with this ID, or None on a miss"""
+        with self._lock:
+            try:
+                value = self._values[value_id]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(value)
+            self.hits += 1
+            return value
+    
+    def put(self, value_id: int, value: str):
+        """Remember a lookup table row, evicting the least recently used one if full"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._ids[value] = value_id
+            self._ids.move_to_end(value)
+            self._values[value_id] = value
+            while len(self._ids) > self.maxsize:
+                _, evicted_id = self._ids.popitem(last=False)
+                del self._values[evicted_id]
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._ids.clear()
+            self._values.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._ids),
+                'maxsize': self.maxsize
+            }
+
+
+# Search terms beyond this many are ignored
+MAX_SEARCH_TERMS = 16
+
+# Full-text index over calculations (external content: the text is stored
+# once, in calculations, and the triggers keep the index in step). Shared by
+# the main database and the archive files.
+SEARCH_INDEX_SCHEMA = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS calculations_fts USING fts5(
+        expression, result, voice_input,
+        content='calculations', content_rowid='id', prefix='1 2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS calculations_fts_insert AFTER INSERT ON calculations
+    BEGIN
+        INSERT INTO calculations_fts (rowid, expression, result, voice_input)
+        VALUES (NEW.id, NEW.expression, NEW.result, NEW.voice_input);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS calculations_fts_delete AFTER DELETE ON calculations
+    BEGIN
+        INSERT INTO calculations_fts (calculations_fts, rowid, expression, result, voice_input)
+        VALUES ('delete', OLD.id, OLD.expression, OLD.result, OLD.voice_input);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS calculations_fts_update AFTER UPDATE OF expression, result, voice_input ON calculations
+    BEGIN
+        INSERT INTO calculations_fts (calculations_fts, rowid, expression, result, voice_input)
+        VALUES ('delete', OLD.id, OLD.expression, OLD.result, OLD.voice_input);
+        INSERT INTO calculations_fts (rowid, expression, result, voice_input)
+        VALUES (NEW.id, NEW.expression, NEW.result, NEW.voice_input);
+    END
+    '''
+)
+
+# Archived months live in <archive dir>/history-YYYY-MM.db
+ARCHIVE_FILE_PATTERN = re.compile(r'^history-(\d{4}-\d{2})\.db$')
+
+# Columns copied into archive files, in table order
+ARCHIVE_COLUMNS = (
+    'id, expression, result, timestamp, voice_input, session_id, error_message, '
+    'execution_time, created_at, updated_at, user_agent_id, ip_address_id'
+)
+
+# Client columns stored as IDs into a lookup table: column -> table. Records
+# returned by HistoryDB carry the strings under the column names.
+LOOKUP_TABLES = {
+    'user_agent': 'user_agents',
+    'ip_address': 'ip_addresses'
+}
+
+# Bound on the IN (...) lists used to resolve lookup table rows
+LOOKUP_CHUNK = 500
+
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS calculations (
+        id INTEGER PRIMARY KEY,
+        expression TEXT NOT NULL,
+        result TEXT NOT NULL,
+        timestamp DATETIME,
+        voice_input TEXT,
+        session_id TEXT,
+        error_message TEXT,
+        execution_time REAL,
+        created_at DATETIME,
+        updated_at DATETIME,
+        user_agent_id INTEGER,
+        ip_address_id INTEGER
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_calculations_timestamp ON calculations(timestamp, id)',
+    'CREATE INDEX IF NOT EXISTS idx_calculations_session_timestamp ON calculations(session_id, timestamp, id)'
+) + SEARCH_INDEX_SCHEMA
+
+# Tells the write-behind thread to exit once the queue is drained
+_STOP_WRITER = object()
+
+# First wait before retrying a failed write-behind batch; doubles per attempt
+WRITE_RETRY_DELAY = 0.25
+
+# How long init_db waits for another process (e.g. a sibling gunicorn
+# worker) that is creating or migrating the schema of the same file
+SCHEMA_LOCK_TIMEOUT = 600
+
+
 class HistoryDB:
     """Database manager for calculation history"""
     
-    def __init__(self, db_path: str = "calculator_history.db"):
+    # Applied to every pooled connection
+    PRAGMAS = (
+        'PRAGMA synchronous = NORMAL',     # WAL makes NORMAL crash-safe; no fsync per commit
+        'PRAGMA cache_size = -16000',      # 16 MB page cache per connection
+        'PRAGMA mmap_size = 268435456',    # Read through a 256 MB memory map
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA busy_timeout = 5000'
+    )
+    
+    def __init__(self, db_path: str = "calculator_history.db",
+                 write_behind: bool = False, batch_size: int = 500,
+                 flush_interval_ms: int = 50, max_queue_size: int = 10000,
+                 archive_dir: Optional[str] = None, archive_after_days: Optional[float] = None,
+                 archive_interval: float = 3600.0, intern_cache_size: int = 10000,
+                 write_retries: int = 5):
+        """
+        Args:
+            db_path: SQLite database file
+            write_behind: Queue inserts and write them from a background
+                thread in batches instead of committing on the caller's thread
+            batch_size: Maximum rows per write-behind commit
+            flush_interval_ms: Maximum time a queued row waits for its batch
+            max_queue_size: Queued rows before add_calculation blocks
+            archive_dir: Directory of the monthly archive files
+                (default: <db_path without extension>_archive)
+            archive_after_days: Move calculations older than this many days
+                to the archive from a background thread (None disables it)
+            archive_interval: Seconds between background archival runs
+            intern_cache_size: User agents and IP addresses each kept in
+                memory with their lookup table IDs
+            write_retries: Times a failed write-behind batch is retried
+                before its rows are saved to <db_path without extension>_unwritten.ndjson
+                (rows that can never be written go to _rejected.ndjson instead)
+        """
         self.db_path = db_path
-        self.connection = None
-        self.lock = threading.Lock()
+        self.archive_dir = archive_dir or f"{os.path.splitext(db_path)[0]}_archive"
+        self.archive_after_days = archive_after_days
+        self.archive_interval = archive_interval
+        self._archiver = None
+        self._archiver_stop = threading.Event()
+        self._interned = {column: _InternCache(intern_cache_size) for column in LOOKUP_TABLES}
+        
+        # One connection per thread; SQLite itself serializes writers, the
+        # write lock only keeps this process's writers from busy-waiting
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        self.write_lock = metrics.TimedLock()
+        
+        # Write-behind state; IDs are reserved in blocks so callers get their
+        # ID before the row is written
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.write_retries = write_retries
+        self.spill_path = f"{os.path.splitext(db_path)[0]}_unwritten.ndjson"
+        self.rejected_path = f"{os.path.splitext(db_path)[0]}_rejected.ndjson"
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._writer = None
+        self._id_lock = threading.Lock()
+        self._next_id = 0
+        self._id_limit = 0
         
         # Initialize database
         self.init_db()
+        
+        if self.write_behind:
+            self._start_writer()
+        
+        if self.archive_after_days is not None:
+            self._start_archiver()
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.generation != self._generation:
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.generation = self._generation
+        return connection
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new pooled connection"""
+        connection = sqlite3.connect(self.db_path, check_same_thread=False, factory=_Connection)
+        connection.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            connection.execute(pragma)
+        
+        with self._connections_lock:
+            self._connections.add(connection)
+        return connection
     
     def init_db(self):
         """Initialize the database and create tables"""
         try:
-            with self.lock:
-                self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-                self.connection.row_factory = sqlite3.Row
+            self._close_connections()
+            for cache in self._interned.values():
+                cache.clear()
+            
+            with self.write_lock:
+                connection = self.connection
+                connection.execute(f'PRAGMA busy_timeout = {SCHEMA_LOCK_TIMEOUT * 1000}')
+                try:
+                    # WAL lets readers proceed while a writer commits; the mode is
+                    # stored in the database file, so setting it once is enough
+                    connection.execute('PRAGMA journal_mode = WAL')
                 
-                # Create tables
-                self._create_tables()
+                    # Create tables
+                    if self._create_tables():
+                        # Hand the space the client strings took back to the file system
+                        connection.execute('VACUUM')
+                    self._migrate_archives()
+                finally:
+                    for pragma in self.PRAGMAS:
+                        connection.execute(pragma)
                 
                 logger.info(f"Database initialized: {self.db_path}")
-                
+        
         except Exception as e:
             logger.error(f"Database initialization error: {e}")
             raise
     
-    def _create_tables(self):
-        """Create database tables"""
+    def _create_tables(self) -> bool:
+        """Create database tables (returns True if client columns were migrated)"""
         cursor = self.connection.cursor()
+        # One transaction for the whole schema: a process that opens the file
+        # while another is migrating it waits here, then finds nothing to do
+        cursor.execute('BEGIN EXCLUSIVE')
+        try:
+            migrated = self._create_schema(cursor)
+        except Exception:
+            self.connection.rollback()
+            raise
         
+        self.connection.commit()
+        return migrated
+    
+    def _create_schema(self, cursor: sqlite3.Cursor) -> bool:
+        """Create or migrate every table, index and trigger in the open transaction"""
         # Calculations table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS calculations (
@@ -48,12 +340,12 @@ class HistoryDB:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                 voice_input TEXT,
                 session_id TEXT,
-                user_agent TEXT,
-                ip_address TEXT,
                 error_message TEXT,
                 execution_time REAL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                user_agent_id INTEGER REFERENCES user_agents(id),
+                ip_address_id INTEGER REFERENCES ip_addresses(id)
             )
         ''')
         
@@ -65,12 +357,22 @@ class HistoryDB:
                 start_time DATETIME DEFAULT CURRENT_TIMESTAMP,
                 end_time DATETIME,
                 calculation_count INTEGER DEFAULT 0,
-                user_agent TEXT,
-                ip_address TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                user_agent_id INTEGER REFERENCES user_agents(id),
+                ip_address_id INTEGER REFERENCES ip_addresses(id)
             )
         ''')
         
+        # User agents and IP addresses, stored once and referenced by ID
+        for column, table in LOOKUP_TABLES.items():
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    {column} TEXT UNIQUE NOT NULL
+                )
+            ''')
+        migrated = self._migrate_client_columns(cursor)
+        
         # Settings table for user preferences
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings (
@@ -85,10 +387,335 @@ class HistoryDB:
         
         # Create indexes for better performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_calculations_timestamp ON calculations(timestamp)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_calculations_session ON calculations(session_id)')
+        # Serves keyset pagination per session; supersedes the old
+        # single-column session index
+        cursor.execute('DROP INDEX IF EXISTS idx_calculations_session')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_calculations_session_timestamp ON calculations(session_id, timestamp, id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions(session_id)')
         
-        self.connection.commit()
+        # Full-text search index
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'calculations_fts'")
+        needs_rebuild = cursor.fetchone() is None
+        for statement in SEARCH_INDEX_SCHEMA:
+            cursor.execute(statement)
+        if needs_rebuild:
+            # Index rows written before the search index existed
+            cursor.execute("INSERT INTO calculations_fts (calculations_fts) VALUES ('rebuild')")
+        
+        self._create_statistics_tables(cursor)
+        return migrated
+    
+    @staticmethod
+    def _migrate_client_columns(cursor: sqlite3.Cursor, schema: str = 'main',
+                                tables=('calculations', 'sessions')) -> bool:
+        """
+        Move user agent and IP address text columns into the lookup tables
+        
+        Databases created before the lookup tables existed repeat the full
+        strings on every row. Each string is added to its lookup table and
+        the column is replaced by an ID column (the ID columns end up last,
+        as in newly created tables). schema may name an attached archive;
+        the lookup tables are always those of the main database.
+        
+        Returns:
+            True if any table was migrated
+        """
+        migrated = False
+        for table in tables:
+            columns = {row[1] for row in cursor.execute(f'PRAGMA {schema}.table_info({table})').fetchall()}
+            if not columns & set(LOOKUP_TABLES):
+                continue
+            if sqlite3.sqlite_version_info < (3, 35, 0):
+                raise RuntimeError(f"Migrating {table} needs SQLite 3.35 or later (DROP COLUMN), "
+                                   f"found {sqlite3.sqlite_version}")
+            
+            for column, lookup in LOOKUP_TABLES.items():
+                references = f' REFERENCES {lookup}(id)' if schema == 'main' else ''
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO main.{lookup} ({column})
+                    SELECT DISTINCT {column} FROM {schema}.{table} WHERE {column} IS NOT NULL
+                ''')
+                cursor.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {column}_id INTEGER{references}')
+                cursor.execute(f'''
+                    UPDATE {schema}.{table} SET {column}_id = (
+                        SELECT id FROM main.{lookup} WHERE {lookup}.{column} = {table}.{column}
+                    )
+                    WHERE {column} IS NOT NULL
+                ''')
+                cursor.execute(f'ALTER TABLE {schema}.{table} DROP COLUMN {column}')
+            
+            migrated = True
+            logger.info(f"Moved user agents and IP addresses of {schema}.{table} into lookup tables")
+        return migrated
+    
+    def _migrate_archives(self):
+        """Run the client column migration on archive files written before it (call with the write lock held)"""
+        for path in self.archive_paths():
+            archive = self._open_archive(path)
+            try:
+                columns = {row[1] for row in archive.execute('PRAGMA table_info(calculations)').fetchall()}
+            finally:
+                archive.close()
+            if not columns & set(LOOKUP_TABLES):
+                continue
+            
+            # Checked again under the lock: another process may have got there first
+            connection = self.connection
+            connection.execute('ATTACH DATABASE ? AS archive', (path,))
+            try:
+                connection.execute('BEGIN EXCLUSIVE')
+                migrated = self._migrate_client_columns(connection.cursor(), 'archive', ('calculations',))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('DETACH DATABASE archive')
+            
+            if migrated:
+                archive = self._open_archive(path, writable=True)
+                try:
+                    archive.execute(f'PRAGMA busy_timeout = {SCHEMA_LOCK_TIMEOUT * 1000}')
+                    archive.execute('VACUUM')
+                finally:
+                    archive.close()
+    
+    def _intern(self, column: str, values) -> Dict[str, int]:
+        """
+        Map user agents or IP addresses to their lookup table IDs, adding new ones
+        
+        New strings are committed on their own, before the rows that
+        reference them, so a cached ID always exists in the table. Must not
+        be called with the write lock held.
+        """
+        cache = self._interned[column]
+        ids, missing = {}, set()
+        for value in values:
+            if value is None or value in ids:
+                continue
+            value_id = cache.get_id(value)
+            if value_id is None:
+                missing.add(value)
+            else:
+                ids[value] = value_id
+        if not missing:
+            return ids
+        
+        table = LOOKUP_TABLES[column]
+        missing = list(missing)
+        with self.write_lock:
+            connection = self.connection
+            try:
+                connection.executemany(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)',
+                                       [(value,) for value in missing])
+                rows = []
+                for start in range(0, len(missing), LOOKUP_CHUNK):
+                    chunk = missing[start:start + LOOKUP_CHUNK]
+                    rows += connection.execute(
+                        f"SELECT id, {column} FROM {table} WHERE {column} IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        
+        for value_id, value in rows:
+            cache.put(value_id, value)
+            ids[value] = value_id
+        return ids
+    
+    def _encode_clients(self, rows: List[tuple], index: int) -> List[tuple]:
+        """Replace the user agent and IP address at rows[...][index:index + 2] with lookup IDs"""
+        user_agents = self._intern('user_agent', (row[index] for row in rows))
+        ip_addresses = self._intern('ip_address', (row[index + 1] for row in rows))
+        return [
+            row[:index] + (user_agents.get(row[index]), ip_addresses.get(row[index + 1])) + row[index + 2:]
+            for row in rows
+        ]
+    
+    def _decode_clients(self, rows) -> List[Dict]:
+        """Turn rows with lookup IDs into records carrying user_agent and ip_address strings"""
+        records = [dict(row) for row in rows]
+        for column, table in LOOKUP_TABLES.items():
+            id_column = f'{column}_id'
+            cache = self._interned[column]
+            values, missing = {}, set()
+            for record in records:
+                value_id = record.get(id_column)
+                if value_id is None or value_id in values or value_id in missing:
+                    continue
+                value = cache.get_value(value_id)
+                if value is None:
+                    missing.add(value_id)
+                else:
+                    values[value_id] = value
+            
+            missing = list(missing)
+            for start in range(0, len(missing), LOOKUP_CHUNK):
+                chunk = missing[start:start + LOOKUP_CHUNK]
+                for value_id, value in self.connection.execute(
+                    f"SELECT id, {column} FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    cache.put(value_id, value)
+                    values[value_id] = value
+            
+            for record in records:
+                if id_column in record:
+                    record[column] = values.get(record.pop(id_column))
+        return records
+    
+    def _create_statistics_tables(self, cursor: sqlite3.Cursor):
+        """
+        Create the materialized statistics tables and the triggers that keep them current
+        
+        get_statistics reads these instead of aggregating calculations. A
+        database created before they existed is backfilled once, in the
+        same transaction that adds the triggers.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'")
+        needs_backfill = cursor.fetchone() is None
+        
+        # Per-day rollup of calculations (days are UTC, like CURRENT_TIMESTAMP)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                day TEXT PRIMARY KEY,
+                calculations INTEGER NOT NULL DEFAULT 0,
+                voice_calculations INTEGER NOT NULL DEFAULT 0,
+                timed_calculations INTEGER NOT NULL DEFAULT 0,
+                total_execution_time REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # How often each expression has been calculated
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expression_stats (
+                expression TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expression_stats_count ON expression_stats(count DESC, expression)')
+        
+        # Table-wide totals ('calculations', 'sessions')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Holds a row only inside a write transaction that maintains the
+        # statistics itself (bulk deletes); the calculation triggers skip then
+        cursor.execute('CREATE TABLE IF NOT EXISTS stats_paused (id INTEGER PRIMARY KEY)')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS calculations_stats_insert AFTER INSERT ON calculations
+            WHEN NOT EXISTS (SELECT 1 FROM stats_paused)
+            BEGIN
+                INSERT INTO daily_stats (day, calculations, voice_calculations, timed_calculations, total_execution_time)
+                VALUES (DATE(NEW.timestamp), 1, NEW.voice_input IS NOT NULL,
+                        NEW.execution_time IS NOT NULL, COALESCE(NEW.execution_time, 0))
+                ON CONFLICT(day) DO UPDATE SET
+                    calculations = calculations + 1,
+                    voice_calculations = voice_calculations + excluded.voice_calculations,
+                    timed_calculations = timed_calculations + excluded.timed_calculations,
+                    total_execution_time = total_execution_time + excluded.total_execution_time;
+                INSERT INTO expression_stats (expression, count) VALUES (NEW.expression, 1)
+                ON CONFLICT(expression) DO UPDATE SET count = count + 1;
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'calculations';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS calculations_stats_delete AFTER DELETE ON calculations
+            WHEN NOT EXISTS (SELECT 1 FROM stats_paused)
+            BEGIN
+                UPDATE daily_stats SET
+                    calculations = calculations - 1,
+                    voice_calculations = voice_calculations - (OLD.voice_input IS NOT NULL),
+                    timed_calculations = timed_calculations - (OLD.execution_time IS NOT NULL),
+                    total_execution_time = total_execution_time - COALESCE(OLD.execution_time, 0)
+                WHERE day = DATE(OLD.timestamp);
+                UPDATE expression_stats SET count = count - 1 WHERE expression = OLD.expression;
+                DELETE FROM expression_stats WHERE expression = OLD.expression AND count <= 0;
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'calculations';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sessions_stats_insert AFTER INSERT ON sessions
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'sessions';
+            END
+        ''')
+        # INSERT OR REPLACE deletes the old row without firing delete triggers
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sessions_stats_replace BEFORE INSERT ON sessions
+            WHEN EXISTS (SELECT 1 FROM sessions WHERE session_id = NEW.session_id)
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'sessions';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sessions_stats_delete AFTER DELETE ON sessions
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'sessions';
+            END
+        ''')
+        
+        if needs_backfill:
+            self._rebuild_statistics(cursor)
+    
+    def _rebuild_statistics(self, cursor: sqlite3.Cursor):
+        """Recompute every statistics table from calculations and sessions"""
+        cursor.execute('DELETE FROM daily_stats')
+        cursor.execute('''
+            INSERT INTO daily_stats (day, calculations, voice_calculations, timed_calculations, total_execution_time)
+            SELECT DATE(timestamp), COUNT(*), COUNT(voice_input), COUNT(execution_time), COALESCE(SUM(execution_time), 0)
+            FROM calculations
+            GROUP BY DATE(timestamp)
+        ''')
+        cursor.execute('DELETE FROM expression_stats')
+        cursor.execute('''
+            INSERT INTO expression_stats (expression, count)
+            SELECT expression, COUNT(*) FROM calculations GROUP BY expression
+        ''')
+        cursor.execute('DELETE FROM stats_counters')
+        cursor.execute('''
+            INSERT INTO stats_counters (name, value)
+            VALUES ('calculations', (SELECT COUNT(*) FROM calculations)),
+                   ('sessions', (SELECT COUNT(*) FROM sessions))
+        ''')
+        
+        # Archived calculations still count
+        for path in self.archive_paths():
+            archive = self._open_archive(path)
+            try:
+                self._merge_statistics(cursor, archive)
+            finally:
+                archive.close()
+    
+    def rebuild_statistics(self):
+        """Recompute the materialized statistics from scratch (e.g. after editing the database by hand)"""
+        try:
+            with self.write_lock:
+                cursor = self.connection.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                self._rebuild_statistics(cursor)
+                self.connection.commit()
+                logger.info("Rebuilt usage statistics")
+        
+        except Exception as e:
+            logger.error(f"Error rebuilding statistics: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters of the user agent and IP address caches, combined"""
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'maxsize': 0}
+        for cache in self._interned.values():
+            for key, value in cache.stats().items():
+                stats[key] += value
+        return stats
     
     def is_connected(self) -> bool:
         """Check if database connection is active"""
@@ -117,45 +744,348 @@ class HistoryDB:
             user_agent: User agent string
             ip_address: Client IP address
             execution_time: Time taken to execute (seconds)
-            
+        
         Returns:
-            ID of the inserted record
+            ID of the inserted record (reserved but not yet written in
+            write-behind mode)
         """
+        row = (expression, str(result), voice_input, session_id, user_agent, ip_address, execution_time)
+        if self.write_behind:
+            return self._enqueue([row])[0]
+        
         try:
-            with self.lock:
+            row = self._encode_clients([row], 4)[0]
+            with self.write_lock, metrics.stage_timer('db_insert'):
                 cursor = self.connection.cursor()
                 
                 cursor.execute('''
                     INSERT INTO calculations (
                         expression, result, voice_input, session_id, 
-                        user_agent, ip_address, execution_time
+                        user_agent_id, ip_address_id, execution_time
                     ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    expression,
-                    str(result),
-                    voice_input,
-                    session_id,
-                    user_agent,
-                    ip_address,
-                    execution_time
-                ))
+                ''', row)
                 
                 calculation_id = cursor.lastrowid
-                self.connection.commit()
                 
                 # Update session calculation count
                 if session_id:
                     self._update_session_count(session_id)
                 
+                self.connection.commit()
+                
                 logger.info(f"Added calculation to history: ID {calculation_id}")
                 return calculation_id
-                
+        
         except Exception as e:
             logger.error(f"Error adding calculation to history: {e}")
             if self.connection:
                 self.connection.rollback()
             raise
     
+    def add_calculations(self, records: List[Dict[str, Any]]) -> List[int]:
+        """
+        Add many calculations to history in a single transaction
+        
+        Args:
+            records: Dicts with the same keys as add_calculation's arguments
+                (expression and result are required)
+        
+        Returns:
+            IDs of the inserted records, in input order
+        """
+        if not records:
+            return []
+        
+        rows = [(
+            record['expression'],
+            str(record['result']),
+            record.get('voice_input'),
+            record.get('session_id'),
+            record.get('user_agent'),
+            record.get('ip_address'),
+            record.get('execution_time')
+        ) for record in records]
+        
+        if self.write_behind:
+            return self._enqueue(rows)
+        
+        try:
+            rows = self._encode_clients(rows, 4)
+            with self.write_lock, metrics.stage_timer('db_insert'):
+                cursor = self.connection.cursor()
+                # IMMEDIATE holds the write lock for the whole batch, so the
+                # AUTOINCREMENT IDs handed out below are contiguous
+                cursor.execute('BEGIN IMMEDIATE')
+                
+                cursor.executemany('''
+                    INSERT INTO calculations (
+                        expression, result, voice_input, session_id, 
+                        user_agent_id, ip_address_id, execution_time
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                
+                last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+                
+                # Update session calculation counts
+                session_counts = {}
+                for row in rows:
+                    if row[3]:
+                        session_counts[row[3]] = session_counts.get(row[3], 0) + 1
+                for session_id, count in session_counts.items():
+                    self._update_session_count(session_id, count)
+                
+                self.connection.commit()
+                
+                calculation_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+                logger.info(f"Added {len(rows)} calculations to history")
+                return calculation_ids
+        
+        except Exception as e:
+            logger.error(f"Error adding calculations to history: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+    
+    def _start_writer(self):
+        """Start the background thread that drains the write-behind queue"""
+        self._writer = threading.Thread(target=self._writer_loop, name='history-writer', daemon=True)
+        self._writer.start()
+        logger.info(f"History write-behind enabled (batch {self.batch_size}, "
+                    f"{self.flush_interval * 1000:.0f} ms)")
+    
+    def _reserve_ids(self, count: int) -> List[int]:
+        """
+        Reserve calculation IDs without writing the rows
+        
+        IDs come from blocks claimed by advancing the table's AUTOINCREMENT
+        counter in sqlite_sequence, so they never collide with rows written
+        by other processes or by the synchronous path.
+        """
+        with self._id_lock:
+            if self._next_id + count > self._id_limit:
+                block = max(count, self.batch_size)
+                with self.write_lock:
+                    connection = self.connection
+                    try:
+                        connection.execute('BEGIN IMMEDIATE')
+                        row = connection.execute(
+                            "SELECT seq FROM sqlite_sequence WHERE name = 'calculations'"
+                        ).fetchone()
+                        if row is None:
+                            start = connection.execute('SELECT COALESCE(MAX(id), 0) FROM calculations').fetchone()[0]
+                            connection.execute(
+                                "INSERT INTO sqlite_sequence (name, seq) VALUES ('calculations', ?)",
+                                (start + block,)
+                            )
+                        else:
+                            start = row[0]
+                            connection.execute(
+                                "UPDATE sqlite_sequence SET seq = ? WHERE name = 'calculations'",
+                                (start + block,)
+                            )
+                        connection.commit()
+                    except Exception:
+                        connection.rollback()
+                        raise
+                self._next_id, self._id_limit = start + 1, start + block + 1
+            
+            ids = list(range(self._next_id, self._next_id + count))
+            self._next_id += count
+            return ids
+    
+    def _enqueue(self, rows: List[tuple]) -> List[int]:
+        """Reserve IDs for rows and hand them to the write-behind thread"""
+        ids = self._reserve_ids(len(rows))
+        # Stamp rows now so history order reflects request time, not write time
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        for calculation_id, row in zip(ids, rows):
+            self._queue.put((calculation_id,) + row + (timestamp,))
+        return ids
+    
+    def _writer_loop(self):
+        """Drain the queue in batches of up to batch_size rows or flush_interval seconds"""
+        self._replay_spilled()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP_WRITER:
+                self._queue.task_done()
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP_WRITER:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _write_batch(self, batch: List[tuple], replay: bool = False):
+        """
+        Write a batch of queued rows, retrying with backoff while the database is busy
+        
+        The rows' IDs have already been handed out, so a batch that still
+        cannot be written is saved to spill_path rather than dropped. A
+        batch that fails for any other reason is written row by row, so
+        one bad row only costs itself (it is kept in rejected_path).
+        
+        Args:
+            batch: Queued rows
+            replay: Rows may already have been written (by an earlier replay)
+        """
+        for attempt in range(self.write_retries + 1):
+            try:
+                self._insert_batch(batch, replay)
+                return
+            except sqlite3.OperationalError as e:
+                error = e
+                if attempt < self.write_retries:
+                    delay = WRITE_RETRY_DELAY * 2 ** attempt
+                    logger.warning(f"Error writing {len(batch)} queued calculations: {e}; "
+                                   f"retrying in {delay:.2f}s")
+                    time.sleep(delay)
+            except Exception as e:
+                # Not something waiting will fix
+                if len(batch) > 1:
+                    logger.warning(f"Error writing {len(batch)} queued calculations: {e}; "
+                                   f"writing them one at a time")
+                    for row in batch:
+                        self._write_batch([row], replay)
+                    return
+                self._spill(batch, e, self.rejected_path)
+                return
+        
+        self._spill(batch, error, self.spill_path)
+    
+    @contextmanager
+    def _spill_lock(self):
+        """Serialize spill file access with the other processes using this database"""
+        with open(f"{self.spill_path}.lock", 'a') as lock_file:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Closing the file releases the lock
+            yield
+    
+    def _spill(self, batch: List[tuple], error: Exception, path: str):
+        """Append rows that could not be written to path (spill_path is replayed on the next start)"""
+        try:
+            with self._spill_lock(), open(path, 'a', encoding='utf-8') as f:
+                for row in batch:
+                    f.write(json.dumps(row) + '\n')
+            logger.error(f"Could not write {len(batch)} queued calculations ({error}); "
+                         f"saved them to {path}")
+        except Exception as e:
+            logger.critical(f"Lost {len(batch)} queued calculations (IDs {batch[0][0]}-{batch[-1][0]}): "
+                            f"{error}; saving them failed: {e}")
+    
+    def _replay_spilled(self):
+        """
+        Write rows saved by _spill, in this or another process
+        
+        The spill file is claimed by renaming it under the spill lock, so
+        rows spilled meanwhile start a new file. Claimed files stay locked
+        while they are written and are then removed; one left by a crashed
+        replay is picked up again, which is safe because replayed rows that
+        already exist are skipped.
+        """
+        try:
+            with self._spill_lock():
+                if os.path.exists(self.spill_path):
+                    os.replace(self.spill_path, f"{self.spill_path}.{os.getpid()}.replaying")
+        except OSError as e:
+            logger.error(f"Error claiming unwritten calculations in {self.spill_path}: {e}")
+            return
+        
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*.replaying"):
+            try:
+                f = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with f:
+                if FCNTL_AVAILABLE:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # Another process is replaying it
+                        continue
+                if not os.path.exists(path):
+                    # Another process finished replaying it
+                    continue
+                try:
+                    rows = [tuple(json.loads(line)) for line in f if line.strip()]
+                except Exception as e:
+                    logger.error(f"Error reading unwritten calculations from {path}: {e}")
+                    continue
+                
+                logger.info(f"Writing {len(rows)} calculations saved by an earlier run")
+                for start in range(0, len(rows), self.batch_size):
+                    self._write_batch(rows[start:start + self.batch_size], replay=True)
+                os.remove(path)
+    
+    def _insert_batch(self, batch: List[tuple], replay: bool = False):
+        """
+        Insert a batch of queued rows with one executemany and one commit
+        
+        With replay, rows whose ID already exists are skipped, in the same
+        transaction, and not counted again in the session counters.
+        """
+        try:
+            batch = self._encode_clients(batch, 5)
+            with self.write_lock, metrics.stage_timer('db_write_batch'):
+                cursor = self.connection.cursor()
+                if replay:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    existing = {row[0] for row in cursor.execute(
+                        f"SELECT id FROM calculations WHERE id IN ({','.join('?' * len(batch))})",
+                        [row[0] for row in batch]
+                    )}
+                    batch = [row for row in batch if row[0] not in existing]
+                cursor.executemany('''
+                    INSERT INTO calculations (
+                        id, expression, result, voice_input, session_id, 
+                        user_agent_id, ip_address_id, execution_time, timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', batch)
+                
+                session_counts = {}
+                for row in batch:
+                    if row[4]:
+                        session_counts[row[4]] = session_counts.get(row[4], 0) + 1
+                for session_id, count in session_counts.items():
+                    self._update_session_count(session_id, count)
+                
+                self.connection.commit()
+                logger.debug(f"Wrote {len(batch)} queued calculations")
+        
+        except Exception:
+            if self.connection:
+                self.connection.rollback()
+            raise
+    
+    @property
+    def pending_writes(self) -> int:
+        """Calculations queued but not yet written (always 0 without write-behind)"""
+        return self._queue.qsize() if self.write_behind else 0
+    
+    def flush(self):
+        """Block until every queued calculation has been written"""
+        if self.write_behind:
+            self._queue.join()
+    
     def get_history(self, page: int = 1, limit: int = 50, 
                    session_id: Optional[str] = None) -> List[Dict]:
         """
@@ -165,49 +1095,200 @@ class HistoryDB:
             page: Page number (1-based)
             limit: Number of records per page
             session_id: Filter by session ID
-            
+        
         Returns:
             List of calculation records
         """
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                offset = (page - 1) * limit
+            offset = (page - 1) * limit
+            conditions, params = (['session_id = ?'], [session_id]) if session_id else ([], [])
+            
+            history, oldest = [], None
+            for connection in self._partitions():
+                where, args = self._where(conditions + ['(timestamp, id) < (?, ?)'] if oldest else conditions,
+                                          params + list(oldest or ()))
+                with self._snapshot(connection):
+                    # Skip whole partitions that lie before the requested page
+                    if offset:
+                        count = connection.execute(f'SELECT COUNT(*) FROM calculations {where}', args).fetchone()[0]
+                        if count <= offset:
+                            offset -= count
+                            oldest = self._oldest_key(connection, where, args) or oldest
+                            continue
                 
-                if session_id:
-                    cursor.execute('''
+                    rows = connection.execute(f'''
                         SELECT * FROM calculations 
-                        WHERE session_id = ?
-                        ORDER BY timestamp DESC 
+                        {where}
+                        ORDER BY timestamp DESC, id DESC
                         LIMIT ? OFFSET ?
-                    ''', (session_id, limit, offset))
-                else:
-                    cursor.execute('''
-                        SELECT * FROM calculations 
-                        ORDER BY timestamp DESC 
-                        LIMIT ? OFFSET ?
-                    ''', (limit, offset))
-                
-                rows = cursor.fetchall()
-                return [dict(row) for row in rows]
-                
+                    ''', args + [limit - len(history), offset]).fetchall()
+                offset = 0
+                history.extend(self._decode_clients(rows))
+                if len(history) >= limit:
+                    break
+                oldest = (history[-1]['timestamp'], history[-1]['id'])
+            
+            return history
+        
         except Exception as e:
             logger.error(f"Error retrieving history: {e}")
             return []
     
+    def get_history_page(self, limit: int = 50, cursor: Optional[str] = None,
+                         session_id: Optional[str] = None,
+                         include_total: bool = False) -> Dict[str, Any]:
+        """
+        Get one page of calculation history using keyset pagination
+        
+        Pages are ordered newest first by (timestamp, id) and seek past the
+        last row of the previous page, so deep pages cost the same as the
+        first. Pages continue from the main table into the archive.
+        
+        Args:
+            limit: Number of records per page
+            cursor: next_cursor from the previous page (None for the first page)
+            session_id: Filter by session ID
+            include_total: Also run an exact COUNT(*) of matching records
+        
+        Returns:
+            Dict with 'history', 'next_cursor' (None on the last page) and,
+            when requested, 'total'
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        conditions, params = [], []
+        if session_id:
+            conditions.append('session_id = ?')
+            params.append(session_id)
+        if cursor:
+            conditions.append('(timestamp, id) < (?, ?)')
+            params.extend(self._decode_cursor(cursor))
+        
+        page = self._page_across_partitions('''
+            SELECT * FROM calculations
+            {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', conditions, params, limit, before=params[-2] if cursor else None)
+        if include_total:
+            page['total'] = self.get_history_count(session_id=session_id)
+        return page
+    
+    def _page_across_partitions(self, sql: str, conditions: List[str], params: List, limit: int,
+                                before: Optional[str] = None, prefix: str = '') -> Dict[str, Any]:
+        """
+        Collect up to limit rows of a newest-first query from each partition in turn
+        
+        sql has a {where} placeholder for the conditions and must end in
+        "LIMIT ?"; one extra row tells us whether another page exists.
+        Later partitions continue strictly below the last row collected, so
+        a row archived while the page is read is not returned twice.
+        """
+        history = []
+        for connection in self._partitions(before):
+            bound = [f'({prefix}timestamp, {prefix}id) < (?, ?)'] if history else []
+            where, args = self._where(conditions + bound,
+                                      params + ([history[-1]['timestamp'], history[-1]['id']] if history else []))
+            rows = connection.execute(sql.format(where=where), args + [limit + 1 - len(history)]).fetchall()
+            history.extend(self._decode_clients(rows))
+            if len(history) > limit:
+                break
+        
+        return {
+            'history': history[:limit],
+            'next_cursor': self._encode_cursor(history[limit - 1]) if len(history) > limit else None
+        }
+    
+    @staticmethod
+    def _encode_cursor(row: Dict) -> str:
+        """Encode a row's (timestamp, id) sort key as an opaque cursor"""
+        key = json.dumps([row['timestamp'], row['id']], separators=(',', ':'))
+        return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> List:
+        """Decode a cursor produced by _encode_cursor"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, calculation_id = json.loads(base64.urlsafe_b64decode(padded))
+            return [str(timestamp), int(calculation_id)]
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    def search_history(self, query: str, limit: int = 50, cursor: Optional[str] = None,
+                       session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Full-text search of expressions, results and voice input
+        
+        Every word of the query must match the start of a word in the
+        record ("sq 16" finds "sqrt(16)"). Matches are paged newest first,
+        archive included, with the same keyset cursors as get_history_page.
+        
+        Args:
+            query: Words to search for
+            limit: Number of records per page
+            cursor: next_cursor from the previous page (None for the first page)
+            session_id: Filter by session ID
+        
+        Returns:
+            Dict with 'history' and 'next_cursor' (None on the last page)
+        
+        Raises:
+            ValueError: If the query has no searchable words or the cursor is malformed
+        """
+        conditions, params = ['calculations_fts MATCH ?'], [self._fts_query(query)]
+        if session_id:
+            conditions.append('c.session_id = ?')
+            params.append(session_id)
+        if cursor:
+            conditions.append('(c.timestamp, c.id) < (?, ?)')
+            params.extend(self._decode_cursor(cursor))
+        
+        # Archive files carry their own search index
+        return self._page_across_partitions('''
+            SELECT c.* FROM calculations_fts
+            JOIN calculations c ON c.id = calculations_fts.rowid
+            {where}
+            ORDER BY c.timestamp DESC, c.id DESC
+            LIMIT ?
+        ''', conditions, params, limit, before=params[-2] if cursor else None, prefix='c.')
+    
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query of quoted prefix terms (all required)"""
+        terms = re.findall(r'\w+', text or '')[:MAX_SEARCH_TERMS]
+        if not terms:
+            raise ValueError("Search query must contain a letter or digit")
+        return ' '.join(f'"{term}"*' for term in terms)
+    
+    def rebuild_search_index(self):
+        """Rebuild the full-text index from the calculations table"""
+        try:
+            with self.write_lock:
+                self.connection.execute("INSERT INTO calculations_fts (calculations_fts) VALUES ('rebuild')")
+                self.connection.commit()
+                logger.info("Rebuilt history search index")
+        
+        except Exception as e:
+            logger.error(f"Error rebuilding search index: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+    
     def get_history_count(self, session_id: Optional[str] = None) -> int:
-        """Get total number of calculations in history"""
+        """Get total number of calculations in history (archive included)"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                
-                if session_id:
-                    cursor.execute('SELECT COUNT(*) FROM calculations WHERE session_id = ?', (session_id,))
-                else:
-                    cursor.execute('SELECT COUNT(*) FROM calculations')
-                
-                return cursor.fetchone()[0]
-                
+            if not session_id:
+                row = self.connection.execute(
+                    "SELECT value FROM stats_counters WHERE name = 'calculations'"
+                ).fetchone()
+                return row[0] if row else 0
+            
+            return sum(
+                row[0] for row in self._aggregate_partitions('COUNT(*)', ['session_id = ?'], [session_id])
+            )
+        
         except Exception as e:
             logger.error(f"Error getting history count: {e}")
             return 0
@@ -215,13 +1296,12 @@ class HistoryDB:
     def get_calculation(self, calculation_id: int) -> Optional[Dict]:
         """Get a specific calculation by ID"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                cursor.execute('SELECT * FROM calculations WHERE id = ?', (calculation_id,))
-                
-                row = cursor.fetchone()
-                return dict(row) if row else None
-                
+            for connection in self._partitions():
+                row = connection.execute('SELECT * FROM calculations WHERE id = ?', (calculation_id,)).fetchone()
+                if row:
+                    return self._decode_clients([row])[0]
+            return None
+        
         except Exception as e:
             logger.error(f"Error retrieving calculation {calculation_id}: {e}")
             return None
@@ -229,18 +1309,21 @@ class HistoryDB:
     def delete_calculation(self, calculation_id: int) -> bool:
         """Delete a specific calculation"""
         try:
-            with self.lock:
+            with self.write_lock:
                 cursor = self.connection.cursor()
                 cursor.execute('DELETE FROM calculations WHERE id = ?', (calculation_id,))
                 
                 deleted = cursor.rowcount > 0
                 self.connection.commit()
                 
+                if not deleted:
+                    deleted = self._delete_archived('id = ?', (calculation_id,)) > 0
+                
                 if deleted:
                     logger.info(f"Deleted calculation ID {calculation_id}")
                 
                 return deleted
-                
+        
         except Exception as e:
             logger.error(f"Error deleting calculation {calculation_id}: {e}")
             if self.connection:
@@ -250,34 +1333,75 @@ class HistoryDB:
     def clear_history(self, session_id: Optional[str] = None):
         """Clear calculation history"""
         try:
-            with self.lock:
+            with self.write_lock:
                 cursor = self.connection.cursor()
                 
                 if session_id:
                     cursor.execute('DELETE FROM calculations WHERE session_id = ?', (session_id,))
+                    self.connection.commit()
+                    self._delete_archived('session_id = ?', (session_id,))
                     logger.info(f"Cleared history for session {session_id}")
                 else:
+                    # Per-row trigger upkeep is wasted work when everything goes
+                    cursor.execute('INSERT INTO stats_paused (id) VALUES (1)')
                     cursor.execute('DELETE FROM calculations')
+                    cursor.execute('DELETE FROM stats_paused')
+                    cursor.execute('DELETE FROM daily_stats')
+                    cursor.execute('DELETE FROM expression_stats')
+                    cursor.execute("UPDATE stats_counters SET value = 0 WHERE name = 'calculations'")
+                    self.connection.commit()
+                    for path in self.archive_paths():
+                        os.remove(path)
                     logger.info("Cleared all calculation history")
                 
                 self.connection.commit()
-                
+        
         except Exception as e:
             logger.error(f"Error clearing history: {e}")
             if self.connection:
                 self.connection.rollback()
             raise
     
-    def get_all_history(self) -> List[Dict]:
+    def iter_history(self, session_id: Optional[str] = None,
+                     chunk_size: int = 1000) -> Iterator[Dict]:
+        """
+        Iterate over calculation history, newest first, in bounded chunks
+        
+        Rows are fetched chunk_size at a time from one read transaction per
+        partition (the main table, then each archived month), so memory use
+        does not grow with the size of the history. Each partition continues
+        below the last row yielded, so rows archived meanwhile are skipped.
+        
+        Args:
+            session_id: Filter by session ID
+            chunk_size: Rows fetched from SQLite per round trip
+        
+        Yields:
+            Calculation records
+        """
+        conditions, params = (['session_id = ?'], [session_id]) if session_id else ([], [])
+        last = None
+        for connection in self._partitions():
+            where, args = self._where(conditions + ['(timestamp, id) < (?, ?)'] if last else conditions,
+                                      params + list(last or ()))
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f'SELECT * FROM calculations {where} ORDER BY timestamp DESC, id DESC', args)
+                
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    last = (rows[-1]['timestamp'], rows[-1]['id'])
+                    yield from self._decode_clients(rows)
+            finally:
+                cursor.close()
+    
+    def get_all_history(self, session_id: Optional[str] = None) -> List[Dict]:
         """Get all calculation history (for export)"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                cursor.execute('SELECT * FROM calculations ORDER BY timestamp DESC')
-                
-                rows = cursor.fetchall()
-                return [dict(row) for row in rows]
-                
+            return list(self.iter_history(session_id=session_id))
+        
         except Exception as e:
             logger.error(f"Error retrieving all history: {e}")
             return []
@@ -286,57 +1410,57 @@ class HistoryDB:
                       ip_address: Optional[str] = None) -> bool:
         """Create a new session"""
         try:
-            with self.lock:
+            row = self._encode_clients([(session_id, user_agent, ip_address)], 1)[0]
+            with self.write_lock:
                 cursor = self.connection.cursor()
                 cursor.execute('''
-                    INSERT OR REPLACE INTO sessions (session_id, user_agent, ip_address)
+                    INSERT OR REPLACE INTO sessions (session_id, user_agent_id, ip_address_id)
                     VALUES (?, ?, ?)
-                ''', (session_id, user_agent, ip_address))
+                ''', row)
                 
                 self.connection.commit()
                 logger.info(f"Created session: {session_id}")
                 return True
-                
+        
         except Exception as e:
             logger.error(f"Error creating session: {e}")
             if self.connection:
                 self.connection.rollback()
             return False
     
-    def _update_session_count(self, session_id: str):
+    def _update_session_count(self, session_id: str, count: int = 1):
         """Update calculation count for a session"""
         try:
             cursor = self.connection.cursor()
             cursor.execute('''
                 UPDATE sessions 
-                SET calculation_count = calculation_count + 1,
+                SET calculation_count = calculation_count + ?,
                     end_time = CURRENT_TIMESTAMP
                 WHERE session_id = ?
-            ''', (session_id,))
-            
+            ''', (count, session_id))
+        
         except Exception as e:
             logger.error(f"Error updating session count: {e}")
     
     def get_session_stats(self, session_id: str) -> Optional[Dict]:
         """Get statistics for a session"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                cursor.execute('''
-                    SELECT 
-                        s.*,
-                        COUNT(c.id) as actual_calculation_count,
-                        MIN(c.timestamp) as first_calculation,
-                        MAX(c.timestamp) as last_calculation
-                    FROM sessions s
-                    LEFT JOIN calculations c ON s.session_id = c.session_id
-                    WHERE s.session_id = ?
-                    GROUP BY s.id
-                ''', (session_id,))
-                
-                row = cursor.fetchone()
-                return dict(row) if row else None
-                
+            row = self.connection.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            if row is None:
+                return None
+            
+            stats = self._decode_clients([row])[0]
+            count, first, last = 0, None, None
+            for partition_count, partition_first, partition_last in self._aggregate_partitions(
+                    'COUNT(*), MIN(timestamp), MAX(timestamp)', ['session_id = ?'], [session_id]):
+                if partition_count:
+                    count += partition_count
+                    first = partition_first if first is None else min(first, partition_first)
+                    last = partition_last if last is None else max(last, partition_last)
+            
+            stats.update(actual_calculation_count=count, first_calculation=first, last_calculation=last)
+            return stats
+        
         except Exception as e:
             logger.error(f"Error getting session stats: {e}")
             return None
@@ -344,24 +1468,23 @@ class HistoryDB:
     def get_settings(self, session_id: Optional[str] = None) -> Dict:
         """Get user settings"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                
-                if session_id:
-                    cursor.execute('SELECT key, value FROM settings WHERE session_id = ? OR session_id IS NULL', (session_id,))
-                else:
-                    cursor.execute('SELECT key, value FROM settings WHERE session_id IS NULL')
-                
-                rows = cursor.fetchall()
-                settings = {}
-                for row in rows:
-                    try:
-                        settings[row['key']] = json.loads(row['value'])
-                    except json.JSONDecodeError:
-                        settings[row['key']] = row['value']
-                
-                return settings
-                
+            cursor = self.connection.cursor()
+            
+            if session_id:
+                cursor.execute('SELECT key, value FROM settings WHERE session_id = ? OR session_id IS NULL', (session_id,))
+            else:
+                cursor.execute('SELECT key, value FROM settings WHERE session_id IS NULL')
+            
+            rows = cursor.fetchall()
+            settings = {}
+            for row in rows:
+                try:
+                    settings[row['key']] = json.loads(row['value'])
+                except json.JSONDecodeError:
+                    settings[row['key']] = row['value']
+            
+            return settings
+        
         except Exception as e:
             logger.error(f"Error retrieving settings: {e}")
             return {}
@@ -369,7 +1492,7 @@ class HistoryDB:
     def set_setting(self, key: str, value: Any, session_id: Optional[str] = None) -> bool:
         """Set a user setting"""
         try:
-            with self.lock:
+            with self.write_lock:
                 cursor = self.connection.cursor()
                 
                 # Convert value to JSON string if it's not a string
@@ -385,7 +1508,7 @@ class HistoryDB:
                 
                 self.connection.commit()
                 return True
-                
+        
         except Exception as e:
             logger.error(f"Error setting {key}: {e}")
             if self.connection:
@@ -393,73 +1516,379 @@ class HistoryDB:
             return False
     
     def get_statistics(self) -> Dict:
-        """Get database statistics"""
+        """Get database statistics (read from the materialized statistics tables)"""
         try:
-            with self.lock:
-                cursor = self.connection.cursor()
-                
-                # Get total calculations
-                cursor.execute('SELECT COUNT(*) FROM calculations')
-                total_calculations = cursor.fetchone()[0]
-                
-                # Get calculations today
-                cursor.execute('''
-                    SELECT COUNT(*) FROM calculations 
-                    WHERE DATE(timestamp) = DATE('now')
-                ''')
-                today_calculations = cursor.fetchone()[0]
-                
-                # Get total sessions
-                cursor.execute('SELECT COUNT(*) FROM sessions')
-                total_sessions = cursor.fetchone()[0]
-                
-                # Get most used expressions
-                cursor.execute('''
-                    SELECT expression, COUNT(*) as count 
-                    FROM calculations 
-                    GROUP BY expression 
-                    ORDER BY count DESC 
-                    LIMIT 10
-                ''')
-                popular_expressions = [dict(row) for row in cursor.fetchall()]
-                
-                return {
-                    'total_calculations': total_calculations,
-                    'today_calculations': today_calculations,
-                    'total_sessions': total_sessions,
-                    'popular_expressions': popular_expressions,
-                    'database_size': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
-                }
-                
+            cursor = self.connection.cursor()
+            
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            total_calculations = counters.get('calculations', 0)
+            total_sessions = counters.get('sessions', 0)
+            
+            # Get calculations today
+            cursor.execute("SELECT calculations FROM daily_stats WHERE day = DATE('now')")
+            row = cursor.fetchone()
+            today_calculations = row['calculations'] if row else 0
+            
+            # Get most used expressions
+            cursor.execute('''
+                SELECT expression, count
+                FROM expression_stats
+                ORDER BY count DESC, expression
+                LIMIT 10
+            ''')
+            popular_expressions = [dict(row) for row in cursor.fetchall()]
+            
+            archive_paths = self.archive_paths()
+            return {
+                'total_calculations': total_calculations,
+                'today_calculations': today_calculations,
+                'total_sessions': total_sessions,
+                'popular_expressions': popular_expressions,
+                'database_size': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+                'archive_size': sum(os.path.getsize(path) for path in archive_paths),
+                'archived_months': len(archive_paths)
+            }
+        
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
             return {}
     
+    def get_daily_statistics(self, days: int = 30) -> List[Dict]:
+        """
+        Get the per-day rollup for the most recent days, newest first
+        
+        Args:
+            days: Number of days (counting today) to return
+        
+        Returns:
+            Dicts with day, calculations, voice_calculations and
+            average_execution_time; days without calculations are omitted
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT day, calculations, voice_calculations,
+                       total_execution_time / NULLIF(timed_calculations, 0) AS average_execution_time
+                FROM daily_stats
+                WHERE day > DATE('now', ?) AND calculations > 0
+                ORDER BY day DESC
+            ''', (f'-{int(days)} days',))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        except Exception as e:
+            logger.error(f"Error getting daily statistics: {e}")
+            return []
+    
     def backup_database(self, backup_path: str) -> bool:
-        """Create a backup of the database"""
+        """Create a backup of the database (archive files go to <backup_path without extension>_archive)"""
         try:
-            with self.lock:
-                # Create backup directory if it doesn't exist
-                os.makedirs(os.path.dirname(backup_path), exist_ok=True)
-                
-                # Copy database file
-                import shutil
-                shutil.copy2(self.db_path, backup_path)
-                
-                logger.info(f"Database backed up to: {backup_path}")
-                return True
-                
+            # Create backup directory if it doesn't exist
+            os.makedirs(os.path.dirname(backup_path) or '.', exist_ok=True)
+            
+            # The online backup API includes pages still in the WAL file,
+            # which a plain file copy would miss
+            backup = sqlite3.connect(backup_path)
+            try:
+                self.connection.backup(backup)
+            finally:
+                backup.close()
+            
+            archive_paths = self.archive_paths()
+            if archive_paths:
+                backup_archive_dir = f"{os.path.splitext(backup_path)[0]}_archive"
+                os.makedirs(backup_archive_dir, exist_ok=True)
+                for path in archive_paths:
+                    source = self._open_archive(path)
+                    backup = sqlite3.connect(os.path.join(backup_archive_dir, os.path.basename(path)))
+                    try:
+                        source.backup(backup)
+                    finally:
+                        backup.close()
+                        source.close()
+            
+            logger.info(f"Database backed up to: {backup_path}")
+            return True
+        
         except Exception as e:
             logger.error(f"Error backing up database: {e}")
             return False
     
+    def archive_paths(self, before: Optional[str] = None) -> List[str]:
+        """
+        Archive files, newest month first
+        
+        Args:
+            before: Only months that start before this timestamp
+        """
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return []
+        
+        paths = []
+        for name in sorted(names, reverse=True):
+            match = ARCHIVE_FILE_PATTERN.match(name)
+            if match and (before is None or match.group(1) <= before[:7]):
+                paths.append(os.path.join(self.archive_dir, name))
+        return paths
+    
+    def _open_archive(self, path: str, writable: bool = False) -> sqlite3.Connection:
+        """Open an archive file (read-only unless writable)"""
+        if writable:
+            connection = sqlite3.connect(path, check_same_thread=False)
+        else:
+            uri = f"file:{quote(os.path.abspath(path))}?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        return connection
+    
+    def _partitions(self, before: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+        """
+        Connections to read history from, newest rows first: the main
+        database, then each archived month (skipping months after before)
+        
+        Archive connections are closed as the iteration moves past them.
+        """
+        yield self.connection
+        for path in self.archive_paths(before):
+            connection = self._open_archive(path)
+            try:
+                yield connection
+            finally:
+                connection.close()
+    
+    @staticmethod
+    def _where(conditions: List[str], params: List) -> tuple:
+        """Build a WHERE clause (empty without conditions) and its parameters"""
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else '', params)
+    
+    @staticmethod
+    def _oldest_key(connection: sqlite3.Connection, where: str, params: List) -> Optional[tuple]:
+        """(timestamp, id) of the oldest matching row in one partition"""
+        row = connection.execute(
+            f'SELECT timestamp, id FROM calculations {where} ORDER BY timestamp, id LIMIT 1', params
+        ).fetchone()
+        return tuple(row) if row else None
+    
+    @staticmethod
+    @contextmanager
+    def _snapshot(connection: sqlite3.Connection):
+        """Run several reads on one connection against a single snapshot"""
+        if connection.in_transaction:
+            yield
+            return
+        connection.execute('BEGIN')
+        try:
+            yield
+        finally:
+            connection.commit()
+    
+    def _aggregate_partitions(self, columns: str, conditions: List[str], params: List) -> Iterator[sqlite3.Row]:
+        """
+        Aggregate matching calculations in each partition, newest first
+        
+        Archives only count rows older than every row already seen, so a
+        row the archiver moves between partitions is not counted twice.
+        """
+        oldest = None
+        for connection in self._partitions():
+            where, args = self._where(conditions + ['(timestamp, id) < (?, ?)'] if oldest else conditions,
+                                      params + list(oldest or ()))
+            with self._snapshot(connection):
+                row = connection.execute(f'SELECT {columns} FROM calculations {where}', args).fetchone()
+                oldest = self._oldest_key(connection, where, args) or oldest
+            yield row
+    
+    def archive_history(self, older_than_days: float, batch_size: int = 10000) -> int:
+        """
+        Move calculations older than older_than_days into monthly archive files
+        
+        Rows go to <archive_dir>/history-YYYY-MM.db, a SQLite file with the
+        calculations columns and its own search index, attached to the main
+        connection while rows are copied and deleted. Reads (history pages,
+        search, export) continue into the archive transparently, and the
+        usage statistics keep counting archived rows.
+        
+        Args:
+            older_than_days: Age, in days, beyond which calculations are archived
+            batch_size: Rows moved per transaction, so writers are not held up
+        
+        Returns:
+            Number of calculations archived
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        os.makedirs(self.archive_dir, exist_ok=True)
+        
+        archived = 0
+        while True:
+            oldest = self.connection.execute('SELECT MIN(timestamp) FROM calculations').fetchone()[0]
+            if oldest is None or oldest >= cutoff:
+                break
+            
+            # Everything older than the end of the oldest month (or the cutoff) lies in that month
+            year, month = int(oldest[:4]), int(oldest[5:7])
+            month_end = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01 00:00:00"
+            path = os.path.join(self.archive_dir, f"history-{oldest[:7]}.db")
+            archived += self._move_to_archive(path, min(cutoff, month_end), batch_size)
+        
+        if archived:
+            logger.info(f"Archived {archived} calculations older than {cutoff}")
+        return archived
+    
+    def _move_to_archive(self, path: str, before: str, batch_size: int) -> int:
+        """Move the calculations older than before into one archive file"""
+        archive = self._open_archive(path, writable=True)
+        try:
+            for statement in ARCHIVE_SCHEMA:
+                archive.execute(statement)
+            archive.commit()
+        finally:
+            archive.close()
+        
+        moved = 0
+        while True:
+            with self.write_lock:
+                connection = self.connection
+                connection.execute('ATTACH DATABASE ? AS archive', (path,))
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    batch = '''
+                        SELECT id FROM main.calculations WHERE timestamp < ?
+                        ORDER BY timestamp, id LIMIT ?
+                    '''
+                    connection.execute(f'''
+                        INSERT OR IGNORE INTO archive.calculations ({ARCHIVE_COLUMNS})
+                        SELECT {ARCHIVE_COLUMNS} FROM main.calculations WHERE id IN ({batch})
+                    ''', (before, batch_size))
+                    # Moving rows is not deleting them: keep them in the statistics
+                    connection.execute('INSERT INTO main.stats_paused (id) VALUES (1)')
+                    count = connection.execute(
+                        f'DELETE FROM main.calculations WHERE id IN ({batch})', (before, batch_size)
+                    ).rowcount
+                    connection.execute('DELETE FROM main.stats_paused')
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                finally:
+                    connection.execute('DETACH DATABASE archive')
+            
+            moved += count
+            if count < batch_size:
+                return moved
+    
+    def _delete_archived(self, where: str, params: tuple) -> int:
+        """
+        Delete matching calculations from every archive file (call with the write lock held)
+        
+        Archived rows have no triggers in the main database, so their
+        statistics are discounted here, in the same transaction as the
+        delete. Archives without a match are only opened read-only.
+        """
+        deleted = 0
+        for path in self.archive_paths():
+            archive = self._open_archive(path)
+            try:
+                found = archive.execute(f'SELECT 1 FROM calculations WHERE {where} LIMIT 1', params).fetchone()
+            finally:
+                archive.close()
+            if not found:
+                continue
+            
+            connection = self.connection
+            connection.execute('ATTACH DATABASE ? AS archive', (path,))
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                self._merge_statistics(connection.cursor(), connection, where, params, sign=-1,
+                                       table='archive.calculations')
+                deleted += connection.execute(f'DELETE FROM archive.calculations WHERE {where}', params).rowcount
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('DETACH DATABASE archive')
+        return deleted
+    
+    @staticmethod
+    def _merge_statistics(cursor: sqlite3.Cursor, archive: sqlite3.Connection,
+                          where: str = '1', params: tuple = (), sign: int = 1,
+                          table: str = 'calculations'):
+        """Add (sign=1) or subtract (sign=-1) the matching archived rows to the statistics tables"""
+        days = archive.execute(f'''
+            SELECT DATE(timestamp), COUNT(*), COUNT(voice_input), COUNT(execution_time),
+                   COALESCE(SUM(execution_time), 0)
+            FROM {table} WHERE {where}
+            GROUP BY DATE(timestamp)
+        ''', params).fetchall()
+        if not days:
+            return
+        
+        cursor.executemany('''
+            INSERT INTO daily_stats (day, calculations, voice_calculations, timed_calculations, total_execution_time)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                calculations = calculations + excluded.calculations,
+                voice_calculations = voice_calculations + excluded.voice_calculations,
+                timed_calculations = timed_calculations + excluded.timed_calculations,
+                total_execution_time = total_execution_time + excluded.total_execution_time
+        ''', [(day, sign * count, sign * voice, sign * timed, sign * seconds)
+              for day, count, voice, timed, seconds in days])
+        
+        expressions = archive.execute(
+            f'SELECT expression, COUNT(*) FROM {table} WHERE {where} GROUP BY expression', params
+        ).fetchall()
+        cursor.executemany('''
+            INSERT INTO expression_stats (expression, count) VALUES (?, ?)
+            ON CONFLICT(expression) DO UPDATE SET count = count + excluded.count
+        ''', [(expression, sign * count) for expression, count in expressions])
+        cursor.execute('DELETE FROM expression_stats WHERE count <= 0')
+        
+        cursor.execute(
+            "UPDATE stats_counters SET value = value + ? WHERE name = 'calculations'",
+            (sign * sum(day[1] for day in days),)
+        )
+    
+    def _start_archiver(self):
+        """Start the background thread that archives old calculations"""
+        self._archiver = threading.Thread(target=self._archiver_loop, name='history-archiver', daemon=True)
+        self._archiver.start()
+    
+    def _archiver_loop(self):
+        while True:
+            try:
+                self.archive_history(self.archive_after_days)
+            except Exception as e:
+                logger.error(f"Error archiving history: {e}")
+            if self._archiver_stop.wait(self.archive_interval):
+                return
+    
+    def _close_connections(self):
+        """Close every pooled connection and invalidate thread-local handles"""
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections = weakref.WeakSet()
+            self._generation += 1
+        
+        for connection in connections:
+            connection.close()
+    
     def close(self):
-        """Close database connection"""
+        """Flush queued writes and close database connections"""
         try:
-            if self.connection:
-                with self.lock:
-                    self.connection.close()
-                    self.connection = None
-                logger.info("Database connection closed")
+            if self._writer is not None and self._writer.is_alive():
+                self._queue.put(_STOP_WRITER)
+                self._writer.join()
+                self._writer = None
+            
+            if self._archiver is not None:
+                self._archiver_stop.set()
+                self._archiver.join()
+                self._archiver = None
+            
+            with self.write_lock:
+                self._close_connections()
+            logger.info("Database connection closed")
         except Exception as e:
             logger.error(f"Error closing database: {e}")
\ No newline at end of file
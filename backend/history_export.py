@@ -0,0 +1,102 @@
+import io
+import csv
+import json
+import zlib
+import logging
+from typing import Dict, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Export format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv')
+}
+
+# Encoded output is handed to the server in chunks of roughly this size
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_ndjson(rows: Iterable[Dict]) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON"""
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+def iter_json_array(rows: Iterable[Dict]) -> Iterator[str]:
+    """Encode rows as a single JSON array without holding it in memory"""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(row, default=str)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def iter_csv(rows: Iterable[Dict]) -> Iterator[str]:
+    """Encode rows as CSV with a header taken from the first row"""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+ENCODERS = {
+    'json': iter_json_array,
+    'ndjson': iter_ndjson,
+    'csv': iter_csv
+}
+
+
+def _buffered(chunks: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Coalesce small text chunks into UTF-8 byte blocks of about size bytes"""
+    pending, pending_size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= size:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def _gzipped(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into gzip format"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(rows: Iterable[Dict], export_format: str = 'json',
+                  gzip: bool = False) -> Iterator[bytes]:
+    """
+    Encode history rows as a stream of bytes
+    
+    Args:
+        rows: Iterable of calculation records
+        export_format: One of EXPORT_FORMATS
+        gzip: Compress the stream with gzip
+    
+    Returns:
+        Iterator of encoded byte blocks
+    
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if export_format not in ENCODERS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    
+    blocks = _buffered(ENCODERS[export_format](rows))
+    return _gzipped(blocks) if gzip else blocks
@@ -0,0 +1,386 @@
+import os
+import glob
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default latency buckets in seconds (0.5 ms .. 30 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base for a metric family with optional labels"""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+    
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        """Current value for each label set"""
+        raise NotImplementedError
+    
+    def merged(self, values: Dict[Tuple[str, ...], Any]) -> '_Metric':
+        """Copy of this metric that renders values instead of its own"""
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+    
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+    
+    def merged(self, values: Dict[Tuple[str, ...], float]) -> 'Counter':
+        metric = Counter(self.name, self.documentation, self.labelnames)
+        metric._values = values
+        return metric
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f'{self.name}_bucket{labels} {state[-1]}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}'
+    
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(state) for key, state in self._values.items()}
+    
+    def merged(self, values: Dict[Tuple[str, ...], List[float]]) -> 'Histogram':
+        metric = Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+        metric._values = values
+        return metric
+
+
+class CallbackMetric(_Metric):
+    """
+    Metric whose samples are read from elsewhere at scrape time
+    
+    The callback returns {label values tuple: value}; use it to expose
+    counters and sizes that components already keep (cache stats, queue depths).
+    """
+    
+    def __init__(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+    
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.callback().items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+    
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        return {tuple(str(v) for v in key): value for key, value in self.callback().items()}
+    
+    def merged(self, values: Dict[Tuple[str, ...], float]) -> 'CallbackMetric':
+        return CallbackMetric(self.name, self.documentation, self.kind, lambda: values, self.labelnames)
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families rendered together in Prometheus text format
+    
+    Values live in the process that recorded them. Under several server
+    workers, share() makes every worker write its values to one directory
+    and render() report the sum over all of them: counters and histograms
+    keep the share of workers that have exited (see mark_process_dead),
+    gauges only count live ones.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.directory = None
+        self._flusher = None
+    
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+    
+    def share(self, directory: str, flush_interval: float = 1.0):
+        """
+        Publish this process's values to directory every flush_interval
+        seconds and render the sum over every process publishing there
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+    
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush error: {e}")
+    
+    def flush(self):
+        """Write this process's values to the shared directory"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = {}
+        for metric in metrics:
+            try:
+                values = metric.snapshot()
+            except Exception as e:
+                logger.error(f"Metric {metric.name} unavailable: {e}")
+                continue
+            families[metric.name] = {
+                'kind': metric.kind,
+                'values': [[list(key), value] for key, value in values.items()]
+            }
+        
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(families, f)
+        os.replace(f"{path}.tmp", path)
+    
+    def _merge_shared(self, metrics: List[_Metric]) -> List[_Metric]:
+        """metrics with their values summed over every process's file"""
+        totals: Dict[str, Dict[Tuple[str, ...], Any]] = {metric.name: {} for metric in metrics}
+        for path in glob.glob(os.path.join(glob.escape(self.directory), '*.json')):
+            live = not path.endswith('.dead.json')
+            try:
+                with open(path, encoding='utf-8') as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                # Retired or replaced while we listed the directory
+                continue
+            for name, family in families.items():
+                if name not in totals or (family['kind'] == 'gauge' and not live):
+                    continue
+                merged = totals[name]
+                for key, value in family['values']:
+                    key = tuple(key)
+                    if isinstance(value, list):
+                        current = merged.get(key) or [0] * len(value)
+                        merged[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+        return [metric.merged(totals[metric.name]) for metric in metrics]
+    
+    def render(self) -> str:
+        """Prometheus text exposition (format 0.0.4) of every metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        if self.directory is not None:
+            self.flush()
+            metrics = self._merge_shared(metrics)
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # One broken callback should not take the whole scrape down
+                blocks.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(blocks) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def mark_process_dead(directory: str, pid: int):
+    """Keep an exited worker's counters in shared totals but drop its gauges"""
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        os.replace(path, os.path.join(directory, f"{pid}.dead.json"))
+    except FileNotFoundError:
+        pass
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route',
+    ('route', 'method', 'status')
+))
+STAGE_SECONDS = registry.register(Histogram(
+    'stage_duration_seconds', 'Time spent in each processing stage', ('stage',)
+))
+DB_LOCK_WAIT_SECONDS = registry.register(Histogram(
+    'history_db_lock_wait_seconds', 'Time spent waiting for the history write lock',
+    buckets=(0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+))
+
+_capture = threading.local()
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration (or buffer it inside capture_stages())"""
+    captured = getattr(_capture, 'stages', None)
+    if captured is not None:
+        captured.append((stage, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time the with-block as one observation of stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def capture_stages():
+    """
+    Buffer stage observations made on this thread instead of recording them
+    
+    Used in sandbox worker processes, whose registry is discarded: the
+    buffered (stage, seconds) pairs are sent back and replayed with
+    record_stages() in the parent.
+    """
+    previous = getattr(_capture, 'stages', None)
+    _capture.stages = []
+    try:
+        yield _capture.stages
+    finally:
+        _capture.stages = previous
+
+
+def record_stages(observations: Iterable[Tuple[str, float]]):
+    for stage, seconds in observations:
+        observe_stage(stage, seconds)
+
+
+class TimedLock:
+    """threading.Lock that records how long acquiring it took"""
+    
+    def __init__(self, histogram: Optional[Histogram] = None):
+        self._lock = threading.Lock()
+        self._histogram = histogram if histogram is not None else DB_LOCK_WAIT_SECONDS
+    
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._histogram.observe(time.perf_counter() - start)
+        return acquired
+    
+    def release(self):
+        self._lock.release()
+    
+    def locked(self) -> bool:
+        return self._lock.locked()
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
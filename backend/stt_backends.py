@@ -0,0 +1,203 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Any
+
+try:
+    import speech_recognition as sr
+    STT_AVAILABLE = True
+except ImportError:
+    STT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Fixture key matching any audio not listed explicitly
+FIXTURE_DEFAULT_KEY = '*'
+
+
+class RecognitionError(Exception):
+    """A recognizer backend failed (as opposed to not understanding the audio)"""
+
+
+class PCMAudio:
+    """Raw mono PCM handed to recognizer backends"""
+    
+    def __init__(self, frame_data: bytes, sample_rate: int, sample_width: int):
+        self.frame_data = frame_data
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+    
+    @property
+    def seconds(self) -> float:
+        return len(self.frame_data) / (self.sample_rate * self.sample_width)
+    
+    def fingerprint(self) -> str:
+        """Stable identifier of the audio content"""
+        return hashlib.sha256(self.frame_data).hexdigest()
+    
+    def to_audio_data(self):
+        """Convert to speech_recognition's AudioData"""
+        return sr.AudioData(self.frame_data, self.sample_rate, self.sample_width)
+
+
+class CircuitBreaker:
+    """Stops calling a backend after repeated failures, retrying after a cool-down"""
+    
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds before an open circuit lets one trial call through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Check whether a call may go through"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+    
+    def cancel_trial(self):
+        """Undo allow() for a call that never ran, so a half-open circuit lets the next caller try"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+    
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class RecognizerBackend:
+    """A speech recognizer STTEngine can route audio to"""
+    
+    name = 'backend'
+    
+    def __init__(self, priority: int = 100, timeout: float = 10.0,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        Args:
+            priority: Lower values are tried first
+            timeout: Seconds to wait for a result before moving on
+            failure_threshold: Consecutive failures before the backend is skipped
+            reset_timeout: Seconds a failing backend is skipped for
+        """
+        self.priority = priority
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+    
+    def recognize(self, audio: PCMAudio, language: str) -> Optional[str]:
+        """
+        Transcribe audio
+        
+        Returns:
+            Transcript, or None if the speech was not understood
+        
+        Raises:
+            RecognitionError: If the backend itself failed
+        """
+        raise NotImplementedError
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'priority': self.priority,
+            'timeout': self.timeout,
+            'circuit': self.breaker.state,
+            'failures': self.breaker.failures
+        }
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API via speech_recognition"""
+    
+    name = 'google'
+    
+    def __init__(self, recognizer, **kwargs):
+        super().__init__(**kwargs)
+        self.recognizer = recognizer
+    
+    def recognize(self, audio: PCMAudio, language: str) -> Optional[str]:
+        try:
+            return self.recognizer.recognize_google(audio.to_audio_data(), language=language)
+        except sr.UnknownValueError:
+            return None
+        except sr.RequestError as e:
+            raise RecognitionError(str(e))
+
+
+class SphinxBackend(RecognizerBackend):
+    """Offline CMU Sphinx via speech_recognition (needs pocketsphinx)"""
+    
+    name = 'sphinx'
+    
+    def __init__(self, recognizer, **kwargs):
+        super().__init__(**kwargs)
+        self.recognizer = recognizer
+    
+    def recognize(self, audio: PCMAudio, language: str) -> Optional[str]:
+        try:
+            return self.recognizer.recognize_sphinx(audio.to_audio_data())
+        except sr.UnknownValueError:
+            return None
+        except (sr.RequestError, AttributeError) as e:
+            raise RecognitionError(str(e))
+
+
+class FixtureBackend(RecognizerBackend):
+    """
+    Deterministic offline stand-in that looks transcripts up by audio fingerprint
+    
+    Fixtures map PCMAudio.fingerprint() values to transcripts; the '*' key,
+    if present, answers for any other audio. Used to benchmark and load-test
+    the voice pipeline without a network recognizer.
+    """
+    
+    name = 'fixture'
+    
+    def __init__(self, fixtures: Optional[Dict[str, str]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = dict(fixtures or {})
+    
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'FixtureBackend':
+        """Load fixtures from a JSON object of {fingerprint: transcript}"""
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+    
+    def add(self, audio: PCMAudio, transcript: str):
+        """Register the transcript for a clip"""
+        self.fixtures[audio.fingerprint()] = transcript
+    
+    def recognize(self, audio: PCMAudio, language: str) -> Optional[str]:
+        transcript = self.fixtures.get(audio.fingerprint())
+        if transcript is None:
+            transcript = self.fixtures.get(FIXTURE_DEFAULT_KEY)
+        return transcript
@@ -1,7 +1,9 @@
 import os
+import io
 import logging
-from typing import Optional
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional, Union, List, Dict, Any, Sequence, Tuple
 
 try:
     import speech_recognition as sr
@@ -9,31 +11,48 @@ try:
 except ImportError:
     STT_AVAILABLE = False
 
-try:
-    import wave
-    import audioop
-    AUDIO_PROCESSING_AVAILABLE = True
-except ImportError:
-    AUDIO_PROCESSING_AVAILABLE = False
+import wave
+import metrics
+import audio_processing
+from stt_backends import (
+    PCMAudio, RecognizerBackend, RecognitionError, GoogleBackend, SphinxBackend, FixtureBackend
+)
+AUDIO_PROCESSING_AVAILABLE = audio_processing.is_available()
 
 logger = logging.getLogger(__name__)
 
+# Backends STTEngine can be configured with, tried in the order listed
+BACKEND_NAMES = ('google', 'sphinx', 'fixture')
+
 class STTEngine:
     """Speech-to-Text engine with multiple backend support"""
     
-    def __init__(self):
+    def __init__(self, backends: str = "auto", fixtures_path: Optional[str] = None,
+                 timeout: float = 10.0, concurrency: int = 4):
+        """
+        Args:
+            backends: Comma-separated backend names in priority order, or "auto"
+                for google then sphinx
+            fixtures_path: JSON transcripts for the fixture backend
+            timeout: Default per-backend recognition timeout in seconds
+            concurrency: Recognition calls each backend runs at once
+        """
         self.recognizer = None
         self.backend = None
+        self.backends: List[RecognizerBackend] = []
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        # One pool per backend, so a slow or hung backend only ties up its own threads
+        self._executors: Dict[RecognizerBackend, ThreadPoolExecutor] = {}
         
         # Initialize STT engine
-        self._initialize_engine()
+        self._initialize_engine(backends, fixtures_path)
     
-    def _initialize_engine(self):
-        """Initialize the best available STT engine"""
+    def _initialize_engine(self, backends: str, fixtures_path: Optional[str]):
+        """Register the configured recognizer backends"""
         if STT_AVAILABLE:
             try:
                 self.recognizer = sr.Recognizer()
-                self.backend = "speech_recognition"
                 
                 # Configure recognizer settings
                 self.recognizer.energy_threshold = 300
@@ -41,18 +60,60 @@ class STTEngine:
                 self.recognizer.pause_threshold = 0.8
                 self.recognizer.phrase_threshold = 0.3
                 
-                logger.info("Initialized speech_recognition STT engine")
-                return
-                
             except Exception as e:
                 logger.warning(f"Failed to initialize speech_recognition: {e}")
+                self.recognizer = None
         
-        logger.warning("No STT engine available")
-        self.backend = None
+        names = ['google', 'sphinx'] if backends == "auto" else [
+            name.strip().lower() for name in backends.split(',') if name.strip()
+        ]
+        for priority, name in enumerate(names):
+            backend = self._create_backend(name, fixtures_path, priority=priority * 10)
+            if backend is not None:
+                self.register_backend(backend)
+        
+        if not self.backends:
+            logger.warning("No STT engine available")
+    
+    def _create_backend(self, name: str, fixtures_path: Optional[str],
+                        priority: int) -> Optional[RecognizerBackend]:
+        """Build a backend by name, or None if it cannot run here"""
+        if name not in BACKEND_NAMES:
+            logger.error(f"Unknown STT backend: {name}")
+            return None
+        
+        if name == 'fixture':
+            try:
+                if fixtures_path:
+                    return FixtureBackend.from_file(fixtures_path, priority=priority, timeout=self.timeout)
+                return FixtureBackend(priority=priority, timeout=self.timeout)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load STT fixtures from {fixtures_path}: {e}")
+                return None
+        
+        if self.recognizer is None:
+            logger.warning(f"STT backend {name} needs speech_recognition")
+            return None
+        backend_class = GoogleBackend if name == 'google' else SphinxBackend
+        return backend_class(self.recognizer, priority=priority, timeout=self.timeout)
+    
+    def register_backend(self, backend: RecognizerBackend):
+        """Add a recognizer backend; backends are tried by ascending priority"""
+        self._executors[backend] = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=f'stt-{backend.name}'
+        )
+        self.backends.append(backend)
+        self.backends.sort(key=lambda b: b.priority)
+        self.backend = self.backends[0].name
+        logger.info(f"Registered {backend.name} STT backend (priority {backend.priority})")
+    
+    def get_backend_status(self) -> List[Dict[str, Any]]:
+        """Priority, timeout and circuit state of each backend"""
+        return [backend.status() for backend in self.backends]
     
     def is_available(self) -> bool:
         """Check if STT is available"""
-        return self.backend is not None
+        return bool(self.backends)
     
     def transcribe_audio(self, audio_file_path: str, language: str = "en-US") -> Optional[str]:
         """
@@ -69,68 +130,109 @@ class STTEngine:
             logger.error("No STT engine available")
             return None
         
-        if not os.path.exists(audio_file_path):
-            logger.error(f"Audio file not found: {audio_file_path}")
+        try:
+            with open(audio_file_path, 'rb') as f:
+                audio_data = f.read()
+        except OSError as e:
+            logger.error(f"Audio file not readable: {audio_file_path} ({e})")
+            return None
+        
+        file_extension = os.path.splitext(audio_file_path)[1]
+        return self.transcribe_audio_data(audio_data, language, file_extension)
+    
+    def transcribe_audio_data(self, audio_data: Union[bytes, bytearray, memoryview],
+                              language: str = "en-US", file_extension: str = ".wav") -> Optional[str]:
+        """
+        Transcribe an in-memory audio file to text
+        
+        The audio is decoded from memory; nothing is written to disk.
+        
+        Args:
+            audio_data: Encoded audio file contents (e.g. an uploaded WAV)
+            language: Language code for recognition
+            file_extension: Extension of the original file, used to pick the decoder
+            
+        Returns:
+            Transcribed text or None if failed
+        """
+        if not self.is_available():
+            logger.error("No STT engine available")
             return None
         
         try:
-            # Process audio file
-            processed_audio = self._process_audio_file(audio_file_path)
+            # Process audio data
+            with metrics.stage_timer('stt_decode'):
+                processed_audio = self._process_audio_data(audio_data, file_extension)
             if not processed_audio:
                 return None
             
             # Perform speech recognition
-            return self._recognize_speech(processed_audio, language)
+            with metrics.stage_timer('stt_recognize'):
+                return self._recognize_speech(processed_audio, language)
             
         except Exception as e:
             logger.error(f"STT transcription error: {e}")
             return None
     
-    def transcribe_audio_data(self, audio_data: bytes, language: str = "en-US") -> Optional[str]:
+    def transcribe_many(self, clips: Sequence[Tuple[Union[bytes, bytearray, memoryview], str]],
+                        language: str = "en-US", workers: int = 4) -> List[Optional[str]]:
         """
-        Transcribe raw audio data to text
+        Transcribe many in-memory audio files in parallel
         
         Args:
-            audio_data: Raw audio bytes
+            clips: (audio file contents, file extension) pairs
             language: Language code for recognition
+            workers: Clips decoded and recognized at once
             
         Returns:
-            Transcribed text or None if failed
+            Transcripts (None where a clip failed), in the same order as clips
         """
+        if not clips:
+            return []
         if not self.is_available():
             logger.error("No STT engine available")
-            return None
+            return [None] * len(clips)
         
-        try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_path = temp_file.name
+        workers = max(1, min(workers, len(clips)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stt-batch') as pool:
+            return list(pool.map(
+                lambda clip: self.transcribe_audio_data(clip[0], language, clip[1]), clips
+            ))
+    
+    def transcribe_pcm(self, pcm: bytes, sample_rate: int = 16000, sample_width: int = 2,
+                       language: str = "en-US") -> Optional[str]:
+        """
+        Transcribe raw mono PCM (e.g. one phrase cut from a stream)
+        
+        Args:
+            pcm: Little-endian mono samples
+            sample_rate: Samples per second
+            sample_width: Bytes per sample
+            language: Language code for recognition
             
-            try:
-                # Transcribe the temporary file
-                result = self.transcribe_audio(temp_path, language)
-                return result
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    
-        except Exception as e:
-            logger.error(f"STT transcription error: {e}")
+        Returns:
+            Transcribed text or None if failed
+        """
+        if not self.is_available():
+            logger.error("No STT engine available")
+            return None
+        if not pcm:
             return None
+        with metrics.stage_timer('stt_recognize'):
+            return self._recognize_speech(PCMAudio(pcm, sample_rate, sample_width), language)
     
-    def _process_audio_file(self, audio_file_path: str) -> Optional[sr.AudioData]:
-        """Process audio file and return AudioData object"""
+    def _process_audio_data(self, audio_data: Union[bytes, bytearray, memoryview],
+                            file_extension: str) -> Optional[PCMAudio]:
+        """Decode in-memory audio and return AudioData object"""
         try:
             # Determine file type and process accordingly
-            file_extension = os.path.splitext(audio_file_path)[1].lower()
+            file_extension = file_extension.lower()
             
             if file_extension in ['.wav', '.wave']:
-                return self._process_wav_file(audio_file_path)
+                return self._process_wav_data(audio_data)
             elif file_extension in ['.mp3', '.m4a', '.flac']:
                 # Convert to WAV first (requires ffmpeg or similar)
-                return self._convert_and_process_audio(audio_file_path)
+                return self._convert_and_process_audio(audio_data)
             else:
                 logger.error(f"Unsupported audio format: {file_extension}")
                 return None
@@ -139,21 +241,45 @@ class STTEngine:
             logger.error(f"Audio processing error: {e}")
             return None
     
-    def _process_wav_file(self, wav_file_path: str) -> Optional[sr.AudioData]:
-        """Process WAV file"""
+    def _process_wav_data(self, audio_data: Union[bytes, bytearray, memoryview]) -> Optional[PCMAudio]:
+        """Decode WAV bytes without a disk round trip"""
+        if AUDIO_PROCESSING_AVAILABLE:
+            try:
+                return self._preprocess_wav_data(audio_data)
+            except (wave.Error, ValueError, EOFError) as e:
+                # Not plain PCM (e.g. compressed WAV): let speech_recognition try
+                logger.warning(f"Audio preprocessing skipped: {e}")
+        
+        if self.recognizer is None:
+            logger.error("Audio decoding needs speech_recognition")
+            return None
+        
         try:
-            with sr.AudioFile(wav_file_path) as source:
+            # BytesIO over bytes shares the buffer rather than copying it
+            with sr.AudioFile(io.BytesIO(audio_data)) as source:
                 # Adjust for ambient noise
                 self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
                 # Record the audio data
                 audio_data = self.recognizer.record(source)
-                return audio_data
+                return PCMAudio(audio_data.frame_data, audio_data.sample_rate, audio_data.sample_width)
                 
         except Exception as e:
             logger.error(f"WAV processing error: {e}")
             return None
     
-    def _convert_and_process_audio(self, audio_file_path: str) -> Optional[sr.AudioData]:
+    def _preprocess_wav_data(self, audio_data: Union[bytes, bytearray, memoryview]) -> Optional[PCMAudio]:
+        """Trim silence and convert to 16 kHz mono before recognition"""
+        processed = audio_processing.preprocess_wav(audio_data)
+        if processed.is_silent:
+            logger.info(f"No speech detected in {processed.original_seconds:.2f}s of audio")
+            return None
+        
+        # Recognizing pre-recorded AudioData ignores energy_threshold, so the
+        # shared recognizer is left alone (adjust_for_ambient_noise is skipped too)
+        logger.info(f"Trimmed audio from {processed.original_seconds:.2f}s to {processed.seconds:.2f}s")
+        return PCMAudio(processed.pcm, processed.sample_rate, processed.sample_width)
+    
+    def _convert_and_process_audio(self, audio_data: Union[bytes, bytearray, memoryview]) -> Optional[PCMAudio]:
         """Convert non-WAV audio to WAV and process"""
         try:
             # This would require ffmpeg or similar audio conversion tool
@@ -165,36 +291,47 @@ class STTEngine:
             logger.error(f"Audio conversion error: {e}")
             return None
     
-    def _recognize_speech(self, audio_data: sr.AudioData, language: str) -> Optional[str]:
-        """Perform speech recognition on audio data"""
-        try:
-            # Try Google Speech Recognition (free tier)
-            try:
-                text = self.recognizer.recognize_google(audio_data, language=language)
-                logger.info(f"Speech recognized: {text}")
-                return text.strip()
-            except sr.RequestError as e:
-                logger.error(f"Google Speech Recognition request error: {e}")
-            except sr.UnknownValueError:
-                logger.warning("Google Speech Recognition could not understand the audio")
+    def _recognize_speech(self, audio_data: PCMAudio, language: str) -> Optional[str]:
+        """Try each backend in priority order until one understands the audio"""
+        for backend in self.backends:
+            if not backend.breaker.allow():
+                logger.debug(f"Skipping {backend.name} STT backend: circuit open")
+                continue
             
-            # Fallback to offline recognition if available
-            try:
-                text = self.recognizer.recognize_sphinx(audio_data)
-                logger.info(f"Speech recognized (offline): {text}")
-                return text.strip()
-            except sr.RequestError as e:
-                logger.error(f"Sphinx recognition error: {e}")
-            except sr.UnknownValueError:
-                logger.warning("Sphinx could not understand the audio")
-            except AttributeError:
-                logger.info("Sphinx not available")
+            started = threading.Event()
             
-            return None
+            def recognize(backend=backend):
+                started.set()
+                return backend.recognize(audio_data, language)
             
-        except Exception as e:
-            logger.error(f"Speech recognition error: {e}")
-            return None
+            # The timeout covers the call itself, not time queued behind other requests
+            future = self._executors[backend].submit(recognize)
+            if not started.wait(backend.timeout) and future.cancel():
+                logger.warning(f"Skipping {backend.name} STT backend: busy for {backend.timeout}s")
+                backend.breaker.cancel_trial()
+                continue
+            try:
+                text = future.result(timeout=backend.timeout)
+            except FutureTimeout:
+                logger.error(f"{backend.name} recognition timed out after {backend.timeout}s")
+                backend.breaker.record_failure()
+                continue
+            except RecognitionError as e:
+                logger.error(f"{backend.name} recognition error: {e}")
+                backend.breaker.record_failure()
+                continue
+            except Exception as e:
+                logger.error(f"{backend.name} recognition failed: {e}")
+                backend.breaker.record_failure()
+                continue
+            
+            backend.breaker.record_success()
+            if text:
+                logger.info(f"Speech recognized ({backend.name}): {text}")
+                return text.strip()
+            logger.warning(f"{backend.name} could not understand the audio")
+        
+        return None
     
     def listen_from_microphone(self, timeout: int = 5, phrase_time_limit: int = 10) -> Optional[str]:
         """
@@ -207,7 +344,7 @@ class STTEngine:
         Returns:
             Transcribed text or None if failed
         """
-        if not self.is_available():
+        if not self.is_available() or self.recognizer is None:
             logger.error("No STT engine available")
             return None
         
@@ -224,7 +361,8 @@ class STTEngine:
                 )
                 
                 # Recognize speech
-                return self._recognize_speech(audio_data, "en-US")
+                audio = PCMAudio(audio_data.frame_data, audio_data.sample_rate, audio_data.sample_width)
+                return self._recognize_speech(audio, "en-US")
                 
         except sr.WaitTimeoutError:
             logger.warning("Listening timeout - no speech detected")
@@ -1,8 +1,17 @@
 import os
+import re
+import json
+import wave
 import logging
-from typing import Optional
+from array import array
+from collections import OrderedDict
+from typing import Optional, Dict, List
 import hashlib
+import threading
 import time
+import uuid
+
+import metrics
 
 try:
     import pyttsx3
@@ -18,26 +27,130 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Words pre-rendered for concatenative number speech
+RESULT_PREFIX = "the result is"
+ONES = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine',
+        'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen',
+        'seventeen', 'eighteen', 'nineteen']
+TENS = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+SCALES = ['', 'thousand', 'million', 'billion', 'trillion']
+SEGMENT_WORDS = [RESULT_PREFIX, 'minus', 'point', 'hundred'] + ONES + TENS[2:] + SCALES[1:]
+
+# "The result is <number>" as built by the calculate route
+RESULT_TEXT_PATTERN = re.compile(r'^The result is (-?\d+(?:\.\d+)?)$')
+
+# Segment splicing: silence threshold for trimming and gaps between words
+SEGMENT_SILENCE_THRESHOLD = 500
+SEGMENT_PAD_SECONDS = 0.01
+WORD_GAP_SECONDS = 0.03
+PREFIX_GAP_SECONDS = 0.08
+
+
+def number_to_words(number: str) -> Optional[List[str]]:
+    """
+    Spell a plain decimal number as segment words
+    
+    Args:
+        number: Number as formatted by str() (e.g. "-42", "3.14")
+        
+    Returns:
+        List of SEGMENT_WORDS entries, or None if the number cannot be spelled
+        (exponent notation or beyond the trillions)
+    """
+    match = re.fullmatch(r'(-?)(\d+)(?:\.(\d+))?', number)
+    if not match:
+        return None
+    sign, integer, fraction = match.groups()
+    if len(integer.lstrip('0')) > 3 * len(SCALES):
+        return None
+    
+    words = ['minus'] if sign else []
+    value = int(integer)
+    if value == 0:
+        words.append('zero')
+    else:
+        groups = []
+        while value:
+            value, group = divmod(value, 1000)
+            groups.append(group)
+        for scale in range(len(groups) - 1, -1, -1):
+            group = groups[scale]
+            if not group:
+                continue
+            hundreds, rest = divmod(group, 100)
+            if hundreds:
+                words += [ONES[hundreds], 'hundred']
+            if rest >= 20:
+                words.append(TENS[rest // 10])
+                if rest % 10:
+                    words.append(ONES[rest % 10])
+            elif rest:
+                words.append(ONES[rest])
+            if SCALES[scale]:
+                words.append(SCALES[scale])
+    
+    if fraction:
+        words.append('point')
+        words += [ONES[int(digit)] for digit in fraction]
+    return words
+
 class TTSEngine:
     """Text-to-Speech engine with multiple backend support"""
     
-    def __init__(self, output_dir: str = "static/voice"):
+    # Prefix of content-addressed cache files
+    CACHE_PREFIX = "tts_"
+    
+    def __init__(self, output_dir: str = "static/voice", cache_max_bytes: int = 256 * 1024 * 1024):
         self.output_dir = output_dir
         self.engine = None
         self.backend = None
         
+        # Voice settings that affect the rendered audio (part of the cache key)
+        self.voice_id = None
+        self.rate = 150
+        self.volume = 0.8
+        self.lang = 'en'
+        
+        # Content-addressed audio cache: filename -> size, least recently used first
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        
+        # Pre-rendered word segments for concatenative number speech:
+        # (settings key, (nchannels, sampwidth, framerate), {word: frames})
+        self._segment_set = None
+        
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
         
-        # Initialize TTS engine
-        self._initialize_engine()
+        # Pick the TTS engine; a pyttsx3 driver is only created by initialize_engine()
+        self._select_backend()
+        
+        # Pick up audio cached by previous runs
+        self._load_cache_index()
     
-    def _initialize_engine(self):
-        """Initialize the best available TTS engine"""
+    def _select_backend(self):
+        """Select the best available TTS engine"""
         if TTS_AVAILABLE:
+            self.backend = "pyttsx3"
+        else:
+            self._fall_back()
+    
+    def initialize_engine(self):
+        """
+        Create the pyttsx3 driver on the calling thread
+        
+        A pyttsx3 driver belongs to the thread that created it, so the
+        synthesis worker calls this before its first job. Falls back to
+        gTTS if the driver cannot be created.
+        """
+        if self.backend == "pyttsx3" and self.engine is None:
             try:
                 self.engine = pyttsx3.init()
-                self.backend = "pyttsx3"
                 
                 # Configure voice settings
                 voices = self.engine.getProperty('voices')
@@ -46,18 +159,22 @@ class TTSEngine:
                     for voice in voices:
                         if 'female' in voice.name.lower() or 'zira' in voice.name.lower():
                             self.engine.setProperty('voice', voice.id)
+                            self.voice_id = voice.id
                             break
                 
                 # Set speech rate and volume
-                self.engine.setProperty('rate', 150)  # Speed of speech
-                self.engine.setProperty('volume', 0.8)  # Volume level (0.0 to 1.0)
+                self.engine.setProperty('rate', self.rate)  # Speed of speech
+                self.engine.setProperty('volume', self.volume)  # Volume level (0.0 to 1.0)
                 
                 logger.info("Initialized pyttsx3 TTS engine")
-                return
                 
             except Exception as e:
                 logger.warning(f"Failed to initialize pyttsx3: {e}")
+                self.engine = None
+                self._fall_back()
         
+    def _fall_back(self):
+        """Use gTTS, or no TTS at all"""
         if GTTS_AVAILABLE:
             self.backend = "gtts"
             logger.info("Using Google TTS (gTTS) engine")
@@ -74,13 +191,18 @@ class TTSEngine:
         """
         Generate speech audio from text
         
+        Without a filename the audio is content-addressed: identical text
+        rendered with identical settings is synthesized once and the cached
+        file is returned on later calls.
+        
         Args:
             text: Text to convert to speech
-            filename: Output filename (without extension)
+            filename: Output filename (without extension); bypasses the cache
             
         Returns:
             Generated audio filename or None if failed
         """
+        self.initialize_engine()
         if not self.is_available():
             logger.error("No TTS engine available")
             return None
@@ -90,23 +212,66 @@ class TTSEngine:
             return None
         
         try:
-            # Generate filename if not provided
-            if not filename:
-                text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-                filename = f"tts_{int(time.time())}_{text_hash}"
+            if filename:
+                output_file = f"{filename}.{self.audio_extension}"
+                return self._synthesize(text, output_file)
             
-            output_file = f"{filename}.mp3"
-            output_path = os.path.join(self.output_dir, output_file)
+            output_file = self.cache_filename(text)
+            if self._cache_lookup(output_file):
+                return output_file
             
-            if self.backend == "pyttsx3":
-                return self._generate_with_pyttsx3(text, output_path, output_file)
-            elif self.backend == "gtts":
-                return self._generate_with_gtts(text, output_path, output_file)
+            if self.can_concatenate(text):
+                return self.generate_concatenated(text)
+            
+            # Render under a private name and move it into place, so concurrent
+            # requests never see (or serve) a half-written file
+            temp_file = f"tmp_{uuid.uuid4().hex}.{self.audio_extension}"
+            temp_path = os.path.join(self.output_dir, temp_file)
+            if not self._synthesize(text, temp_file):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return None
+            os.replace(temp_path, os.path.join(self.output_dir, output_file))
+            
+            self._cache_insert(output_file)
+            return output_file
             
         except Exception as e:
             logger.error(f"TTS generation error: {e}")
             return None
     
+    @property
+    def audio_extension(self) -> str:
+        """File extension of audio produced by the active backend"""
+        return "mp3" if self.backend == "gtts" else "wav"
+    
+    def cache_filename(self, text: str) -> str:
+        """Content-addressed filename for text under the current voice settings"""
+        key = json.dumps([text, self.backend, self.voice_id, self.rate, self.volume, self.lang])
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return f"{self.CACHE_PREFIX}{digest}.{self.audio_extension}"
+    
+    def _settings_key(self) -> str:
+        """Hash of the settings that change how audio sounds"""
+        key = json.dumps([self.backend, self.voice_id, self.rate, self.volume, self.lang])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    
+    def get_cached_speech(self, text: str) -> Optional[str]:
+        """Return the cached audio filename for text, or None if it must be synthesized"""
+        filename = self.cache_filename(text)
+        return filename if self._cache_lookup(filename) else None
+    
+    def _synthesize(self, text: str, output_file: str) -> Optional[str]:
+        """Render text into output_dir/output_file with the active backend"""
+        output_path = os.path.join(self.output_dir, output_file)
+        
+        with metrics.stage_timer('tts_synth'):
+            if self.backend == "pyttsx3":
+                return self._generate_with_pyttsx3(text, output_path, output_file)
+            elif self.backend == "gtts":
+                return self._generate_with_gtts(text, output_path, output_file)
+        return None
+    
     def _generate_with_pyttsx3(self, text: str, output_path: str, output_file: str) -> Optional[str]:
         """Generate speech using pyttsx3"""
         try:
@@ -130,7 +295,7 @@ class TTSEngine:
         """Generate speech using Google TTS"""
         try:
             # Create gTTS object
-            tts = gTTS(text=text, lang='en', slow=False)
+            tts = gTTS(text=text, lang=self.lang, slow=False)
             
             # Save to file
             tts.save(output_path)
@@ -170,6 +335,7 @@ class TTSEngine:
         if self.backend == "pyttsx3" and self.engine:
             try:
                 self.engine.setProperty('voice', voice_id)
+                self.voice_id = voice_id
                 return True
             except:
                 return False
@@ -180,6 +346,7 @@ class TTSEngine:
         if self.backend == "pyttsx3" and self.engine:
             try:
                 self.engine.setProperty('rate', max(50, min(300, rate)))
+                self.rate = max(50, min(300, rate))
                 return True
             except:
                 return False
@@ -190,25 +357,235 @@ class TTSEngine:
         if self.backend == "pyttsx3" and self.engine:
             try:
                 self.engine.setProperty('volume', max(0.0, min(1.0, volume)))
+                self.volume = max(0.0, min(1.0, volume))
                 return True
             except:
                 return False
         return False
     
-    def cleanup_old_files(self, max_age_hours: int = 24):
-        """Clean up old TTS files"""
+    def prepare_segments(self) -> bool:
+        """
+        Load (rendering once if needed) the word segments for number speech
+        
+        Segments are rendered with the synthesizer the first time and kept
+        as WAV files under output_dir/segments/<settings>, so later startups
+        only read them. Only backends that produce WAV can be spliced.
+        
+        Returns:
+            True if concatenative speech is available
+        """
+        self.initialize_engine()
+        if not self.is_available() or self.audio_extension != "wav":
+            return False
+        
+        settings_key = self._settings_key()
+        segment_dir = os.path.join(self.output_dir, "segments", settings_key)
+        os.makedirs(segment_dir, exist_ok=True)
+        
+        segments, params = {}, None
+        for word in SEGMENT_WORDS:
+            path = os.path.join(segment_dir, f"{word.replace(' ', '_')}.wav")
+            segment = self._read_segment(word, path) if os.path.exists(path) else None
+            if segment is None:
+                # Missing, or unreadable (e.g. left behind by an older crashed render): render it
+                if not self._render_segment(word, path):
+                    logger.warning(f"Could not render TTS segment '{word}'")
+                    return False
+                segment = self._read_segment(word, path)
+                if segment is None:
+                    return False
+            
+            word_params, frames = segment
+            if params is None:
+                params = word_params
+            elif word_params != params:
+                logger.warning("TTS segments have mismatched formats")
+                return False
+            segments[word] = self._trim_silence(frames, params)
+        
+        self._segment_set = (settings_key, params, segments)
+        logger.info(f"Loaded {len(segments)} TTS segments for concatenative speech")
+        return True
+    
+    def _render_segment(self, word: str, path: str) -> bool:
+        """Render one segment under a private name and move it into place"""
+        temp_path = os.path.join(os.path.dirname(path), f"tmp_{uuid.uuid4().hex}.wav")
+        if not self._synthesize(word, os.path.relpath(temp_path, self.output_dir)):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        os.replace(temp_path, path)
+        return True
+    
+    @staticmethod
+    def _read_segment(word: str, path: str) -> Optional[tuple]:
+        """Return ((nchannels, sampwidth, framerate), frames) of a segment file, or None"""
         try:
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
+            with wave.open(path, 'rb') as wav:
+                return (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()), wav.readframes(wav.getnframes())
+        except (wave.Error, EOFError, OSError) as e:
+            logger.warning(f"Unreadable TTS segment '{word}': {e}")
+            return None
+    
+    def can_concatenate(self, text: str) -> bool:
+        """Check if text can be built from pre-rendered segments"""
+        segment_set = self._segment_set
+        match = RESULT_TEXT_PATTERN.match(text)
+        return (match is not None and segment_set is not None and
+                segment_set[0] == self._settings_key() and
+                number_to_words(match.group(1)) is not None)
+    
+    def generate_concatenated(self, text: str) -> Optional[str]:
+        """
+        Build "The result is <number>" audio by splicing pre-rendered segments
+        
+        This never touches the synthesizer, so unlike generate_speech it is
+        safe to call from any thread. The result is cached like synthesized
+        speech.
+        
+        Args:
+            text: Text accepted by can_concatenate()
             
-            for filename in os.listdir(self.output_dir):
-                if filename.endswith('.mp3'):
-                    file_path = os.path.join(self.output_dir, filename)
-                    file_age = current_time - os.path.getctime(file_path)
-                    
-                    if file_age > max_age_seconds:
-                        os.remove(file_path)
-                        logger.info(f"Cleaned up old TTS file: {filename}")
-                        
+        Returns:
+            Cached audio filename or None if the text cannot be concatenated
+        """
+        segment_set = self._segment_set
+        match = RESULT_TEXT_PATTERN.match(text)
+        if match is None or segment_set is None or segment_set[0] != self._settings_key():
+            return None
+        words = number_to_words(match.group(1))
+        if words is None:
+            return None
+        
+        start = time.perf_counter()
+        _, (nchannels, sampwidth, framerate), segments = segment_set
+        frame_size = nchannels * sampwidth
+        
+        def silence(seconds: float) -> bytes:
+            return bytes(int(framerate * seconds) * frame_size)
+        
+        pcm = bytearray(segments[RESULT_PREFIX])
+        pcm += silence(PREFIX_GAP_SECONDS)
+        for index, word in enumerate(words):
+            if index:
+                pcm += silence(WORD_GAP_SECONDS)
+            pcm += segments[word]
+        
+        output_file = self.cache_filename(text)
+        temp_path = os.path.join(self.output_dir, f"tmp_{uuid.uuid4().hex}.wav")
+        try:
+            with wave.open(temp_path, 'wb') as wav:
+                wav.setnchannels(nchannels)
+                wav.setsampwidth(sampwidth)
+                wav.setframerate(framerate)
+                wav.writeframes(bytes(pcm))
+            os.replace(temp_path, os.path.join(self.output_dir, output_file))
         except Exception as e:
-            logger.error(f"TTS cleanup error: {e}")
\ No newline at end of file
+            logger.error(f"TTS concatenation error: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        
+        self._cache_insert(output_file)
+        metrics.observe_stage('tts_concat', time.perf_counter() - start)
+        return output_file
+    
+    @staticmethod
+    def _trim_silence(frames: bytes, params: tuple) -> bytes:
+        """Strip leading and trailing silence from 16-bit PCM frames"""
+        nchannels, sampwidth, framerate = params
+        if sampwidth != 2 or not frames:
+            return frames
+        
+        samples = array('h', frames)
+        loud = [i for i in range(len(samples)) if abs(samples[i]) > SEGMENT_SILENCE_THRESHOLD]
+        if not loud:
+            return frames
+        
+        pad = int(framerate * SEGMENT_PAD_SECONDS) * nchannels
+        start = max(0, loud[0] - pad) // nchannels * nchannels
+        end = min(len(samples), loud[-1] + pad + nchannels) // nchannels * nchannels
+        return samples[start:end].tobytes()
+    
+    def _load_cache_index(self):
+        """Rebuild the cache index from files on disk, oldest access first"""
+        entries = []
+        try:
+            for filename in os.listdir(self.output_dir):
+                if filename.startswith(self.CACHE_PREFIX):
+                    stat = os.stat(os.path.join(self.output_dir, filename))
+                    entries.append((stat.st_mtime, filename, stat.st_size))
+        except OSError as e:
+            logger.error(f"TTS cache index error: {e}")
+        
+        with self._cache_lock:
+            for _, filename, size in sorted(entries):
+                self._cache[filename] = size
+                self._cache_bytes += size
+        
+        if entries:
+            logger.info(f"Loaded {len(entries)} cached TTS files ({self._cache_bytes} bytes)")
+        self.enforce_cache_budget()
+    
+    def _cache_lookup(self, filename: str) -> bool:
+        """Mark a cached file as used; False if it is not cached"""
+        with self._cache_lock:
+            if filename in self._cache:
+                if os.path.exists(os.path.join(self.output_dir, filename)):
+                    self._cache.move_to_end(filename)
+                    self.cache_hits += 1
+                    hit = True
+                else:
+                    # Removed behind our back
+                    self._cache_bytes -= self._cache.pop(filename)
+                    hit = False
+            else:
+                hit = False
+            
+            if not hit:
+                self.cache_misses += 1
+        
+        if hit:
+            # Persist recency so the LRU order survives restarts
+            try:
+                os.utime(os.path.join(self.output_dir, filename))
+            except OSError:
+                pass
+        return hit
+    
+    def _cache_insert(self, filename: str):
+        """Add a freshly rendered file to the cache and evict to the byte budget"""
+        size = os.path.getsize(os.path.join(self.output_dir, filename))
+        with self._cache_lock:
+            self._cache_bytes += size - self._cache.pop(filename, 0)
+            self._cache[filename] = size
+        self.enforce_cache_budget()
+    
+    def enforce_cache_budget(self):
+        """Evict least recently used audio until the cache fits in cache_max_bytes"""
+        evicted = []
+        with self._cache_lock:
+            while self._cache_bytes > self.cache_max_bytes and len(self._cache) > 1:
+                filename, size = self._cache.popitem(last=False)
+                self._cache_bytes -= size
+                self.cache_evictions += 1
+                evicted.append(filename)
+        
+        for filename in evicted:
+            try:
+                os.remove(os.path.join(self.output_dir, filename))
+                logger.info(f"Evicted cached TTS file: {filename}")
+            except OSError as e:
+                logger.error(f"TTS cache eviction error: {e}")
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Return audio cache statistics"""
+        with self._cache_lock:
+            return {
+                'entries': len(self._cache),
+                'bytes': self._cache_bytes,
+                'max_bytes': self.cache_max_bytes,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'evictions': self.cache_evictions
+            }
\ No newline at end of file
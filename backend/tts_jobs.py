@@ -0,0 +1,300 @@
+import os
+import re
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Optional, Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# Seconds start() waits for the worker to create the TTS engine
+ENGINE_START_TIMEOUT = 10.0
+
+# Seconds between checks on jobs another server process is rendering
+SHARED_POLL_INTERVAL = 0.2
+
+# A pending marker this old was left by a process that died mid-job
+STALE_PENDING_SECONDS = 600.0
+
+
+class TTSJob:
+    """A queued text-to-speech request"""
+    
+    def __init__(self, text: Optional[str], filename: str):
+        # The cache filename is content-addressed, so every server process derives the same ID
+        self.id = os.path.splitext(filename)[0]
+        self.text = text
+        self.filename = filename
+        self.status = PENDING
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+    
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        with self._callbacks_lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"TTS job {self.id} callback error: {e}")
+    
+    def add_done_callback(self, callback: Callable[['TTSJob'], None]):
+        """Call callback(job) once the job finishes (immediately if it already has)"""
+        with self._callbacks_lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; False on timeout"""
+        return self._done.wait(timeout)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'audio_url': f'/api/audio/{self.filename}' if self.status == DONE else None,
+            'error': self.error
+        }
+
+
+class TTSJobQueue:
+    """
+    Serializes speech synthesis onto one worker thread that owns the TTS engine
+    
+    Job IDs are the content-addressed cache filenames without their
+    extension, and queued or failed jobs leave a marker file under
+    output_dir/jobs. Any server process can therefore report a job another
+    one queued: it is done once the cache file exists.
+    """
+    
+    def __init__(self, tts_engine, max_pending: int = 1000, max_retained: int = 10000):
+        """
+        Args:
+            tts_engine: TTSEngine used by the worker; nothing else should synthesize with it
+            max_pending: Queued jobs before submit() blocks
+            max_retained: Finished jobs kept for polling before the oldest are forgotten
+        """
+        self.tts_engine = tts_engine
+        self.max_retained = max_retained
+        self.jobs_dir = os.path.join(tts_engine.output_dir, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._shared = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._worker = None
+        self._watcher = None
+    
+    def start(self):
+        """Start the synthesis worker thread and wait for it to set up the TTS engine"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._ready.clear()
+                self._worker = threading.Thread(target=self._run, name='tts-worker', daemon=True)
+                self._worker.start()
+                logger.info("Started TTS worker thread")
+            # Cache filenames depend on the engine's final voice settings
+            if not self._ready.wait(ENGINE_START_TIMEOUT):
+                logger.warning("TTS engine is still starting")
+    
+    def submit(self, text: str) -> TTSJob:
+        """
+        Queue text for synthesis
+        
+        Cached phrases, and numeric results that can be spliced from
+        pre-rendered segments, come back already finished. A phrase that is
+        already queued returns the existing job instead of rendering twice.
+        """
+        filename = self.tts_engine.cache_filename(text)
+        
+        with self._lock:
+            job = self._in_flight.get(filename)
+            if job is not None:
+                return job
+            
+            job = TTSJob(text, filename)
+            if self.tts_engine.get_cached_speech(text):
+                job.finish(DONE)
+                self._remember(job)
+                return job
+        
+        # Splicing segments never touches the synthesizer, so skip the queue
+        if self.tts_engine.can_concatenate(text) and self.tts_engine.generate_concatenated(text):
+            job.finish(DONE)
+            with self._lock:
+                self._remember(job)
+            return job
+        
+        with self._lock:
+            existing = self._in_flight.get(filename)
+            if existing is not None:
+                return existing
+            
+            self._in_flight[filename] = job
+            self._remember(job)
+        
+        self._publish(job.id, PENDING)
+        if self._worker is None:
+            self.start()
+        self._queue.put(job)
+        return job
+    
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for the synthesis worker"""
+        return self._queue.qsize()
+    
+    def get(self, job_id: str) -> Optional[TTSJob]:
+        """Look up a job by ID, including jobs queued by other server processes"""
+        with self._lock:
+            job = self._jobs.get(job_id) or self._shared.get(job_id)
+        if job is not None or not re.fullmatch(r'\w+', job_id):
+            return job
+        
+        status, error = self._shared_status(job_id)
+        if status is None:
+            return None
+        job = TTSJob(None, f"{job_id}.{self.tts_engine.audio_extension}")
+        if status != PENDING:
+            job.finish(status, error)
+            return job
+        
+        # Still rendering elsewhere: the watcher finishes it so waits and callbacks work
+        with self._lock:
+            job = self._shared.setdefault(job_id, job)
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_shared, name='tts-job-watcher', daemon=True)
+                self._watcher.start()
+        return job
+    
+    def _remember(self, job: TTSJob):
+        """Track a job for polling, forgetting the oldest finished ones"""
+        self._jobs.pop(job.id, None)
+        self._jobs[job.id] = job
+        excess = len(self._jobs) - self.max_retained
+        if excess > 0:
+            # Pending jobs are kept however old they are; skip past them
+            finished = (job_id for job_id, entry in self._jobs.items() if entry.status != PENDING)
+            for job_id in list(islice(finished, excess)):
+                del self._jobs[job_id]
+    
+    def _marker(self, job_id: str, status: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.{status}")
+    
+    def _publish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Record a job's state where other server processes can read it"""
+        pending, failed = self._marker(job_id, PENDING), self._marker(job_id, FAILED)
+        try:
+            if status == PENDING:
+                open(pending, 'w').close()
+                stale = failed
+            else:
+                if status == FAILED:
+                    with open(failed, 'w', encoding='utf-8') as f:
+                        f.write(error or '')
+                stale = pending
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        except OSError as e:
+            logger.error(f"TTS job {job_id} marker error: {e}")
+    
+    def _shared_status(self, job_id: str) -> tuple:
+        """(status, error) of a job from the files it leaves; (None, None) if unknown"""
+        # Read the pending marker first: once it is gone, the outcome is already on disk
+        try:
+            queued_at = os.path.getmtime(self._marker(job_id, PENDING))
+        except OSError:
+            queued_at = None
+        
+        filename = f"{job_id}.{self.tts_engine.audio_extension}"
+        if os.path.exists(os.path.join(self.tts_engine.output_dir, filename)):
+            return DONE, None
+        try:
+            with open(self._marker(job_id, FAILED), encoding='utf-8') as f:
+                return FAILED, f.read() or 'TTS failed'
+        except OSError:
+            pass
+        
+        if queued_at is None:
+            return None, None
+        if time.time() - queued_at > STALE_PENDING_SECONDS:
+            return FAILED, 'TTS job was lost'
+        return PENDING, None
+    
+    def _watch_shared(self):
+        """Finish jobs pending in other server processes once their files say they are done"""
+        while True:
+            time.sleep(SHARED_POLL_INTERVAL)
+            with self._lock:
+                jobs = list(self._shared.values())
+                if not jobs:
+                    self._watcher = None
+                    return
+            
+            for job in jobs:
+                status, error = self._shared_status(job.id)
+                if status == PENDING:
+                    continue
+                with self._lock:
+                    self._shared.pop(job.id, None)
+                # Gone without a trace: its audio was evicted, or its process died
+                job.finish(status or FAILED, error if status else 'TTS job was lost')
+    
+    def _run(self):
+        """Worker loop: the only place speech is synthesized"""
+        try:
+            self.tts_engine.initialize_engine()
+        except Exception as e:
+            logger.error(f"TTS engine initialization error: {e}")
+        finally:
+            self._ready.set()
+        
+        try:
+            self.tts_engine.prepare_segments()
+        except Exception as e:
+            logger.error(f"TTS segment preparation error: {e}")
+        
+        while True:
+            job = self._queue.get()
+            key = job.filename
+            # Refresh the pending marker so a long queue does not make it look stale
+            self._publish(job.id, PENDING)
+            try:
+                filename = self.tts_engine.generate_speech(job.text)
+                if filename:
+                    job.filename = filename
+                    status, error = DONE, None
+                else:
+                    status, error = FAILED, 'TTS failed'
+            except Exception as e:
+                logger.error(f"TTS job {job.id} error: {e}")
+                status, error = FAILED, 'TTS failed'
+            try:
+                # Publish first, so other processes agree with anyone the job wakes
+                self._publish(job.id, status, error)
+                job.finish(status, error)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                self._queue.task_done()
@@ -0,0 +1,361 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Token kinds
+NUMBER = 'number'
+HUNDRED = 'hundred'
+SCALE = 'scale'
+FRACTION = 'fraction'
+OPERATOR = 'operator'
+FILLER = 'filler'
+FUNCTION = 'function'
+AND = 'and'
+
+# Number word classes (used to decide whether a word continues a number)
+UNIT = 'unit'
+TEEN = 'teen'
+TENS = 'tens'
+ZERO = 'zero'
+DIGITS = 'digits'
+
+UNITS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9
+}
+
+TEENS = {
+    'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14,
+    'fifteen': 15, 'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19
+}
+
+TENS_WORDS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50,
+    'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90
+}
+
+SCALES = {
+    'thousand': 1000,
+    'million': 1000000,
+    'billion': 1000000000,
+    'trillion': 1000000000000
+}
+
+FRACTIONS = {
+    'half': 2, 'halves': 2,
+    'quarter': 4, 'quarters': 4
+}
+
+OPERATORS = {
+    'plus': '+',
+    'minus': '-',
+    'subtract': '-',
+    'negative': '-',
+    'times': '*',
+    'multiplied by': '*',
+    'into': '*',
+    'divided by': '/',
+    'over': '/',
+    'power of': '**',
+    'to the power of': '**',
+    'raised to': '**',
+    'square root of': 'sqrt(',
+    'square root': 'sqrt(',
+    'root': 'sqrt(',
+    'square': '**2',
+    'squared': '**2',
+    'cube': '**3',
+    'cubed': '**3',
+    'percent': '/100',
+    'percent of': '/100*',
+    'of': '*',
+    'decimal': '.',
+    'point': '.',
+    '%': '/100',
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    'x': '*',
+    '×': '*',
+    '/': '/',
+    '÷': '/',
+    '^': '**',
+    '(': '(',
+    ')': ')',
+    '.': '.'
+}
+
+# Calculator functions; "sin of 30" opens a call rather than multiplying
+FUNCTIONS = ('sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'abs', 'round', 'floor', 'ceil')
+
+# Number kinds "x" must sit between to mean "times" (otherwise it is the variable x)
+NUMBER_KINDS = (NUMBER, HUNDRED, SCALE, DIGITS)
+
+FILLERS = (
+    'um', 'uh', 'please', 'can you', 'what is', "what's", 'calculate',
+    'the', 'a', 'equals', 'is', '='
+)
+
+# One pass over the transcript: numbers, hyphenated words, or single symbols
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)?|[a-z]+(?:'[a-z]+)?(?:-[a-z]+)*|\S")
+
+
+def _build_phrase_trie() -> Dict:
+    """Build the word-level trie used for longest-match phrase lookup"""
+    entries: Dict[str, Tuple[str, object]] = {}
+    
+    for word, value in UNITS.items():
+        entries[word] = (NUMBER, (UNIT, value))
+    for word, value in TEENS.items():
+        entries[word] = (NUMBER, (TEEN, value))
+    for word, value in TENS_WORDS.items():
+        entries[word] = (NUMBER, (TENS, value))
+    entries['zero'] = (NUMBER, (ZERO, 0))
+    entries['hundred'] = (HUNDRED, 100)
+    for word, value in SCALES.items():
+        entries[word] = (SCALE, value)
+    for word, value in FRACTIONS.items():
+        entries[word] = (FRACTION, value)
+    for phrase, value in OPERATORS.items():
+        entries[phrase] = (OPERATOR, value)
+    for phrase in FILLERS:
+        entries[phrase] = (FILLER, None)
+    for name in FUNCTIONS:
+        entries[name] = (FUNCTION, name)
+    entries['and'] = (AND, '+')
+    
+    trie: Dict = {}
+    for phrase, entry in entries.items():
+        node = trie
+        for word in phrase.split():
+            node = node.setdefault(word, {})
+        node[None] = entry
+    return trie
+
+
+PHRASE_TRIE = _build_phrase_trie()
+
+
+def _format_number(value: Union[int, float]) -> str:
+    """Format a number the way it should appear in an expression"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class _NumberBuilder:
+    """Accumulates consecutive number words into a single value"""
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.active = False
+        self.total = 0
+        self.current = 0
+        self.last = None
+        self.smallest_scale = None
+    
+    @property
+    def value(self) -> Union[int, float]:
+        return self.total + self.current
+    
+    def can_extend(self, kind: str, value) -> bool:
+        """Check whether a number word continues the number being built"""
+        if not self.active:
+            return False
+        
+        if kind == NUMBER:
+            word_class, _ = value
+            if word_class == UNIT:
+                return self.last in (TENS, HUNDRED, SCALE)
+            if word_class in (TEEN, TENS):
+                return self.last in (HUNDRED, SCALE)
+            return False
+        
+        if kind == HUNDRED:
+            return self.last in (UNIT, TEEN, DIGITS) and 0 < self.current < 100
+        
+        if kind == SCALE:
+            return (self.current > 0 and self.last != SCALE and
+                    (self.smallest_scale is None or value < self.smallest_scale))
+        
+        return False
+    
+    def start(self, kind: str, value):
+        """Start a new number from a number word or digit token"""
+        self.reset()
+        self.active = True
+        
+        if kind == HUNDRED:
+            self.current, self.last = 100, HUNDRED
+        elif kind == SCALE:
+            self.total, self.last, self.smallest_scale = value, SCALE, value
+        elif kind == DIGITS:
+            self.current, self.last = value, DIGITS
+        else:
+            self.last, self.current = value
+    
+    def extend(self, kind: str, value):
+        """Add a number word that can_extend() accepted"""
+        if kind == NUMBER:
+            self.last, amount = value
+            self.current += amount
+        elif kind == HUNDRED:
+            self.current *= 100
+            self.last = HUNDRED
+        elif kind == SCALE:
+            self.total += self.current * value
+            self.current = 0
+            self.smallest_scale = value
+            self.last = SCALE
+
+
+class VoiceTranslator:
+    """Single-pass translator from spoken arithmetic to expression strings"""
+    
+    def __init__(self, trie: Optional[Dict] = None):
+        self.trie = trie if trie is not None else PHRASE_TRIE
+    
+    def translate(self, voice_text: str) -> str:
+        """
+        Convert voice input to mathematical expression
+        
+        Args:
+            voice_text: Transcribed voice input
+        
+        Returns:
+            Mathematical expression string
+        """
+        if not voice_text:
+            return ""
+        
+        words = self._tokenize(voice_text)
+        phrases = self._match_phrases(words)
+        
+        output: List[str] = []
+        number = _NumberBuilder()
+        
+        def flush():
+            if number.active:
+                output.append(_format_number(number.value))
+                number.reset()
+        
+        index = 0
+        while index < len(phrases):
+            kind, value, text = phrases[index]
+            index += 1
+            
+            if kind in (NUMBER, HUNDRED, SCALE, DIGITS):
+                if number.can_extend(kind, value):
+                    number.extend(kind, value)
+                else:
+                    flush()
+                    number.start(kind, value)
+            
+            elif kind == AND:
+                following = phrases[index] if index < len(phrases) else None
+                # "one hundred and five" continues the number
+                if (number.last in (HUNDRED, SCALE) and following is not None and
+                        number.can_extend(following[0], following[1])):
+                    continue
+                # "two and a half" is 2.5 rather than 2 + 0.5
+                fraction = self._fraction_after_and(phrases, index)
+                if number.active and fraction is not None:
+                    denominator, consumed = fraction
+                    number.current += 1 / denominator
+                    number.last = FRACTION
+                    index += consumed
+                    continue
+                flush()
+                output.append(value)
+            
+            elif kind == FRACTION:
+                # "three quarters" -> 0.75, a bare "half" -> 0.5
+                numerator = number.value if number.active else 1
+                number.reset()
+                output.append(_format_number(numerator / value))
+            
+            elif kind == FUNCTION:
+                flush()
+                output.append(value)
+                if index < len(phrases) and phrases[index][2] == 'of':
+                    output.append('(')
+                    index += 1
+            
+            elif kind == OPERATOR:
+                following = phrases[index] if index < len(phrases) else None
+                if text == 'x' and not (number.active and following is not None and
+                                        following[0] in NUMBER_KINDS):
+                    # "x squared": the variable, not "times"
+                    flush()
+                    output.append(text)
+                    continue
+                flush()
+                output.append(value)
+            
+            elif kind == FILLER:
+                flush()
+            
+            else:
+                # Unknown words are kept as-is
+                flush()
+                output.append(text)
+        
+        flush()
+        return ''.join(output)
+    
+    def _fraction_after_and(self, phrases: List[Tuple[str, object, str]],
+                            index: int) -> Optional[Tuple[int, int]]:
+        """Return (denominator, phrases consumed) for "a half" / "a quarter" at index"""
+        consumed = 0
+        if index < len(phrases) and phrases[index][2] == 'a':
+            consumed = 1
+        position = index + consumed
+        if position < len(phrases) and phrases[position][0] == FRACTION:
+            return phrases[position][1], consumed + 1
+        return None
+    
+    def _tokenize(self, text: str) -> List[str]:
+        """Split a transcript into lowercase words, digit runs and symbols"""
+        words = []
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            if '-' in token and token[0].isalpha():
+                # Hyphenated number words such as "forty-two"
+                words.extend(token.split('-'))
+            else:
+                words.append(token)
+        return words
+    
+    def _match_phrases(self, words: List[str]) -> List[Tuple[str, object, str]]:
+        """Group words into (kind, value, text) using longest trie matches"""
+        phrases = []
+        index = 0
+        while index < len(words):
+            word = words[index]
+            
+            if word[0].isdigit():
+                number = float(word) if '.' in word else int(word)
+                phrases.append((DIGITS, number, word))
+                index += 1
+                continue
+            
+            node = self.trie
+            match, match_end = None, index
+            position = index
+            while position < len(words) and words[position] in node:
+                node = node[words[position]]
+                position += 1
+                if None in node:
+                    match, match_end = node[None], position
+            
+            if match is None:
+                phrases.append((None, None, word))
+                index += 1
+            else:
+                phrases.append((match[0], match[1], ' '.join(words[index:match_end])))
+                index = match_end
+        
+        return phrases
@@ -0,0 +1,273 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+
+import audio_processing
+from audio_processing import TARGET_RATE, TARGET_WIDTH, FRAME_SECONDS, MIN_SPEECH_RMS, SPEECH_TO_NOISE_RATIO
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = int(TARGET_RATE * FRAME_SECONDS) * TARGET_WIDTH
+
+# Phrase segmentation
+PHRASE_END_SILENCE_SECONDS = 0.5
+PHRASE_PADDING_SECONDS = 0.15
+MIN_PHRASE_SPEECH_SECONDS = 0.1
+MAX_PHRASE_SECONDS = 15.0
+NOISE_FLOOR_SMOOTHING = 0.05
+
+
+class VoiceStreamSession:
+    """
+    Incremental phrase detection over a stream of raw PCM chunks
+    
+    Audio is converted to 16 kHz mono as it arrives and split into 20 ms
+    frames. A phrase starts on the first frame above the adaptive speech
+    threshold and ends after PHRASE_END_SILENCE_SECONDS of quiet; each
+    finished phrase is handed to the recognizer while audio keeps arriving.
+    """
+    
+    def __init__(self, recognize: Callable[[bytes], Dict[str, Any]], executor: ThreadPoolExecutor,
+                 sample_rate: int = TARGET_RATE, channels: int = 1, sample_width: int = TARGET_WIDTH):
+        """
+        Args:
+            recognize: Called with 16 kHz mono PCM of one phrase; returns its result fields
+            executor: Pool phrases are recognized on
+            sample_rate: Rate of the incoming PCM
+            channels: Channels of the incoming PCM (interleaved)
+            sample_width: Bytes per sample of the incoming PCM
+        """
+        self.id = uuid.uuid4().hex
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.last_active = time.monotonic()
+        
+        self._recognize = recognize
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._input_remainder = b''
+        self._converter = audio_processing.StreamConverter(channels, sample_width, sample_rate)
+        self._pcm_remainder = b''
+        self._frames_seen = 0
+        self._noise_floor = None
+        
+        padding_frames = int(PHRASE_PADDING_SECONDS / FRAME_SECONDS)
+        self._preroll = deque(maxlen=padding_frames)
+        self._phrase = []
+        self._phrase_start = 0
+        self._speech_frames = 0
+        self._silent_run = 0
+        
+        self._results = []
+        self._futures = []
+        self._delivered = 0
+    
+    def feed(self, chunk: bytes):
+        """Add a chunk of raw PCM; any phrases it completes start recognizing"""
+        with self._lock:
+            self.last_active = time.monotonic()
+            frame_size = self.channels * self.sample_width
+            data = self._input_remainder + chunk
+            usable = len(data) // frame_size * frame_size
+            self._input_remainder = data[usable:]
+            if not usable:
+                return
+            
+            pcm = self._converter.convert(data[:usable])
+            pcm = self._pcm_remainder + pcm
+            frames = len(pcm) // FRAME_BYTES
+            self._pcm_remainder = pcm[frames * FRAME_BYTES:]
+            
+            energies = audio_processing.frame_energies(pcm[:frames * FRAME_BYTES])
+            for index, energy in enumerate(energies):
+                self._process_frame(pcm[index * FRAME_BYTES:(index + 1) * FRAME_BYTES], energy)
+    
+    def finish(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Flush the last phrase and wait for every phrase to be recognized"""
+        with self._lock:
+            self.last_active = time.monotonic()
+            if self._phrase:
+                self._end_phrase()
+            futures = list(self._futures)
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                # Failures are recorded in the phrase result itself
+                pass
+        return self.results()
+    
+    def results(self) -> List[Dict[str, Any]]:
+        """All phrase results so far, in order"""
+        with self._lock:
+            return [dict(result) for result in self._results]
+    
+    def new_results(self) -> List[Dict[str, Any]]:
+        """Phrase results finished since the last call, stopping at the first unfinished one"""
+        with self._lock:
+            fresh = []
+            while self._delivered < len(self._results) and self._results[self._delivered]['status'] != 'pending':
+                fresh.append(dict(self._results[self._delivered]))
+                self._delivered += 1
+            return fresh
+    
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for result in self._results if result['status'] == 'pending')
+    
+    def _threshold(self) -> float:
+        if self._noise_floor is None:
+            return MIN_SPEECH_RMS
+        return max(MIN_SPEECH_RMS, self._noise_floor * SPEECH_TO_NOISE_RATIO)
+    
+    def _process_frame(self, frame: bytes, energy: float):
+        """Advance the phrase state machine by one frame"""
+        position = self._frames_seen
+        self._frames_seen += 1
+        is_speech = energy > self._threshold()
+        
+        if not is_speech:
+            # Track the background level from quiet frames only
+            if self._noise_floor is None:
+                self._noise_floor = energy
+            else:
+                self._noise_floor += NOISE_FLOOR_SMOOTHING * (energy - self._noise_floor)
+        
+        if not self._phrase:
+            if is_speech:
+                self._phrase = list(self._preroll) + [frame]
+                self._phrase_start = position - len(self._preroll)
+                self._speech_frames = 1
+                self._silent_run = 0
+                self._preroll.clear()
+            else:
+                self._preroll.append(frame)
+            return
+        
+        self._phrase.append(frame)
+        if is_speech:
+            self._speech_frames += 1
+            self._silent_run = 0
+        else:
+            self._silent_run += 1
+        
+        if (self._silent_run * FRAME_SECONDS >= PHRASE_END_SILENCE_SECONDS or
+                len(self._phrase) * FRAME_SECONDS >= MAX_PHRASE_SECONDS):
+            self._end_phrase()
+    
+    def _end_phrase(self):
+        """Hand the current phrase to the recognizer (called with the lock held)"""
+        phrase, speech_frames = self._phrase, self._speech_frames
+        start = self._phrase_start
+        self._phrase, self._speech_frames = [], 0
+        
+        # Keep PHRASE_PADDING_SECONDS of the trailing silence
+        padding = self._preroll.maxlen
+        if self._silent_run > padding:
+            phrase = phrase[:len(phrase) - (self._silent_run - padding)]
+        self._silent_run = 0
+        
+        if speech_frames * FRAME_SECONDS < MIN_PHRASE_SPEECH_SECONDS:
+            return
+        
+        result = {
+            'index': len(self._results),
+            'start': round(start * FRAME_SECONDS, 3),
+            'end': round((start + len(phrase)) * FRAME_SECONDS, 3),
+            'status': 'pending',
+            'transcribed_text': None,
+            'expression': None
+        }
+        self._results.append(result)
+        self._futures.append(self._executor.submit(self._run_phrase, result, b''.join(phrase)))
+    
+    def _run_phrase(self, result: Dict[str, Any], pcm: bytes):
+        try:
+            fields = self._recognize(pcm)
+            status = 'done'
+        except Exception as e:
+            logger.error(f"Voice stream recognition error: {e}")
+            fields, status = {}, 'failed'
+        with self._lock:
+            result.update(fields)
+            result['status'] = status
+
+
+class VoiceStreamManager:
+    """Tracks open voice streams and the pool their phrases are recognized on"""
+    
+    def __init__(self, recognize: Callable[[bytes, str], Dict[str, Any]], max_sessions: int = 100,
+                 idle_timeout: float = 60.0, workers: int = 4):
+        """
+        Args:
+            recognize: Called with (16 kHz mono PCM, language) for each phrase
+            max_sessions: Open streams allowed at once
+            idle_timeout: Seconds without a chunk before a stream is dropped
+            workers: Threads recognizing phrases
+        """
+        self.recognize = recognize
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice-stream')
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def open(self, sample_rate: int = TARGET_RATE, channels: int = 1, sample_width: int = TARGET_WIDTH,
+             language: str = "en-US") -> VoiceStreamSession:
+        """
+        Start a stream
+        
+        Raises:
+            ValueError: If the audio format is not supported
+            RuntimeError: If too many streams are open
+        """
+        if not 8000 <= sample_rate <= 192000:
+            raise ValueError("sample_rate must be between 8000 and 192000")
+        if not 1 <= channels <= 8:
+            raise ValueError("channels must be between 1 and 8")
+        if sample_width not in (1, 2, 3, 4):
+            raise ValueError("sample_width must be 1, 2, 3 or 4 bytes")
+        
+        self.expire_idle()
+        session = VoiceStreamSession(
+            lambda pcm: self.recognize(pcm, language), self._executor,
+            sample_rate=sample_rate, channels=channels, sample_width=sample_width
+        )
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError("Too many open voice streams")
+            self._sessions[session.id] = session
+        return session
+    
+    @property
+    def active(self) -> int:
+        """Open streams"""
+        with self._lock:
+            return len(self._sessions)
+    
+    def get(self, session_id: str) -> Optional[VoiceStreamSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+    
+    def close(self, session_id: str) -> Optional[VoiceStreamSession]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+    
+    def expire_idle(self):
+        """Drop streams that have not been fed within idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.last_active < cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+        if expired:
+            logger.info(f"Expired {len(expired)} idle voice streams")
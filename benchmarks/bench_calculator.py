@@ -0,0 +1,77 @@
+"""
+Micro-benchmark: Calculator.evaluate and parse_voice_input
+
+Times expression evaluation with a warm compiled-expression cache (repeat
+expressions), a cold one (cache cleared before every call), batch
+evaluation, and voice transcript translation through the Calculator.
+
+Usage:
+    python benchmarks/bench_calculator.py [--number N] [--repeat R]
+"""
+import argparse
+import json
+
+from common import environment, time_calls
+from bench_voice_parser import TRANSCRIPTS
+
+from calculator import Calculator  # noqa: E402
+
+EXPRESSIONS = [
+    "2+3*4",
+    "sqrt(16) + 2^10",
+    "sin(pi/2) * cos(0)",
+    "(2+3)*4 - 10/2",
+    "log(1000) + ln(e)",
+    "abs(-5) + round(3.7) + floor(2.5)",
+    "pow(2, 16) / max(3, 7, 5) - min(1, ceil(0.2))",
+    "2*pi*6371",
+]
+
+
+def run(number: int = 2000, repeat: int = 5) -> dict:
+    """Time the Calculator entry points over the sample inputs"""
+    calculator = Calculator()
+    
+    def evaluate_all():
+        for expression in EXPRESSIONS:
+            calculator.evaluate(expression)
+    
+    def evaluate_all_cold():
+        for expression in EXPRESSIONS:
+            calculator.cache.clear()
+            calculator.evaluate(expression)
+    
+    def parse_all():
+        for text in TRANSCRIPTS:
+            calculator.parse_voice_input(text)
+    
+    evaluate_all()
+    results = {
+        'evaluate_warm': time_calls(evaluate_all, number, repeat, len(EXPRESSIONS)),
+        'evaluate_cold': time_calls(evaluate_all_cold, max(1, number // 4), repeat, len(EXPRESSIONS)),
+        'evaluate_batch': time_calls(
+            lambda: calculator.evaluate_batch(EXPRESSIONS), number, repeat, len(EXPRESSIONS)
+        ),
+        'parse_voice_input': time_calls(parse_all, number, repeat, len(TRANSCRIPTS))
+    }
+    
+    return {
+        'benchmark': 'calculator',
+        'environment': environment(),
+        'number': number,
+        'repeat': repeat,
+        'results': results,
+        'samples': [
+            {'expression': expression, 'result': calculator.evaluate(expression)}
+            for expression in EXPRESSIONS
+        ]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='Calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs')
+    args = parser.parse_args()
+    
+    print(json.dumps(run(args.number, args.repeat), indent=2))
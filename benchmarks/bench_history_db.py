@@ -0,0 +1,208 @@
+"""
+Micro-benchmark: HistoryDB methods at increasing table sizes
+
+Each size gets a fresh database in a temporary directory, seeded with rows
+spread over SESSIONS sessions and a year of timestamps, then every public
+HistoryDB method is timed against it. Writes made while timing are a small
+fraction of the table, so later methods still see roughly the seeded size.
+
+Usage:
+    python benchmarks/bench_history_db.py [--rows 1000,100000,1000000] [--repeat R]
+"""
+import argparse
+import itertools
+import json
+import logging
+import operator
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import environment, time_calls
+
+from history_db import HistoryDB  # noqa: E402
+
+DEFAULT_ROWS = (1000, 100000, 1000000)
+SESSIONS = 100
+SEED_CHUNK = 50000
+
+OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+
+def seed(db: HistoryDB, rows: int, rng: random.Random) -> float:
+    """
+    Fill the calculations and sessions tables directly with executemany
+    
+    Seeding goes around add_calculations so that rows get realistic, spread
+    out timestamps; returns the seconds it took.
+    """
+    start = time.perf_counter()
+    connection = db.connection
+    now = datetime.now()
+    with db.write_lock:
+        connection.execute("INSERT INTO user_agents (id, user_agent) VALUES (1, 'bench-agent/1.0')")
+        connection.executemany(
+            'INSERT INTO ip_addresses (id, ip_address) VALUES (?, ?)',
+            [(index + 1, f'10.0.{index // 256}.{index % 256}') for index in range(SESSIONS)]
+        )
+        connection.executemany(
+            'INSERT INTO sessions (session_id, user_agent_id, ip_address_id, calculation_count) VALUES (?, ?, ?, ?)',
+            [(f'session-{index}', 1, index + 1, 0) for index in range(SESSIONS)]
+        )
+        for offset in range(0, rows, SEED_CHUNK):
+            batch = []
+            for _ in range(min(SEED_CHUNK, rows - offset)):
+                a, b = rng.randint(1, 9999), rng.randint(1, 9999)
+                symbol = rng.choice(list(OPERATORS))
+                timestamp = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+                batch.append((
+                    f'{a}{symbol}{b}', str(OPERATORS[symbol](a, b)), None,
+                    f'session-{rng.randrange(SESSIONS)}', 1, 1,
+                    rng.random() / 1000, timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                ))
+            connection.executemany('''
+                INSERT INTO calculations (
+                    expression, result, voice_input, session_id,
+                    user_agent_id, ip_address_id, execution_time, timestamp
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+        connection.execute('''
+            UPDATE sessions SET calculation_count = (
+                SELECT COUNT(*) FROM calculations WHERE calculations.session_id = sessions.session_id
+            )
+        ''')
+        connection.commit()
+    connection.execute('ANALYZE')
+    return time.perf_counter() - start
+
+
+def bench_size(rows: int, directory: str, repeat: int, rng: random.Random) -> dict:
+    """Time every HistoryDB method against a table of rows calculations"""
+    db = HistoryDB(os.path.join(directory, f'history_{rows}.db'))
+    seed_seconds = seed(db, rows, rng)
+    max_id = rows
+    # Methods that scan the table run fewer times on the big ones
+    scan_number = 1 if rows >= 100000 else 5
+    
+    ids = itertools.count(1)
+    deletable = iter(range(max_id, 0, -1))
+    
+    def add_one():
+        db.add_calculation('2+2', 4, session_id='bench-writes', user_agent='bench-agent/1.0',
+                           ip_address='10.0.0.1', execution_time=0.0001)
+    
+    records = [{'expression': '3*3', 'result': 9, 'session_id': 'bench-writes'} for _ in range(100)]
+    
+    def walk_pages(pages: int = 10):
+        cursor = None
+        for _ in range(pages):
+            page = db.get_history_page(limit=50, cursor=cursor)
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+    
+    backups = itertools.count()
+    
+    results = {
+        'add_calculation': time_calls(add_one, 200, repeat),
+        'add_calculations': time_calls(lambda: db.add_calculations(records), 10, repeat, len(records)),
+        'get_history': time_calls(lambda: db.get_history(page=1, limit=50), 50, repeat),
+        'get_history_deep_page': time_calls(
+            lambda: db.get_history(page=max(1, rows // 100), limit=50), scan_number, repeat
+        ),
+        'get_history_session': time_calls(
+            lambda: db.get_history(page=1, limit=50, session_id='session-7'), 50, repeat
+        ),
+        'get_history_page': time_calls(lambda: db.get_history_page(limit=50), 50, repeat),
+        'get_history_page_walk_10': time_calls(walk_pages, 10, repeat, 10),
+        'get_history_page_with_total': time_calls(
+            lambda: db.get_history_page(limit=50, include_total=True), scan_number, repeat
+        ),
+        'get_history_count': time_calls(db.get_history_count, scan_number, repeat),
+        'get_history_count_session': time_calls(
+            lambda: db.get_history_count(session_id='session-7'), 50, repeat
+        ),
+        'get_calculation': time_calls(
+            lambda: db.get_calculation(next(ids) % max_id + 1), 500, repeat
+        ),
+        'iter_history': time_calls(lambda: sum(1 for _ in db.iter_history()), 1, repeat, rows),
+        'get_all_history_session': time_calls(
+            lambda: db.get_all_history(session_id='session-7'), scan_number, repeat
+        ),
+        'create_session': time_calls(
+            lambda: db.create_session(f'bench-session-{next(ids)}', 'bench-agent/1.0', '10.0.0.1'),
+            100, repeat
+        ),
+        'get_session_stats': time_calls(lambda: db.get_session_stats('session-7'), 50, repeat),
+        'set_setting': time_calls(lambda: db.set_setting('voice_rate', next(ids)), 100, repeat),
+        'get_settings': time_calls(db.get_settings, 200, repeat),
+        'get_statistics': time_calls(db.get_statistics, 50, repeat),
+        'get_daily_statistics': time_calls(lambda: db.get_daily_statistics(30), 50, repeat),
+        'search_history': time_calls(lambda: db.search_history('42', limit=50), 20, repeat),
+        'search_history_session': time_calls(
+            lambda: db.search_history('42', limit=50, session_id='session-7'), 20, repeat
+        ),
+        'delete_calculation': time_calls(lambda: db.delete_calculation(next(deletable)), 100, repeat),
+        'clear_history_session': time_calls(
+            lambda: db.clear_history(session_id='bench-writes'), 1, repeat
+        ),
+        'backup_database': time_calls(
+            lambda: db.backup_database(os.path.join(directory, f'backup_{rows}_{next(backups)}.db')),
+            1, min(repeat, 2)
+        ),
+        'is_connected': time_calls(db.is_connected, 200, repeat)
+    }
+    
+    # Last, since it moves half of the seeded year out of the main table
+    start = time.perf_counter()
+    archived = db.archive_history(older_than_days=182)
+    results['archive_history'] = {'seconds': time.perf_counter() - start, 'rows': archived}
+    results['get_history_page_walk_10_archived'] = time_calls(walk_pages, 10, repeat, 10)
+    db.close()
+    
+    # Write-behind mode: enqueue cost on the request thread, then the drain
+    db = HistoryDB(os.path.join(directory, f'history_{rows}.db'), write_behind=True)
+    enqueue = time_calls(add_one, 2000, 1)
+    start = time.perf_counter()
+    db.flush()
+    results['add_calculation_write_behind'] = enqueue
+    results['flush_2000_queued'] = {'seconds': time.perf_counter() - start}
+    db.close()
+    
+    return {
+        'rows': rows,
+        'seed_seconds': seed_seconds,
+        'database_bytes': os.path.getsize(os.path.join(directory, f'history_{rows}.db')),
+        'results': results
+    }
+
+
+def run(rows=DEFAULT_ROWS, repeat: int = 3, seed_value: int = 1) -> dict:
+    """Benchmark HistoryDB at each table size in rows"""
+    rng = random.Random(seed_value)
+    sizes = []
+    with tempfile.TemporaryDirectory(prefix='bench_history_') as directory:
+        for count in rows:
+            sizes.append(bench_size(count, directory, repeat, rng))
+    return {
+        'benchmark': 'history_db',
+        'environment': environment(),
+        'repeat': repeat,
+        'seed': seed_value,
+        'sizes': sizes
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', default=','.join(str(count) for count in DEFAULT_ROWS),
+                        help='Comma-separated table sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the seeded rows')
+    args = parser.parse_args()
+    
+    # HistoryDB logs every write at INFO
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(run([int(count) for count in args.rows.split(',')], args.repeat, args.seed), indent=2))
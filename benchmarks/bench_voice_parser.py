@@ -0,0 +1,174 @@
+"""
+Micro-benchmark: voice transcript translation
+
+Compares VoiceTranslator (single pass over a precompiled phrase trie) with
+the previous Calculator.parse_voice_input, which ran one re.sub per filler
+word, voice pattern, compound number and fraction on every call.
+
+Usage:
+    python benchmarks/bench_voice_parser.py [--number N] [--repeat R]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from voice_parser import VoiceTranslator  # noqa: E402
+
+TRANSCRIPTS = [
+    "what is twenty five plus seventeen",
+    "calculate three hundred forty-two thousand divided by six",
+    "um the square root of one hundred and forty four",
+    "two and a half times four",
+    "three point one four times ten squared",
+    "please what is one half plus three quarters",
+    "nine to the power of three minus eighty one",
+    "seventy two percent of fifteen hundred",
+]
+
+LEGACY_VOICE_PATTERNS = {
+        r'\bplus\b|\band\b': '+',
+        r'\bminus\b|\bsubtract\b': '-',
+        r'\btimes\b|\bmultiplied by\b|\binto\b': '*',
+        r'\bdivided by\b|\bover\b': '/',
+        r'\bpower of\b|\bto the power of\b|\braised to\b': '**',
+        r'\bsquare root of\b|\broot\b': 'sqrt(',
+        r'\bsquare\b': '**2',
+        r'\bcube\b': '**3',
+        r'\bpercent\b|\b%\b': '/100',
+        r'\bequals\b|\bis\b|\bcalculate\b': '=',
+        r'\bdecimal\b|\bpoint\b': '.',
+        r'\bzero\b': '0',
+        r'\bone\b': '1',
+        r'\btwo\b': '2',
+        r'\bthree\b': '3',
+        r'\bfour\b': '4',
+        r'\bfive\b': '5',
+        r'\bsix\b': '6',
+        r'\bseven\b': '7',
+        r'\beight\b': '8',
+        r'\bnine\b': '9',
+        r'\bten\b': '10',
+        r'\beleven\b': '11',
+        r'\btwelve\b': '12',
+        r'\bthirteen\b': '13',
+        r'\bfourteen\b': '14',
+        r'\bfifteen\b': '15',
+        r'\bsixteen\b': '16',
+        r'\bseventeen\b': '17',
+        r'\beighteen\b': '18',
+        r'\bnineteen\b': '19',
+        r'\btwenty\b': '20',
+        r'\bthirty\b': '30',
+        r'\bforty\b': '40',
+        r'\bfifty\b': '50',
+        r'\bsixty\b': '60',
+        r'\bseventy\b': '70',
+        r'\beighty\b': '80',
+        r'\bninety\b': '90',
+        r'\bhundred\b': '100',
+        r'\bthousand\b': '1000'
+}
+
+LEGACY_COMPOUND_PATTERNS = {
+        r'twenty[- ]one': '21',
+        r'twenty[- ]two': '22',
+        r'twenty[- ]three': '23',
+        r'twenty[- ]four': '24',
+        r'twenty[- ]five': '25',
+        r'twenty[- ]six': '26',
+        r'twenty[- ]seven': '27',
+        r'twenty[- ]eight': '28',
+        r'twenty[- ]nine': '29',
+        r'thirty[- ]one': '31',
+        r'thirty[- ]two': '32',
+        r'thirty[- ]three': '33',
+        r'thirty[- ]four': '34',
+        r'thirty[- ]five': '35',
+        r'thirty[- ]six': '36',
+        r'thirty[- ]seven': '37',
+        r'thirty[- ]eight': '38',
+        r'thirty[- ]nine': '39',
+}
+
+LEGACY_FRACTION_PATTERNS = {
+    r'one half': '0.5',
+    r'half': '0.5',
+    r'quarter': '0.25',
+    r'three quarters': '0.75'
+}
+
+
+def legacy_parse_voice_input(voice_text: str) -> str:
+    """The regex-chain implementation VoiceTranslator replaced"""
+    if not voice_text:
+        return ""
+    
+    text = voice_text.lower().strip()
+    
+    filler_words = ['um', 'uh', 'please', 'can you', 'what is', 'calculate']
+    for word in filler_words:
+        text = re.sub(rf'\b{word}\b', '', text)
+    
+    for pattern, replacement in LEGACY_VOICE_PATTERNS.items():
+        text = re.sub(pattern, replacement, text)
+    
+    for pattern, replacement in LEGACY_COMPOUND_PATTERNS.items():
+        text = re.sub(pattern, replacement, text)
+    
+    for pattern, replacement in LEGACY_FRACTION_PATTERNS.items():
+        text = re.sub(pattern, replacement, text)
+    
+    text = re.sub(r'\s+', '', text)
+    text = re.sub(r'=+', '', text)
+    
+    return text
+
+
+def run(number: int = 2000, repeat: int = 5) -> dict:
+    """Time both implementations over the sample transcripts"""
+    translator = VoiceTranslator()
+    
+    def bench(func):
+        timings = timeit.repeat(
+            lambda: [func(text) for text in TRANSCRIPTS],
+            number=number, repeat=repeat
+        )
+        calls = number * len(TRANSCRIPTS)
+        return {
+            'best_us_per_call': min(timings) / calls * 1e6,
+            'mean_us_per_call': sum(timings) / len(timings) / calls * 1e6
+        }
+    
+    legacy = bench(legacy_parse_voice_input)
+    current = bench(translator.translate)
+    
+    return {
+        'benchmark': 'voice_parser',
+        'number': number,
+        'repeat': repeat,
+        'legacy': legacy,
+        'translator': current,
+        'speedup': legacy['best_us_per_call'] / current['best_us_per_call'],
+        'samples': [
+            {
+                'text': text,
+                'legacy': legacy_parse_voice_input(text),
+                'translator': translator.translate(text)
+            }
+            for text in TRANSCRIPTS
+        ]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='Calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs')
+    args = parser.parse_args()
+    
+    print(json.dumps(run(args.number, args.repeat), indent=2))
@@ -0,0 +1,71 @@
+"""
+Shared helpers for the benchmark scripts
+
+Every benchmark exposes run(...) -> dict and prints that dict as JSON when
+executed directly, so results can be saved per release and compared with
+run_all.py --baseline.
+"""
+import math
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def environment() -> dict:
+    """Where a result set was produced"""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def time_calls(func, number: int, repeat: int = 5, calls_per_run: int = 1) -> dict:
+    """
+    Time func() the way timeit does and report per-call figures
+    
+    Args:
+        func: Zero-argument callable
+        number: Calls per timing run
+        repeat: Timing runs; the best run is the least disturbed one
+        calls_per_run: Operations one func() call performs (for per-operation figures)
+    """
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    calls = number * calls_per_run
+    return {
+        'calls': calls,
+        'best_us_per_call': min(timings) / calls * 1e6,
+        'mean_us_per_call': sum(timings) / len(timings) / calls * 1e6
+    }
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(seconds: list) -> dict:
+    """Summarize request latencies (in seconds) as milliseconds"""
+    ordered = sorted(seconds)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p90_ms': percentile(ordered, 90) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000
+    }
@@ -0,0 +1,234 @@
+"""
+Load test: drive the Flask API in-process with concurrent clients
+
+Runs a weighted mix of /api/calculate, /api/history, /api/export-history
+and /api/voice-to-text requests through Flask test clients on worker
+threads, so no server, network or speech service is needed. Speech
+recognition uses the fixture STT backend (every clip transcribes to
+FIXTURE_TRANSCRIPT) and synthesis is replaced by a stand-in that writes a
+short tone after a fixed delay. Everything runs in a temporary directory.
+
+Usage:
+    python benchmarks/load_test.py [--requests N] [--concurrency C] [--mix calculate=60,history=20,...]
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from collections import Counter
+
+from common import environment, latency_summary
+
+DEFAULT_MIX = {'calculate': 60, 'history': 20, 'export': 5, 'voice': 15}
+FIXTURE_TRANSCRIPT = "what is twelve times eleven"
+CLIP_RATE = 16000
+
+
+def make_clip(tone_hz: float, seconds: float = 0.6) -> bytes:
+    """16 kHz mono WAV: a tone between two stretches of silence"""
+    silence = [0] * int(CLIP_RATE * 0.3)
+    tone = [int(6000 * math.sin(2 * math.pi * tone_hz * index / CLIP_RATE))
+            for index in range(int(CLIP_RATE * seconds))]
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(CLIP_RATE)
+        wav.writeframes(array('h', silence + tone + silence).tobytes())
+    return buffer.getvalue()
+
+
+def install_offline_tts(tts_engine, latency: float):
+    """Replace the synthesizer with one that sleeps for latency and writes a tone"""
+    def synthesize(text, output_file):
+        time.sleep(latency)
+        path = os.path.join(tts_engine.output_dir, output_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        seconds = min(3.0, 0.06 * len(text))
+        with open(path, 'wb') as f:
+            f.write(make_clip(220.0, seconds))
+        return output_file
+    
+    tts_engine.backend = 'offline'
+    tts_engine._synthesize = synthesize
+
+
+def load_app(workdir: str, tts_latency: float):
+    """Import the Flask app configured for offline use from inside workdir"""
+    fixtures_path = os.path.join(workdir, 'stt_fixtures.json')
+    with open(fixtures_path, 'w', encoding='utf-8') as f:
+        json.dump({'*': FIXTURE_TRANSCRIPT}, f)
+    os.environ['STT_BACKEND'] = 'fixture'
+    os.environ['STT_FIXTURES'] = fixtures_path
+    
+    # The history database and audio folder are relative to the working directory
+    os.chdir(workdir)
+    import app as app_module
+    
+    install_offline_tts(app_module.tts_engine, tts_latency)
+    app_module.tts_jobs.start()
+    return app_module
+
+
+def scenario_calculate(client, rng, session_id, clips, audio_ratio):
+    a, b = rng.randint(1, 999), rng.randint(1, 999)
+    expression = rng.choice([f'{a}+{b}', f'{a}*{b}', f'sqrt({a})+{b}', f'({a}-{b})/7'])
+    return client.post('/api/calculate', headers={'X-Session-ID': session_id}, json={
+        'expression': expression,
+        'generate_audio': rng.random() < audio_ratio
+    })
+
+
+def scenario_history(client, rng, session_id, clips, audio_ratio):
+    return client.get('/api/history?limit=50', headers={'X-Session-ID': session_id})
+
+
+def scenario_export(client, rng, session_id, clips, audio_ratio):
+    export_format = rng.choice(['json', 'ndjson', 'csv'])
+    response = client.get(f'/api/export-history?format={export_format}',
+                          headers={'X-Session-ID': session_id})
+    # Streamed: the body is only produced while it is read
+    response.get_data()
+    return response
+
+
+def scenario_voice(client, rng, session_id, clips, audio_ratio):
+    return client.post('/api/voice-to-text', content_type='multipart/form-data', data={
+        'audio': (io.BytesIO(rng.choice(clips)), 'clip.wav')
+    })
+
+
+SCENARIOS = {
+    'calculate': scenario_calculate,
+    'history': scenario_history,
+    'export': scenario_export,
+    'voice': scenario_voice
+}
+
+
+def parse_mix(text: str) -> dict:
+    """Parse 'calculate=60,history=20' into scenario weights"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}'; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(requests: int = 2000, concurrency: int = 8, mix: dict = None, warmup: int = 50,
+        audio_ratio: float = 0.2, tts_latency: float = 0.05, seed: int = 1) -> dict:
+    """
+    Drive the API with concurrency client threads until requests have been made
+    
+    Args:
+        requests: Measured requests across all clients
+        concurrency: Client threads
+        mix: Scenario name -> relative weight
+        warmup: Requests made (and discarded) before measuring
+        audio_ratio: Share of calculations that ask for speech
+        tts_latency: Seconds the synthesizer stand-in takes per render
+        seed: Seed for the request sequence of each client
+    """
+    mix = dict(mix or DEFAULT_MIX)
+    names, weights = list(mix), list(mix.values())
+    clips = [make_clip(tone_hz) for tone_hz in (180.0, 240.0, 330.0, 440.0)]
+    
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='load_test_') as workdir:
+        app_module = load_app(workdir, tts_latency)
+        try:
+            def drive(index, count, samples):
+                rng = random.Random(seed * 1000 + index)
+                client = app_module.app.test_client()
+                session_id = f'load-{index}'
+                for _ in range(count):
+                    name = rng.choices(names, weights)[0]
+                    start = time.perf_counter()
+                    try:
+                        status = SCENARIOS[name](client, rng, session_id, clips, audio_ratio).status_code
+                    except Exception as e:
+                        status = f'exception: {type(e).__name__}'
+                    samples.append((name, status, time.perf_counter() - start))
+            
+            def run_clients(total):
+                per_client = [total // concurrency + (1 if index < total % concurrency else 0)
+                              for index in range(concurrency)]
+                samples = []
+                threads = [threading.Thread(target=drive, args=(index, count, samples))
+                           for index, count in enumerate(per_client)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                return samples, time.perf_counter() - start
+            
+            run_clients(warmup)
+            samples, elapsed = run_clients(requests)
+            app_module.history_db.flush()
+            history_rows = app_module.history_db.get_history_count()
+        finally:
+            app_module.evaluator.shutdown()
+            app_module.history_db.close()
+            os.chdir(original_cwd)
+    
+    scenarios = {}
+    for name in names:
+        matching = [sample for sample in samples if sample[0] == name]
+        statuses = Counter(str(status) for _, status, _ in matching)
+        scenarios[name] = {
+            'requests': len(matching),
+            'errors': sum(1 for _, status, _ in matching if not (isinstance(status, int) and status < 400)),
+            'status_counts': dict(statuses),
+            'throughput_rps': len(matching) / elapsed if elapsed else 0.0,
+            'latency': latency_summary([seconds for _, _, seconds in matching])
+        }
+    
+    return {
+        'benchmark': 'load_test',
+        'environment': environment(),
+        'config': {
+            'requests': requests,
+            'concurrency': concurrency,
+            'mix': mix,
+            'warmup': warmup,
+            'audio_ratio': audio_ratio,
+            'tts_latency_ms': tts_latency * 1000,
+            'seed': seed
+        },
+        'duration_seconds': elapsed,
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        'errors': sum(scenario['errors'] for scenario in scenarios.values()),
+        'history_rows': history_rows,
+        'latency': latency_summary([seconds for _, _, seconds in samples]),
+        'scenarios': scenarios
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='Measured requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Scenario weights, e.g. calculate=60,history=20,export=5,voice=15')
+    parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests made first')
+    parser.add_argument('--audio-ratio', type=float, default=0.2, help='Share of calculations that request speech')
+    parser.add_argument('--tts-latency-ms', type=float, default=50.0, help='Synthesis stand-in delay')
+    parser.add_argument('--seed', type=int, default=1, help='Request sequence seed')
+    args = parser.parse_args()
+    
+    # The app logs every request and history write at INFO
+    logging.disable(logging.INFO)
+    print(json.dumps(run(args.requests, args.concurrency, args.mix, args.warmup,
+                         args.audio_ratio, args.tts_latency_ms / 1000, args.seed), indent=2))
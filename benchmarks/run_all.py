@@ -0,0 +1,116 @@
+"""
+Run every benchmark and optionally compare against a saved baseline
+
+Writes one JSON document holding each benchmark's results. With
+--baseline, the headline figures (per-call times, latency percentiles,
+throughput) are compared to a previous run and any that got worse by more
+than --tolerance are listed; the exit status is 1 if there were any.
+
+Usage:
+    python benchmarks/run_all.py --output results.json
+    python benchmarks/run_all.py --quick --baseline results.json
+"""
+import argparse
+import json
+import logging
+import sys
+
+from common import environment
+
+import bench_calculator
+import bench_history_db
+import bench_voice_parser
+import load_test
+
+
+def headline_figures(results: dict) -> dict:
+    """Flatten a run_all result into {figure name: (value, higher_is_better)}"""
+    figures = {}
+    benchmarks = results.get('benchmarks', {})
+    
+    for name, figure in benchmarks.get('calculator', {}).get('results', {}).items():
+        figures[f'calculator.{name}.us'] = (figure['best_us_per_call'], False)
+    
+    voice = benchmarks.get('voice_parser', {})
+    if 'translator' in voice:
+        figures['voice_parser.translator.us'] = (voice['translator']['best_us_per_call'], False)
+    
+    for size in benchmarks.get('history_db', {}).get('sizes', []):
+        for name, figure in size['results'].items():
+            if 'best_us_per_call' in figure:
+                figures[f"history_db.{size['rows']}.{name}.us"] = (figure['best_us_per_call'], False)
+    
+    load = benchmarks.get('load_test')
+    if load:
+        figures['load_test.throughput_rps'] = (load['throughput_rps'], True)
+        for percentile in ('p50_ms', 'p99_ms'):
+            figures[f'load_test.{percentile}'] = (load['latency'][percentile], False)
+            for name, scenario in load['scenarios'].items():
+                if scenario['requests']:
+                    figures[f'load_test.{name}.{percentile}'] = (scenario['latency'][percentile], False)
+    return figures
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """Figures present in both runs that regressed by more than tolerance (a fraction)"""
+    before, after = headline_figures(baseline), headline_figures(current)
+    regressions = []
+    for name, (value, higher_is_better) in sorted(after.items()):
+        if name not in before or not before[name][0]:
+            continue
+        old = before[name][0]
+        change = (value - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({'figure': name, 'baseline': old, 'current': value, 'change': change})
+    return regressions
+
+
+def run(quick: bool = False, history_rows=bench_history_db.DEFAULT_ROWS, skip=()) -> dict:
+    """Run each benchmark not in skip; quick uses fewer iterations and smaller tables"""
+    number, repeat = (200, 3) if quick else (2000, 5)
+    benchmarks = {}
+    if 'calculator' not in skip:
+        benchmarks['calculator'] = bench_calculator.run(number, repeat)
+    if 'voice_parser' not in skip:
+        benchmarks['voice_parser'] = bench_voice_parser.run(number, repeat)
+    if 'history_db' not in skip:
+        benchmarks['history_db'] = bench_history_db.run(history_rows, 2 if quick else 3)
+    # Last: it imports the app, which starts background threads and sandbox workers
+    if 'load_test' not in skip:
+        benchmarks['load_test'] = load_test.run(requests=300 if quick else 2000)
+    return {'environment': environment(), 'quick': quick, 'benchmarks': benchmarks}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='Write results to this file instead of stdout')
+    parser.add_argument('--baseline', help='Previous results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown as a fraction before a figure counts as a regression')
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations; history tables up to 100k rows')
+    parser.add_argument('--rows', help='Comma-separated history table sizes (overrides the default)')
+    parser.add_argument('--skip', default='', help='Comma-separated benchmarks to leave out')
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    if args.rows:
+        rows = [int(count) for count in args.rows.split(',')]
+    else:
+        rows = (1000, 100000) if args.quick else bench_history_db.DEFAULT_ROWS
+    results = run(args.quick, rows, set(filter(None, args.skip.split(','))))
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            results['regressions'] = compare(json.load(f), results, args.tolerance)
+    
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(document + '\n')
+    else:
+        print(document)
+    
+    for regression in results.get('regressions', []):
+        print(f"REGRESSION {regression['figure']}: {regression['baseline']:.3f} -> "
+              f"{regression['current']:.3f} ({regression['change']:+.0%})", file=sys.stderr)
+    sys.exit(1 if results.get('regressions') else 0)
@@ -0,0 +1,9 @@
+import pytest
+
+from calculator import Calculator
+
+
+@pytest.mark.parametrize('expression', ['__builtins__', '__builtins__ + 1', '__import__'])
+def test_dunder_names_are_rejected(expression):
+    with pytest.raises(ValueError, match="Invalid or unsafe expression"):
+        Calculator().evaluate(expression)
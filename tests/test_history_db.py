@@ -0,0 +1,25 @@
+import json
+
+from history_db import HistoryDB
+
+
+def test_replaying_spilled_rows_is_idempotent(tmp_path):
+    db = HistoryDB(str(tmp_path / 'history.db'))
+    db.create_session('s1')
+    existing = db.add_calculation('1+1', 2, session_id='s1')
+    ts = '2026-10-16 10:00:00'
+    rows = [(existing, '1+1', '2', None, 's1', 'ua', '1.2.3.4', 0.1, ts),
+            (existing + 10, '2+2', '4', None, 's1', 'ua', '1.2.3.4', 0.1, ts),
+            (existing + 11, None, '4', None, 's1', 'ua', '1.2.3.4', 0.1, ts),
+            (existing + 12, '3+3', '6', None, 's1', None, None, None, ts)]
+    with open(db.spill_path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+
+    db._replay_spilled()
+
+    ids = [row[0] for row in db.connection.execute('SELECT id FROM calculations ORDER BY id')]
+    assert ids == [existing, existing + 10, existing + 12]
+    assert db.get_session_stats('s1')['calculation_count'] == 3
+    with open(db.rejected_path, encoding='utf-8') as f:
+        assert [json.loads(line)[0] for line in f] == [existing + 11]
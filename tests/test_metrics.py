@@ -0,0 +1,21 @@
+import json
+
+import metrics
+
+
+def test_shared_registry_sums_workers_and_drops_dead_gauges(tmp_path):
+    registry = metrics.MetricsRegistry()
+    requests = registry.register(metrics.Counter('requests_total', 'Requests', ('route',)))
+    registry.register(metrics.CallbackMetric('queue_depth', 'Queued', 'gauge', lambda: {('tts',): 1}, ('queue',)))
+    registry.share(str(tmp_path), flush_interval=3600)
+    requests.inc(2, route='/a')
+    
+    # Files as left by another live worker and by one that has exited
+    other = {'requests_total': {'kind': 'counter', 'values': [[['/a'], 3]]},
+             'queue_depth': {'kind': 'gauge', 'values': [[['tts'], 4]]}}
+    (tmp_path / '101.json').write_text(json.dumps(other))
+    (tmp_path / '102.dead.json').write_text(json.dumps(other))
+    
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/a"} 8' in lines
+    assert 'queue_depth{queue="tts"} 5' in lines
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from stt_backends import CLOSED, OPEN, PCMAudio, RecognizerBackend
+from stt_engine import STTEngine
+
+
+class BlockingBackend(RecognizerBackend):
+    """Answers 'two', after release is set"""
+    
+    name = 'blocking'
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+        self.release.set()
+    
+    def recognize(self, audio, language):
+        self.release.wait()
+        return 'two'
+
+
+def make_engine(backend):
+    engine = STTEngine(backends='', concurrency=1)
+    engine.register_backend(backend)
+    return engine
+
+
+def silence():
+    return PCMAudio(b'\0\0' * 1600, 16000, 2)
+
+
+def test_busy_half_open_trial_does_not_disable_backend():
+    backend = BlockingBackend(timeout=0.2, reset_timeout=30.0)
+    engine = make_engine(backend)
+    
+    # Cool-down over: the next call is the half-open trial
+    backend.breaker.state = OPEN
+    backend.breaker.opened_at = time.monotonic() - backend.breaker.reset_timeout
+    
+    # Occupy the backend's only thread so the trial never starts
+    backend.release.clear()
+    engine._executors[backend].submit(backend.recognize, silence(), 'en-US')
+    try:
+        assert engine._recognize_speech(silence(), 'en-US') is None
+        assert backend.breaker.state == OPEN
+    finally:
+        backend.release.set()
+    
+    assert engine._recognize_speech(silence(), 'en-US') == 'two'
+    assert backend.breaker.state == CLOSED
+
+
+def test_busy_call_does_not_count_as_failure():
+    backend = BlockingBackend(timeout=0.2, failure_threshold=1)
+    engine = make_engine(backend)
+    
+    backend.release.clear()
+    engine._executors[backend].submit(backend.recognize, silence(), 'en-US')
+    try:
+        assert engine._recognize_speech(silence(), 'en-US') is None
+        assert backend.breaker.state == CLOSED
+    finally:
+        backend.release.set()
@@ -0,0 +1,62 @@
+import os
+
+from tts_jobs import TTSJobQueue, DONE, FAILED, PENDING
+
+
+class FileEngine:
+    """Writes a placeholder audio file per phrase, failing for the phrases in fail"""
+    
+    audio_extension = 'wav'
+    
+    def __init__(self, output_dir, fail=()):
+        self.output_dir = output_dir
+        self.fail = fail
+    
+    def cache_filename(self, text):
+        return f"tts_{text}.wav"
+    
+    def get_cached_speech(self, text):
+        return None
+    
+    def can_concatenate(self, text):
+        return False
+    
+    def initialize_engine(self):
+        pass
+    
+    def prepare_segments(self):
+        pass
+    
+    def generate_speech(self, text):
+        if text in self.fail:
+            return None
+        filename = self.cache_filename(text)
+        with open(os.path.join(self.output_dir, filename), 'w') as f:
+            f.write('audio')
+        return filename
+
+
+def test_jobs_are_visible_to_other_processes(tmp_path):
+    # Two queues over one output directory stand in for two server workers
+    queue = TTSJobQueue(FileEngine(str(tmp_path), fail=('bad',)))
+    other = TTSJobQueue(FileEngine(str(tmp_path)))
+    
+    good, bad = queue.submit('good'), queue.submit('bad')
+    assert good.wait(5) and bad.wait(5)
+    
+    assert other.get(good.id).to_dict()['audio_url'] == f'/api/audio/{good.filename}'
+    assert other.get(bad.id).status == FAILED
+    assert other.get('tts_unknown') is None
+
+
+def test_finished_jobs_are_forgotten_past_pending_ones(tmp_path):
+    queue = TTSJobQueue(FileEngine(str(tmp_path)), max_retained=3)
+    
+    class Job:
+        def __init__(self, job_id, status):
+            self.id, self.status = job_id, status
+    
+    for job_id, status in enumerate([PENDING, DONE, PENDING, DONE, DONE]):
+        queue._remember(Job(job_id, status))
+    
+    assert list(queue._jobs) == [0, 2, 4]
@@ -0,0 +1,23 @@
+import math
+
+from calculator import Calculator
+from voice_parser import VoiceTranslator
+
+translate = VoiceTranslator().translate
+
+
+def test_x_is_a_variable_unless_between_numbers():
+    assert translate("x squared") == 'x**2'
+    assert translate("x times two") == 'x*2'
+    assert translate("five x three") == '5*3'
+    assert translate("12 x 4") == '12*4'
+
+
+def test_function_of_opens_a_call():
+    assert translate("sin of 30") == 'sin(30'
+    assert translate("log of one hundred") == 'log(100'
+    assert translate("half of ten") == '0.5*10'
+
+
+def test_function_of_evaluates():
+    assert math.isclose(Calculator().evaluate(translate("sin of 30")), math.sin(30))